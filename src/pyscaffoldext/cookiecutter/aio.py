@@ -0,0 +1,156 @@
+"""Generate projects from :mod:`asyncio` code without blocking the event loop.
+
+:obj:`pyscaffold.api.create_project` (and therefore the cookiecutter extension) is
+blocking: fetching a remote template and writing files can take seconds. The
+:obj:`AsyncScaffolder` runs the generation in a pool of threads, limiting the number
+of projects generated concurrently::
+
+    from pyscaffoldext.cookiecutter.aio import AsyncScaffolder
+
+    scaffolder = AsyncScaffolder(max_concurrency=4)
+
+    async def handle(request):
+        params = await request.json()
+        path = await scaffolder.create_project(
+            project_path=f"/srv/projects/{params['name']}",
+            cookiecutter="gh:org/service-template",
+            cookiecutter_params=params,
+        )
+        ...
+
+Cancelling the task that awaits :obj:`AsyncScaffolder.create_project` stops the
+generation as soon as possible and removes the partially generated project. While
+the template is fetched or rendered this happens immediately; PyScaffold's own steps
+(e.g. writing ``setup.cfg`` or initialising the git repository) cannot be
+interrupted, so a cancellation arriving during them takes effect once they finish.
+
+Note:
+    PyScaffold changes the working directory while setting up the project (e.g. to
+    initialise the git repository), so only the cookiecutter part (fetching and
+    rendering the template) actually runs in parallel with other projects.
+    Relative paths are resolved against the working directory at the time
+    :obj:`AsyncScaffolder.create_project` is called.
+"""
+import asyncio
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+from threading import Event, Lock
+from typing import Optional
+
+from pyscaffold import api
+from pyscaffold.actions import ScaffoldOpts
+
+from .extension import Cookiecutter
+
+_PIPELINE_LOCK = Lock()
+"""Serialises the parts of PyScaffold's pipeline that depend on the working dir"""
+
+
+class AsyncScaffolder:
+    """Awaitable wrapper around :obj:`pyscaffold.api.create_project`.
+
+    Args:
+        max_concurrency: maximum number of projects generated at the same time.
+            Additional calls wait (asynchronously) for their turn.
+    """
+
+    def __init__(self, max_concurrency: int = 4):
+        self.max_concurrency = max_concurrency
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "AsyncScaffolder":
+        return self
+
+    async def __aexit__(self, *_exc):
+        self.shutdown()
+
+    def shutdown(self, wait: bool = True):
+        """Release the threads used for generating projects."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                self.max_concurrency, thread_name_prefix="pyscaffoldext-cookiecutter"
+            )
+        return self._executor
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def create_project(
+        self, opts: Optional[ScaffoldOpts] = None, **kwargs
+    ) -> Path:
+        """Same as :obj:`pyscaffold.api.create_project`, but without blocking the
+        event loop. The :obj:`~.extension.Cookiecutter` extension is added
+        automatically.
+
+        Returns:
+            Path to the generated project
+        """
+        opts = {**(opts or {}), **kwargs}
+        path = Path(opts.get("project_path") or ".").resolve()
+        opts["project_path"] = path
+        template = opts.get("cookiecutter")
+        if isinstance(template, (str, Path)) and os.path.isdir(template):
+            opts["cookiecutter"] = os.path.abspath(template)
+        extensions = list(opts.get("extensions") or [])
+        if not any(isinstance(e, Cookiecutter) for e in extensions):
+            extensions.append(Cookiecutter())
+        opts["extensions"] = extensions
+
+        cancel = opts["cookiecutter_cancel"] = Event()
+        opts["cookiecutter_unlocked"] = _unlocked
+
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self.executor, partial(_create, opts, path, cancel)
+            )
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                cancel.set()
+                # Wait for the thread to stop, so the partial project is removed
+                await asyncio.wait([future])
+                raise
+
+        return path
+
+
+def _create(opts: ScaffoldOpts, path: Path, cancel: Event):
+    from .template import GenerationCancelled, check_cancelled
+
+    existed = path.exists()
+    try:
+        with _PIPELINE_LOCK:
+            api.create_project(opts)
+        # Cancelled while PyScaffold was writing its files
+        check_cancelled(cancel)
+    except GenerationCancelled:
+        if not existed:
+            shutil.rmtree(str(path), ignore_errors=True)
+        raise
+
+
+@contextmanager
+def _unlocked():
+    """Allow other projects to progress while the template is fetched/rendered
+    (this does not depend on the working directory).
+    """
+    _PIPELINE_LOCK.release()
+    try:
+        yield
+    finally:
+        _PIPELINE_LOCK.acquire()
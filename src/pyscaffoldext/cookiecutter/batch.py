@@ -0,0 +1,257 @@
+"""Generate many projects from the same cookiecutter template in a single process.
+
+The template is fetched, parsed and its Jinja environment is set up only once
+(see :obj:`~.template.Template`), and then each project is generated with
+:obj:`pyscaffold.api.create_project`. Results are streamed back as soon as each
+project is done, so failures in one project do not prevent the others from being
+generated. Projects can also be generated in parallel by multiple processes (see the
+``workers`` argument)::
+
+    from pyscaffoldext.cookiecutter.batch import create_projects
+
+    projects = [
+        {"project_path": "service-a", "cookiecutter_params": {"port": "8080"}},
+        {"project_path": "service-b", "cookiecutter_params": {"port": "8081"}},
+    ]
+    for result in create_projects("gh:org/service-template", projects, workers=4):
+        print(result.project_path, "ok" if result.ok else result.error)
+
+Identical files can be shared by all the projects via a content-addressed store
+(``cookiecutter_dedup="path/to/store"``, see :mod:`~.dedup`), the combined savings
+are logged once all the projects are generated.
+"""
+import os
+import pickle
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from pathlib import Path
+from time import perf_counter
+from typing import (
+    Deque,
+    Iterable,
+    Iterator,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from pyscaffold.actions import ScaffoldOpts
+from pyscaffold.api import NO_CONFIG, create_project
+from pyscaffold.log import logger
+
+from .dedup import DedupReport
+from .extension import Cookiecutter, NotInstalled
+from .plan import Plan
+from .template import Template, process_pool
+
+_DONE = object()
+
+
+class BatchResult(NamedTuple):
+    """Outcome of the generation of a single project in a batch"""
+
+    project_path: Path
+    opts: ScaffoldOpts
+    """Options given for the project (merged with the shared options)"""
+    duration: float
+    """Time spent generating the project (in seconds)"""
+    error: Optional[Exception] = None
+    plan: Optional[Plan] = None
+    """Files that would be produced, when running with ``pretend=True``
+    (see :mod:`~.plan`)"""
+    dedup: Optional[DedupReport] = None
+    """Files shared with other projects, when running with ``cookiecutter_dedup``
+    (see :mod:`~.dedup`)"""
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def create_projects(
+    template: Union[str, Template],
+    projects: Iterable[ScaffoldOpts],
+    workers: Optional[int] = 1,
+    **kwargs,
+) -> Iterator[BatchResult]:
+    """Generate one project for each element in ``projects`` using the same template.
+
+    Args:
+        template: path/URL of the cookiecutter template (as in ``--cookiecutter``) or
+            a :obj:`~.template.Template` that was previously fetched.
+        projects: options for each individual project (as in
+            :obj:`pyscaffold.api.create_project`), e.g. ``project_path`` and
+            ``cookiecutter_params``.
+        workers: number of processes used to generate projects in parallel.
+            ``None`` or ``0`` means one process per CPU (see
+            :obj:`~concurrent.futures.ProcessPoolExecutor`), ``1`` (default) means
+            projects are generated sequentially in the current process.
+        **kwargs: options shared by all the projects (individual options take
+            precedence).
+
+    Returns:
+        Iterator with the results of each project, in the same order as ``projects``
+
+    Raises:
+        :obj:`~.extension.NotInstalled`: when cookiecutter is not installed, before
+            any project is generated (as the errors fetching the template).
+        :obj:`TypeError`: when an element of ``projects`` is not a dict of options
+            (when the iterator reaches it).
+
+    Note:
+        Parallel generation uses processes instead of threads, because PyScaffold
+        changes the working directory while setting up the project (e.g. to
+        initialise the git repository). Relative project paths are resolved against
+        the current working directory of the calling process. Only a few projects
+        per worker are submitted at a time, so ``projects`` can be a (lazy) iterator
+        with any number of elements.
+    """
+    try:
+        import cookiecutter  # noqa: F401
+    except Exception as e:
+        raise NotInstalled from e
+
+    if not isinstance(template, Template):
+        template = Template.from_opts({**kwargs, "cookiecutter": template})
+
+    return _create_projects(template, projects, workers, kwargs)
+
+
+def _create_projects(
+    template: Template,
+    projects: Iterable[ScaffoldOpts],
+    workers: Optional[int],
+    shared: dict,
+) -> Iterator[BatchResult]:
+    reports = []
+    if workers == 1:
+        for project in projects:
+            result = _create(template, _check_project(project), shared)
+            reports.append(result.dedup)
+            yield result
+    else:
+        for result in _create_in_pool(template, projects, workers, shared):
+            reports.append(result.dedup)
+            yield result
+
+    if shared.get("cookiecutter_dedup"):
+        _report_dedup(DedupReport.total(reports))
+
+
+def _create_in_pool(
+    template: Template,
+    projects: Iterable[ScaffoldOpts],
+    workers: Optional[int],
+    shared: dict,
+) -> Iterator[BatchResult]:
+    """Submit ``projects`` to a pool of processes, keeping at most
+    :obj:`TASKS_PER_WORKER` tasks per worker in flight
+    """
+    workers = workers or os.cpu_count() or 1
+    window = workers * TASKS_PER_WORKER
+    todo = iter(projects)
+    pending: Deque[Tuple[ScaffoldOpts, Future]] = deque()
+    init = (template, _portable(shared))
+    with process_pool(workers, _init, init) as pool:
+        try:
+            while True:
+                while len(pending) < window:
+                    project = next(todo, _DONE)
+                    if project is _DONE:
+                        break
+                    task = _portable(_check_project(project))
+                    future = pool.submit(_create_in_worker, task)
+                    pending.append((project, future))
+                if not pending:
+                    return
+                wait([f for _, f in pending], return_when=FIRST_COMPLETED)
+                # Results are given in the same order as the projects
+                while pending and pending[0][1].done():
+                    project, future = pending.popleft()
+                    yield future.result()._replace(opts={**shared, **project})
+        finally:
+            for _, future in pending:  # e.g. the caller stops iterating
+                future.cancel()
+
+
+def _check_project(project) -> ScaffoldOpts:
+    if not isinstance(project, Mapping):
+        msg = f"The options of each project should be a dict, not {project!r}"
+        raise TypeError(msg)
+    return project
+
+
+def _create(template: Template, project: ScaffoldOpts, shared: dict) -> BatchResult:
+    given = {**shared, **project}
+    opts = given.copy()
+    opts["cookiecutter"] = template.source
+    opts["cookiecutter_template"] = template
+    extensions = list(opts.get("extensions") or [])
+    if not any(isinstance(e, Cookiecutter) for e in extensions):
+        extensions.append(Cookiecutter())
+    opts["extensions"] = extensions
+
+    path = Path(opts.get("project_path", "."))
+    start = perf_counter()
+    try:
+        _, opts = create_project(opts)
+    except Exception as ex:
+        logger.error(f"{path}: {ex!r}")
+        return BatchResult(path, given, perf_counter() - start, ex)
+
+    plan, dedup = opts.get("cookiecutter_plan"), opts.get("cookiecutter_dedup_report")
+    return BatchResult(path, given, perf_counter() - start, plan=plan, dedup=dedup)
+
+
+def _report_dedup(report: DedupReport):
+    from .plan import format_size
+
+    logger.report(
+        "dedup",
+        f"{report.files} files ({format_size(report.size)}), "
+        f"{format_size(report.saved)} saved (ratio {report.ratio:.1f}x)",
+    )
+
+
+# ---- Worker processes ----
+
+TASKS_PER_WORKER = 2
+"""Number of projects submitted to each worker process ahead of time"""
+
+_NO_CONFIG = "<NO_CONFIG>"
+
+_WORKER: dict = {}
+"""State of each worker process (the template is prepared once per process)"""
+
+
+def _init(template: Template, shared: dict):
+    _WORKER.update(template=template, shared=_restore(shared))
+
+
+def _create_in_worker(project: ScaffoldOpts) -> BatchResult:
+    # Results have to be sent back to the main process (i.e. pickled),
+    # but the options are already known there
+    result = _create(_WORKER["template"], _restore(project), _WORKER["shared"])
+    result = result._replace(opts={})
+    try:
+        pickle.dumps(result.error)
+    except Exception:
+        error = RuntimeError(repr(result.error))
+        return result._replace(error=error)
+    return result
+
+
+def _portable(opts: ScaffoldOpts) -> ScaffoldOpts:
+    """Options that can be sent to the workers (``NO_CONFIG`` cannot be pickled)"""
+    if opts.get("config_files") is NO_CONFIG:
+        return {**opts, "config_files": _NO_CONFIG}
+    return opts
+
+
+def _restore(opts: ScaffoldOpts) -> ScaffoldOpts:
+    """Counterpart of :obj:`_portable`"""
+    if opts.get("config_files") == _NO_CONFIG:
+        return {**opts, "config_files": NO_CONFIG}
+    return opts
@@ -0,0 +1,281 @@
+"""Portable bundles of templates, for machines without network access.
+
+A bundle is a single zip archive (deflate compressed) containing the files of a
+template (without the ``.git`` folder) and a ``bundle.json`` manifest stored
+uncompressed as its first member. The manifest records where the template came from
+(URL, ref and resolved commit) and the size, permissions and SHA-256 of each file.
+Bundles are reproducible: exporting the same commit twice produces the same bytes.
+
+Bundles are read via :mod:`mmap`, so reading the manifest (or a single member) does
+not load the archive in memory. They can be used wherever a template is expected
+(e.g. ``putup --cookiecutter template.ccbundle``): they are extracted into the
+template cache once (see :obj:`~.cache.TemplateCache`), and later runs reuse the
+extracted copy (and its snapshot).
+
+Bundles can also be gathered in a mirror directory, configured with the
+``--cookiecutter-mirror`` option (``cookiecutter_mirror`` in the Python API) or the
+``PYSCAFFOLDEXT_COOKIECUTTER_MIRROR`` environment variable. Remote templates (e.g.
+``gh:org/template``) are then taken from the mirror instead of the network, as long as
+a bundle exported with the same URL and ref exists there::
+
+    from pyscaffoldext.cookiecutter.bundle import export_bundle
+
+    export_bundle("gh:org/template", "/srv/mirror")  # with network access
+    # ... later, in the build farm:
+    # PYSCAFFOLDEXT_COOKIECUTTER_MIRROR=/srv/mirror putup proj --cookiecutter gh:...
+"""
+import hashlib
+import io
+import json
+import mmap
+import os
+import stat
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
+from typing import Iterator, List, Optional, Tuple, Union
+
+PathLike = Union[str, os.PathLike]
+
+FORMAT_VERSION = 1
+MANIFEST = "bundle.json"
+SUFFIX = ".ccbundle"
+MIRROR_ENV = "PYSCAFFOLDEXT_COOKIECUTTER_MIRROR"
+
+_DATE_TIME = (1980, 1, 1, 0, 0, 0)  # fixed timestamps keep bundles reproducible
+
+
+class InvalidBundle(ValueError):
+    """The file is not a template bundle, or it is corrupted."""
+
+    DEFAULT_MESSAGE = "invalid template bundle"
+
+    def __init__(self, message=DEFAULT_MESSAGE, *args, **kwargs):
+        super().__init__(message, *args, **kwargs)
+
+
+def bundle_filename(url: str, checkout: Optional[str] = None) -> str:
+    """Name of the bundle for a template (URL + ref) inside a mirror directory"""
+    from .cache import cache_key
+
+    return cache_key(url, checkout) + SUFFIX
+
+
+def find_in_mirror(
+    mirror: PathLike, url: str, checkout: Optional[str] = None
+) -> Optional[Path]:
+    """Bundle for the given template in the ``mirror`` directory, if any"""
+    path = Path(mirror) / bundle_filename(url, checkout)
+    return path if path.is_file() else None
+
+
+def export_bundle(
+    source: str,
+    dest: PathLike,
+    checkout: Optional[str] = None,
+    cache=None,
+) -> Path:
+    """Fetch the template ``source`` (see :obj:`~.template.Template.fetch`) and store
+    it as a bundle.
+
+    Args:
+        source: template (local path, URL or abbreviation).
+        dest: bundle file to be created or, if it is a directory, the mirror where the
+            bundle should be stored (named after ``source`` and ``checkout``).
+        checkout: ref of the template (branch, tag or commit).
+        cache: :obj:`~.cache.TemplateCache` used for fetching the template.
+
+    Returns:
+        Path of the bundle.
+    """
+    from pyscaffold.log import logger
+
+    from .cache import TemplateCache, expand_template, git_head
+
+    url = expand_template(source)
+    # Relative paths (e.g. ``"."``) have no name to be used for the root folder
+    local = Path((cache or TemplateCache()).fetch(source, checkout)).resolve()
+    if not local.name:
+        raise ValueError(f"Cannot bundle a template in the root folder: {local}")
+    dest = Path(dest)
+    if dest.is_dir():
+        dest = dest / bundle_filename(url, checkout)
+    dirs, files = _template_tree(local)
+    manifest = {
+        "format": FORMAT_VERSION,
+        "source": url,
+        "checkout": checkout,
+        "commit": git_head(local),
+        "dirname": local.name,
+        "dirs": dirs,
+        "files": {
+            relpath: {
+                "size": os.path.getsize(str(local / relpath)),
+                "mode": stat.S_IMODE(os.stat(str(local / relpath)).st_mode),
+                "sha256": _digest(local / relpath),
+            }
+            for relpath in files
+        },
+    }
+
+    logger.report("bundle", f"{url} -> {dest}")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    staging = dest.with_name(f".tmp-{os.getpid()}-{dest.name}")
+    try:
+        with zipfile.ZipFile(str(staging), "w") as archive:
+            info = zipfile.ZipInfo(MANIFEST, _DATE_TIME)
+            data = json.dumps(manifest, indent=2, sort_keys=True)
+            archive.writestr(info, data, zipfile.ZIP_STORED)
+            for relpath in files:
+                info = zipfile.ZipInfo(f"{local.name}/{relpath}", _DATE_TIME)
+                info.external_attr = manifest["files"][relpath]["mode"] << 16
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(str(local / relpath), "rb") as src, archive.open(
+                    info, "w"
+                ) as dst:
+                    _copy(src, dst)
+        os.replace(str(staging), str(dest))
+    finally:
+        if staging.exists():
+            staging.unlink()
+    return dest
+
+
+@contextmanager
+def open_bundle(path: PathLike) -> Iterator[zipfile.ZipFile]:
+    """Open the bundle ``path`` (memory-mapped)"""
+    with open(str(path), "rb") as file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as ex:  # empty file
+            raise InvalidBundle(f"invalid template bundle: {path}") from ex
+        with mapped:
+            try:
+                archive = zipfile.ZipFile(_MappedFile(mapped))
+            except zipfile.BadZipFile as ex:
+                raise InvalidBundle(f"invalid template bundle: {path}") from ex
+            with archive:
+                yield archive
+
+
+class _MappedFile(io.RawIOBase):
+    """Read-only file object backed by a memory map (``mmap`` objects only implement
+    part of the file interface in older versions of Python).
+    """
+
+    def __init__(self, mapped: mmap.mmap):
+        super().__init__()
+        self._mapped = mapped
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        self._mapped.seek(pos, whence)
+        return self._mapped.tell()
+
+    def tell(self) -> int:
+        return self._mapped.tell()
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        return self._mapped.read(None if size is None or size < 0 else size)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def read_manifest(archive: zipfile.ZipFile) -> dict:
+    try:
+        manifest = json.loads(archive.read(MANIFEST).decode("utf-8"))
+    except (KeyError, ValueError) as ex:
+        raise InvalidBundle(f"missing or invalid `{MANIFEST}`") from ex
+    if manifest.get("format") != FORMAT_VERSION:
+        raise InvalidBundle(f"unsupported bundle format: {manifest.get('format')}")
+    return manifest
+
+
+def is_bundle(path: PathLike) -> bool:
+    """``path`` is a zip archive with a bundle manifest"""
+    path = Path(path)
+    if not path.is_file() or not zipfile.is_zipfile(str(path)):
+        return False
+    try:
+        with open_bundle(path) as archive:
+            return MANIFEST in archive.namelist()
+    except InvalidBundle:
+        return False
+
+
+def digest(path: PathLike) -> str:
+    """Identifier of the contents of a bundle (hash of its manifest)"""
+    with open_bundle(path) as archive:
+        return hashlib.sha256(archive.read(MANIFEST)).hexdigest()
+
+
+def extract(path: PathLike, dest: Path) -> dict:
+    """Extract the bundle ``path`` into the directory ``dest``, checking the contents
+    against the manifest.
+
+    Returns:
+        The manifest, the template is extracted into ``dest / manifest["dirname"]``.
+    """
+    with open_bundle(path) as archive:
+        manifest = read_manifest(archive)
+        root = dest / _safe_relpath(manifest["dirname"])
+        for relpath in manifest.get("dirs", []):
+            (root / _safe_relpath(relpath)).mkdir(parents=True, exist_ok=True)
+        for relpath, info in manifest["files"].items():
+            target = root / _safe_relpath(relpath)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                member = archive.open(f"{manifest['dirname']}/{relpath}")
+            except KeyError as ex:
+                raise InvalidBundle(f"missing file in bundle: {relpath}") from ex
+            with member as src, open(str(target), "wb") as dst:
+                sha256 = _copy(src, dst)
+            if sha256 != info["sha256"]:
+                raise InvalidBundle(f"corrupted file in bundle: {relpath}")
+            os.chmod(str(target), info["mode"])
+    return manifest
+
+
+def _template_tree(root: Path) -> Tuple[List[str], List[str]]:
+    """Directories and files of the template (relative POSIX paths, sorted)"""
+    dirs, files = [], []
+    for dirpath, dirnames, filenames in os.walk(str(root)):
+        dirnames[:] = [d for d in dirnames if d != ".git"]
+        relative = Path(dirpath).relative_to(root)
+        dirs.extend((relative / d).as_posix() for d in dirnames)
+        files.extend((relative / f).as_posix() for f in filenames)
+    return sorted(dirs), sorted(files)
+
+
+def _safe_relpath(relpath: str) -> str:
+    path = PurePosixPath(relpath)
+    if path.is_absolute() or ".." in path.parts or not path.parts:
+        raise InvalidBundle(f"invalid path in bundle: {relpath}")
+    return str(path)
+
+
+def _digest(path: Path) -> str:
+    with open(str(path), "rb") as file:
+        return _copy(file, None)
+
+
+def _copy(src, dst) -> str:
+    """Copy the file-like object ``src`` into ``dst`` (if given) in chunks,
+    returning the SHA-256 of the contents.
+    """
+    from .stream import CHUNK_SIZE
+
+    sha256 = hashlib.sha256()
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+        sha256.update(chunk)
+        if dst is not None:
+            dst.write(chunk)
+    return sha256.hexdigest()
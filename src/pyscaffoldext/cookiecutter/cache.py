@@ -0,0 +1,624 @@
+"""Managed local cache for cookiecutter templates.
+
+Remote templates (git repositories and zip archives) are fetched once into a cache
+directory and later runs render straight from the local copy, without touching git or
+the network. Entries of git repositories are keyed by the (expanded) template URL and
+the commit the requested ref (or the default branch) points to, which is resolved with
+``git ls-remote`` every time the template is fetched: branches that moved are fetched
+again, while a ref that still points to the same commit is taken from the cache. When
+the repository cannot be reached (e.g. offline), the most recent entry for the ref is
+used instead. Other templates (e.g. zip archives) are keyed by their URL and fetched
+again once they are older than ``max_age`` seconds. Each entry records the URL, ref
+and commit in a small ``entry.json`` file.
+
+Entries that were not used for ``max_age`` seconds are evicted, as are the least
+recently used entries once the cache grows beyond ``max_size`` bytes.
+
+Fetching is thread-safe: concurrent requests for the same template wait for a single
+download. Entries are never replaced while they might be in use (e.g. by another
+process), unless the template is explicitly refreshed.
+
+When used via PyScaffold's Python API, the cache can be configured with the
+``cookiecutter_cache_dir``, ``cookiecutter_cache_max_age`` and
+``cookiecutter_cache_max_size`` options. The ``cookiecutter_refresh`` option
+(``--cookiecutter-refresh`` in the CLI) forces the template to be fetched again.
+
+Template bundles (see :mod:`~.bundle`) are extracted into the cache once, and remote
+templates are taken from a mirror of bundles when one is configured
+(``cookiecutter_mirror``).
+
+Git repositories are fetched with a single commit (the requested ref, or the default
+branch), without their history. When the template lives in a ``directory`` of the
+repository (e.g. a monorepo with many templates), only that directory is checked out
+(sparse checkout) and, if the server supports partial clones, downloaded. Therefore,
+the time and disk space necessary to fetch a template depend on the size of the
+template, not on the size of the repository. The ``cookiecutter_shallow`` option can be
+set to ``False`` to fetch the whole history instead.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
+from tempfile import mkdtemp
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Union
+
+from pyscaffold.actions import ScaffoldOpts
+from pyscaffold.log import logger
+
+from .bundle import MIRROR_ENV
+
+PathLike = Union[str, os.PathLike]
+
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+"""Time (in seconds) after which unused templates are evicted (1 week)"""
+
+DEFAULT_MAX_SIZE = 2 * 1024**3
+"""Size (in bytes) after which the least recently used templates are evicted (2 GiB)"""
+
+CACHE_DIRNAME = ".pyscaffoldext-cache"
+ENTRY_FILE = "entry.json"
+SNAPSHOT_DIRNAME = "snapshot"
+SNAPSHOTS_DIRNAME = "snapshots"
+STAGING_PREFIX = ".tmp-"
+LOCK_PREFIX = ".lock-"
+
+_COMMIT = re.compile(r"^[0-9a-f]{40}$", re.I)
+
+_LOCKS: Dict[str, Lock] = {}
+_LOCKS_GUARD = Lock()
+
+
+def cache_key(
+    url: str, checkout: Optional[str] = None, directory: Optional[str] = None
+) -> str:
+    """Identifier of a template (URL + commit or ref + template directory) inside the
+    cache
+    """
+    parts = [url, checkout or ""]
+    if directory:  # entries with sparse checkouts are kept separately
+        parts.append(directory)
+    ident = json.dumps(parts)
+    return hashlib.sha256(ident.encode("utf-8")).hexdigest()[:32]
+
+
+def clean_directory(directory: Optional[str]) -> Optional[str]:
+    """Normalise the path of a template inside its repository (relative, POSIX)"""
+    if not directory:
+        return None
+    path = PurePosixPath(str(directory).replace(os.sep, "/"))
+    if path.is_absolute() or ".." in path.parts:
+        msg = (
+            f"The template directory should be relative to the repository: {directory}"
+        )
+        raise ValueError(msg)
+    return None if str(path) == "." else str(path)
+
+
+def default_cache_dir() -> Path:
+    """Cache directory placed inside cookiecutter's own ``cookiecutters_dir``"""
+    from cookiecutter.config import get_user_config
+
+    config = get_user_config()
+    return Path(config["cookiecutters_dir"]).expanduser() / CACHE_DIRNAME
+
+
+def expand_template(template: str) -> str:
+    """Expand abbreviations (e.g. ``gh:``) configured for cookiecutter"""
+    from cookiecutter.config import get_user_config
+    from cookiecutter.repository import expand_abbreviations
+
+    return expand_abbreviations(template, get_user_config()["abbreviations"])
+
+
+def is_remote(url: str) -> bool:
+    """Remote templates are the only ones stored in the cache,
+    local directories are already "cached" by definition.
+    """
+    from cookiecutter.repository import is_repo_url
+
+    return is_repo_url(url)
+
+
+class CacheEntry:
+    """Template stored in the cache.
+
+    The entry directory contains the ``entry.json`` metadata file and the template
+    itself (using the same directory name cookiecutter would use, so replay files
+    keep working). The modification time of the metadata file records the last
+    time the entry was used.
+    """
+
+    def __init__(self, path: Path, meta: dict):
+        self.path = path
+        self.meta = meta
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["CacheEntry"]:
+        try:
+            meta = json.loads((path / ENTRY_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return cls(path, meta)
+
+    @property
+    def key(self) -> str:
+        return self.path.name
+
+    @property
+    def url(self) -> str:
+        return self.meta["url"]
+
+    @property
+    def checkout(self) -> Optional[str]:
+        return self.meta.get("checkout")
+
+    @property
+    def directory(self) -> Optional[str]:
+        """Directory of the template inside the repository (sparse checkouts)"""
+        return self.meta.get("directory")
+
+    @property
+    def commit(self) -> Optional[str]:
+        """Commit resolved when the template was fetched (``None`` for zip files)"""
+        return self.meta.get("commit")
+
+    @property
+    def created(self) -> float:
+        return self.meta["created"]
+
+    @property
+    def size(self) -> int:
+        return self.meta["size"]
+
+    @property
+    def template(self) -> Path:
+        """Local directory that can be given to cookiecutter"""
+        return self.path / self.meta["dirname"]
+
+    @property
+    def last_used(self) -> float:
+        try:
+            return (self.path / ENTRY_FILE).stat().st_mtime
+        except OSError:
+            return self.created
+
+    def is_stale(self, max_age: float, now: Optional[float] = None) -> bool:
+        return ((now or time.time()) - self.created) > max_age
+
+    def is_unused(self, max_age: float, now: Optional[float] = None) -> bool:
+        return ((now or time.time()) - self.last_used) > max_age
+
+    def touch(self):
+        """Mark the entry as recently used"""
+        try:
+            os.utime(self.path / ENTRY_FILE)
+        except OSError:  # pragma: no cover
+            pass  # Removed in the meantime by a concurrent eviction
+
+
+class TemplateCache:
+    """Local cache for remote cookiecutter templates.
+
+    Args:
+        root: directory where templates are stored, by default a folder inside
+            cookiecutter's ``cookiecutters_dir``.
+        max_age: age in seconds after which entries are fetched again.
+        max_size: size in bytes after which least recently used entries are evicted.
+        mirror: directory with template bundles used instead of the network
+            (see :mod:`~.bundle`).
+        shallow: fetch only the requested commit of git repositories (without
+            their history).
+    """
+
+    def __init__(
+        self,
+        root: Optional[PathLike] = None,
+        max_age: float = DEFAULT_MAX_AGE,
+        max_size: int = DEFAULT_MAX_SIZE,
+        mirror: Optional[PathLike] = None,
+        shallow: bool = True,
+    ):
+        self.root = Path(root) if root else default_cache_dir()
+        self.max_age = max_age
+        self.max_size = max_size
+        self.mirror = Path(mirror) if mirror else None
+        self.shallow = shallow
+
+    @classmethod
+    def from_opts(cls, opts: ScaffoldOpts) -> "TemplateCache":
+        return cls(
+            opts.get("cookiecutter_cache_dir"),
+            opts.get("cookiecutter_cache_max_age") or DEFAULT_MAX_AGE,
+            opts.get("cookiecutter_cache_max_size") or DEFAULT_MAX_SIZE,
+            opts.get("cookiecutter_mirror") or os.environ.get(MIRROR_ENV),
+            opts.get("cookiecutter_shallow", True),
+        )
+
+    def entries(self) -> Iterator[CacheEntry]:
+        if not self.root.is_dir():
+            return
+        for path in self.root.iterdir():
+            if path.name.startswith(STAGING_PREFIX):
+                continue
+            entry = CacheEntry.load(path)
+            if entry:
+                yield entry
+
+    def get(
+        self, url: str, checkout: Optional[str] = None, directory: Optional[str] = None
+    ) -> Optional[CacheEntry]:
+        """Most recent entry fetched for the template (URL + ref + directory)"""
+        matches = [
+            entry
+            for entry in self.entries()
+            if (entry.url, entry.checkout, entry.directory)
+            == (url, checkout, directory)
+        ]
+        return max(matches, key=lambda e: e.created, default=None)
+
+    def fetch(
+        self,
+        template: str,
+        checkout: Optional[str] = None,
+        refresh: bool = False,
+        directory: Optional[str] = None,
+    ) -> str:
+        """Make sure a remote template is available in the cache.
+
+        Args:
+            directory: directory of the repository containing the template
+                (``cookiecutter.json``), when given only this directory is checked out.
+
+        Returns:
+            Local path to the cached template. Templates that are not remote are
+            returned unchanged (cookiecutter can find them on its own), except for
+            bundles, which are extracted.
+        """
+        url = expand_template(template)
+        bundle = self._find_bundle(url, checkout)
+        if bundle:
+            return str(self._fetch_bundle(bundle, refresh).template)
+        if not is_remote(url):
+            return template
+
+        directory = clean_directory(directory)
+        with _lock_for(self.root / cache_key(url, checkout, directory)):
+            entry = None if refresh else self._lookup(url, checkout, directory)
+            if entry:
+                logger.report("cached", f"{url} ({entry.commit or entry.key})")
+                entry.touch()
+                return str(entry.template)
+
+            entry = self._download(url, checkout, directory, refresh)
+
+        self.evict(keep=entry.key)
+        return str(entry.template)
+
+    def evict(self, keep: Optional[str] = None) -> List[CacheEntry]:
+        """Remove stale entries and, if the cache is still too big, the least recently
+        used ones. The entry identified by ``keep`` is never removed.
+        """
+        now = time.time()
+        removed, remaining = [], []
+        for entry in self.entries():
+            if entry.key != keep and entry.is_unused(self.max_age, now):
+                removed.append(entry)
+            else:
+                remaining.append(entry)
+
+        total = sum(e.size for e in remaining)
+        for entry in sorted(remaining, key=lambda e: e.last_used):
+            if total <= self.max_size:
+                break
+            if entry.key != keep:
+                removed.append(entry)
+                total -= entry.size
+
+        for entry in removed:
+            logger.report("evict", entry.url)
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+        return removed
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def snapshot_dir(self, repo_dir: PathLike) -> Path:
+        """Where the precompiled snapshot of a template is stored (see
+        :mod:`~.snapshot`). Snapshots of cached templates live inside the cache entry
+        (and are evicted together with it), other templates use a separate folder.
+        """
+        repo_dir = Path(repo_dir).resolve()
+        try:
+            relative = repo_dir.relative_to(self.root.resolve())
+        except ValueError:
+            relative = None
+        if relative and relative.parts:
+            return self.root / relative.parts[0] / SNAPSHOT_DIRNAME
+        key = hashlib.sha256(str(repo_dir).encode("utf-8")).hexdigest()[:32]
+        return self.root / SNAPSHOTS_DIRNAME / key
+
+    def _lookup(
+        self, url: str, checkout: Optional[str], directory: Optional[str]
+    ) -> Optional[CacheEntry]:
+        """Entry that can be used for the template without fetching it again"""
+        if _repo_type(url) != "git":  # e.g. zip archives
+            entry = CacheEntry.load(self.root / cache_key(url, checkout, directory))
+            return None if entry is None or entry.is_stale(self.max_age) else entry
+
+        commit = remote_commit(url, checkout)
+        if commit:
+            return CacheEntry.load(self.root / cache_key(url, commit, directory))
+        entry = self.get(url, checkout, directory)
+        if entry:
+            ref = checkout or "HEAD"
+            logger.warning(f"Cannot resolve {ref} in {url}, using the cached version")
+        return entry
+
+    def _find_bundle(self, url: str, checkout: Optional[str]) -> Optional[Path]:
+        from . import bundle as bundles
+
+        if bundles.is_bundle(url):
+            return Path(url)
+        if self.mirror and is_remote(url):
+            bundle = bundles.find_in_mirror(self.mirror, url, checkout)
+            if bundle is None:
+                logger.warning(f"Template not found in mirror {self.mirror}: {url}")
+            return bundle
+        return None
+
+    def _fetch_bundle(self, bundle: Path, refresh: bool = False) -> CacheEntry:
+        """Bundles never change, so they are identified by their contents and
+        extracted only once.
+        """
+        from . import bundle as bundles
+
+        key = cache_key("bundle:" + bundles.digest(bundle))
+        with _lock_for(self.root / key):
+            entry = CacheEntry.load(self.root / key)
+            if entry and not refresh:
+                logger.report("cached", f"{entry.url} ({entry.commit or entry.key})")
+                entry.touch()
+                return entry
+
+            self.root.mkdir(parents=True, exist_ok=True)
+            staging = Path(mkdtemp(prefix=STAGING_PREFIX, dir=str(self.root)))
+            try:
+                logger.report("extract", str(bundle))
+                manifest = bundles.extract(bundle, staging)
+                template = staging / manifest["dirname"]
+                meta = {
+                    "url": manifest["source"],
+                    "checkout": manifest["checkout"],
+                    "commit": manifest["commit"],
+                    "created": time.time(),
+                    "size": disk_usage(template),
+                    "dirname": template.name,
+                    "bundle": str(bundle),
+                }
+                (staging / ENTRY_FILE).write_text(json.dumps(meta), encoding="utf-8")
+                entry = _publish(staging, self.root / key, replace=refresh)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+
+        self.evict(keep=entry.key)
+        return entry
+
+    def _download(
+        self,
+        url: str,
+        checkout: Optional[str],
+        directory: Optional[str] = None,
+        refresh: bool = False,
+    ) -> CacheEntry:
+        from cookiecutter.repository import is_zip_file
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        staging = Path(mkdtemp(prefix=STAGING_PREFIX, dir=str(self.root)))
+        try:
+            logger.report("fetch", url + (f" ({directory})" if directory else ""))
+            if is_zip_file(url):
+                template = _download_zip(url, staging)
+            else:
+                template = _clone(url, checkout, staging, directory, self.shallow)
+
+            meta = {
+                "url": url,
+                "checkout": checkout,
+                "directory": directory,
+                "commit": git_head(template),
+                "created": time.time(),
+                "size": disk_usage(template),
+                "dirname": template.name,
+            }
+            (staging / ENTRY_FILE).write_text(json.dumps(meta), encoding="utf-8")
+            key = cache_key(url, meta["commit"] or checkout, directory)
+            return _publish(staging, self.root / key, replace=refresh)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+
+def _lock_for(path: Path) -> Lock:
+    """Threads fetching the same entry wait for each other"""
+    with _LOCKS_GUARD:
+        return _LOCKS.setdefault(str(path), Lock())
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """Processes publishing the same entry wait for each other (where
+    :obj:`fcntl.flock` is available)
+    """
+    try:
+        import fcntl
+    except ImportError:  # pragma: no cover
+        yield  # e.g. Windows
+        return
+
+    lock = path.with_name(f"{LOCK_PREFIX}{path.name}")
+    with open(str(lock), "a") as file:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def disk_usage(path: Path) -> int:
+    return sum(
+        os.lstat(os.path.join(root, f)).st_size
+        for root, _, files in os.walk(path)
+        for f in files
+    )
+
+
+def _clone(
+    url: str,
+    checkout: Optional[str],
+    dest: Path,
+    directory: Optional[str] = None,
+    shallow: bool = True,
+) -> Path:
+    """Clone the repository into ``dest`` (in a folder with the same name cookiecutter
+    would use). Git repositories are fetched without their history (``shallow``)
+    and only ``directory`` is checked out, when given.
+    """
+    from cookiecutter.exceptions import RepositoryCloneFailed
+    from cookiecutter.vcs import clone, identify_repo, is_vcs_installed
+
+    repo_type, repo_url = identify_repo(url)
+    if repo_type != "git" or not is_vcs_installed("git") or not (shallow or directory):
+        return Path(clone(url, checkout, clone_to_dir=dest, no_input=True))
+
+    repo_url = repo_url.rstrip("/")
+    name = os.path.split(repo_url)[1].split(":")[-1].rsplit(".git")[0]
+    path = dest / name
+    path.mkdir(parents=True)
+    try:
+        _git(path, "init", "-q")
+        _git(path, "remote", "add", "origin", repo_url)
+        if directory:
+            _git(path, "sparse-checkout", "set", directory)
+        depth = ["--depth", "1"] if shallow else []
+        # Skip the contents of the other directories (partial clone)
+        partial = ["--filter=blob:none"] if directory else []
+        try:
+            _git(path, "fetch", "-q", *depth, *partial, "origin", checkout or "HEAD")
+            _git(path, "checkout", "-q", "FETCH_HEAD")
+        except subprocess.CalledProcessError:
+            if not checkout:
+                raise
+            # Refs that cannot be fetched directly (e.g. abbreviated commits)
+            # require the whole repository
+            _git(path, "fetch", "-q", *partial, "--tags", "origin")
+            _git(path, "checkout", "-q", checkout)
+    except subprocess.CalledProcessError as ex:
+        output = (ex.stderr or "").strip()
+        msg = f"Impossible to fetch {checkout or 'HEAD'} from {repo_url}: {output}"
+        raise RepositoryCloneFailed(msg) from ex
+    return path
+
+
+def _git(path: Path, *args: str):
+    cmd = ["git", *args]
+    subprocess.run(cmd, cwd=str(path), check=True, capture_output=True, text=True)
+
+
+def _download_zip(url: str, dest: Path) -> Path:
+    from cookiecutter.zipfile import unzip
+
+    downloads = dest / "downloads"
+    unzipped = Path(unzip(url, is_url=True, clone_to_dir=downloads, no_input=True))
+    target = dest / unzipped.name
+    shutil.move(str(unzipped), str(target))
+    shutil.rmtree(unzipped.parent, ignore_errors=True)
+    shutil.rmtree(downloads, ignore_errors=True)
+    return target
+
+
+def remote_commit(url: str, checkout: Optional[str] = None) -> Optional[str]:
+    """Commit that ``checkout`` (a branch or tag, the default branch when not given)
+    points to in the remote git repository ``url``, via ``git ls-remote``.
+
+    Returns:
+        ``None`` if it cannot be resolved (e.g. the repository cannot be reached,
+        it is not a git repository or ``checkout`` is an abbreviated commit).
+    """
+    from cookiecutter.vcs import identify_repo
+
+    if checkout and _COMMIT.match(checkout):
+        return checkout.lower()
+    if _repo_type(url) != "git":
+        return None
+
+    ref = checkout or "HEAD"
+    cmd = ["git", "ls-remote", identify_repo(url)[1].rstrip("/"), ref]
+    try:
+        proc = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    refs = {}
+    for line in proc.stdout.splitlines():
+        commit, _, name = line.partition("\t")
+        refs[name] = commit
+    # Branches are preferred over tags (with the commit of annotated tags)
+    for name in (ref, f"refs/heads/{ref}", f"refs/tags/{ref}^{{}}", f"refs/tags/{ref}"):
+        if name in refs:
+            return refs[name]
+    return None
+
+
+def _repo_type(url: str) -> Optional[str]:
+    from cookiecutter.vcs import identify_repo
+
+    try:
+        return identify_repo(url)[0]
+    except Exception:  # e.g. zip archives
+        return None
+
+
+def git_head(path: Path) -> Optional[str]:
+    """Commit checked out in the git repository ``path`` (if it is one)"""
+    if not (path / ".git").exists():
+        return None
+    cmd = ["git", "rev-parse", "HEAD"]
+    proc = subprocess.run(cmd, cwd=str(path), stdout=subprocess.PIPE, text=True)
+    return proc.stdout.strip() or None
+
+
+def recorded_commit(path: Path) -> Optional[str]:
+    """Commit recorded for a template stored in the cache (e.g. extracted from a
+    bundle, without the ``.git`` folder)
+    """
+    entry = CacheEntry.load(path.parent)
+    if entry and entry.meta.get("dirname") == path.name:
+        return entry.commit
+    return None
+
+
+def _publish(staging: Path, target: Path, replace: bool = False) -> CacheEntry:
+    """Atomically move a freshly downloaded entry into its final place.
+    If a valid entry already exists (e.g. published by a concurrent process), it is
+    kept (it might be in use) and ``staging`` is discarded, unless ``replace`` is
+    given (explicit refresh).
+    """
+    with _file_lock(target):
+        entry = CacheEntry.load(target)
+        if entry and not replace:
+            return entry
+        if target.exists():
+            old = Path(mkdtemp(prefix=STAGING_PREFIX, dir=str(target.parent)))
+            os.replace(str(target), str(old / target.name))
+            shutil.rmtree(old, ignore_errors=True)
+        os.rename(str(staging), str(target))
+    entry = CacheEntry.load(target)
+    if entry is None:  # pragma: no cover
+        raise OSError(f"Impossible to store template in cache: {target}")
+    return entry
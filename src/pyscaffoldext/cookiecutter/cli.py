@@ -0,0 +1,221 @@
+"""Command line interface for managing cookiecutter templates outside of ``putup``
+(``putup-cookiecutter`` console script)::
+
+    # Warm the cache (e.g. while building a container image)
+    putup-cookiecutter prefetch gh:org/service-template gh:org/lib-template
+
+    # Export a template into a bundle (see the ``bundle`` module) or a mirror folder
+    putup-cookiecutter bundle gh:org/service-template /srv/templates
+
+    # Hits/misses of the cache of generated projects (see the ``results`` module)
+    putup-cookiecutter results
+
+    # Keep templates in memory for ``putup-cookiecutter-client`` (``daemon`` module)
+    putup-cookiecutter daemon --idle-timeout 3600
+
+The cache and mirror used by ``putup --cookiecutter`` can be selected with the
+``--cache-dir`` and ``--mirror`` options (for the ``daemon``, they are used by the
+requests that do not select them).
+"""
+import argparse
+import logging
+import sys
+from typing import List, Optional
+
+from pyscaffold.exceptions import exceptions2exit
+from pyscaffold.log import logger
+
+
+def parse_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="putup-cookiecutter",
+        description="Manage the cookiecutter templates used by PyScaffold",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        help="directory where templates are cached "
+        "(by default inside cookiecutter's `cookiecutters_dir`)",
+    )
+    parser.add_argument(
+        "--mirror",
+        metavar="DIR",
+        help="use the template bundles stored in DIR instead of the network",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        dest="log_level",
+        action="store_const",
+        const=logging.WARNING,
+        default=logging.INFO,
+        help="only report errors and warnings",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    prefetch = commands.add_parser(
+        "prefetch",
+        help="fetch, validate and precompile templates into the cache",
+    )
+    prefetch.add_argument("templates", nargs="+", metavar="TEMPLATE")
+    prefetch.add_argument("--checkout", metavar="REF", help="branch, tag or commit")
+    prefetch.add_argument(
+        "--directory",
+        metavar="DIR",
+        help="directory of the repository that contains the template",
+    )
+    prefetch.add_argument(
+        "--refresh",
+        action="store_true",
+        help="fetch the templates again, even if they are already cached",
+    )
+    prefetch.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=int,
+        help="number of templates prefetched concurrently",
+    )
+
+    bundle = commands.add_parser(
+        "bundle", help="export a template into a bundle for offline usage"
+    )
+    bundle.add_argument("template", metavar="TEMPLATE")
+    bundle.add_argument(
+        "dest", metavar="DEST", help="bundle file or mirror directory to be created"
+    )
+    bundle.add_argument("--checkout", metavar="REF", help="branch, tag or commit")
+
+    results = commands.add_parser(
+        "results", help="show statistics of the cache of generated projects"
+    )
+    results.add_argument(
+        "--clear", action="store_true", help="remove all the generated projects"
+    )
+
+    daemon = commands.add_parser(
+        "daemon",
+        help="generate projects for `putup-cookiecutter-client`, keeping the "
+        "templates in memory",
+    )
+    daemon.add_argument("--socket", metavar="PATH", help="Unix socket to listen on")
+    daemon.add_argument(
+        "--idle-timeout",
+        metavar="SECONDS",
+        type=float,
+        help="stop after SECONDS without requests",
+    )
+    daemon.add_argument(
+        "--max-templates",
+        metavar="N",
+        type=int,
+        help="number of templates kept in memory (default: 32)",
+    )
+    daemon.add_argument(
+        "--preload",
+        nargs="+",
+        default=[],
+        metavar="TEMPLATE",
+        help="templates loaded before the first request",
+    )
+    control = daemon.add_mutually_exclusive_group()
+    control.add_argument("--stop", action="store_true", help="stop a running daemon")
+    control.add_argument(
+        "--status", action="store_true", help="show statistics of a running daemon"
+    )
+    return parser.parse_args(args)
+
+
+def main(args: List[str]) -> int:
+    """Main entry point for external applications
+
+    Args:
+        args: command line arguments
+
+    Returns:
+        exit code (``1`` if any of the templates failed)
+    """
+    from .cache import TemplateCache
+
+    opts = parse_args(args)
+    logger.reconfigure(log_level=opts.log_level)
+    cache_opts = {
+        "cookiecutter_cache_dir": opts.cache_dir,
+        "cookiecutter_mirror": opts.mirror,
+    }
+    cache = TemplateCache.from_opts(cache_opts)
+
+    if opts.command == "results":
+        import json
+
+        from .results import RESULTS_DIRNAME, ResultCache
+
+        results = ResultCache(cache.root / RESULTS_DIRNAME)
+        if opts.clear:
+            results.clear()
+        print(json.dumps(results.stats(), indent=2))
+        return 0
+
+    if opts.command == "daemon":
+        # Used by the requests that do not select a cache/mirror themselves
+        defaults = {k: v for k, v in cache_opts.items() if v}
+        return _daemon(opts, defaults)
+
+    if opts.command == "bundle":
+        from .bundle import export_bundle
+
+        export_bundle(opts.template, opts.dest, opts.checkout, cache)
+        return 0
+
+    from .plan import format_size
+    from .prefetch import prefetch
+
+    templates, checkout, directory = opts.templates, opts.checkout, opts.directory
+    results = list(
+        prefetch(templates, checkout, opts.refresh, cache, opts.jobs, directory)
+    )
+    failed = [r for r in results if not r.ok]
+    size = sum(r.size for r in results)
+    duration = sum(r.duration for r in results)
+    summary = (
+        f"{len(results) - len(failed)} templates cached ({format_size(size)}, "
+        f"{duration:.2f}s), {len(failed)} failed"
+    )
+    logger.report("prefetch", summary)
+    return 1 if failed else 0
+
+
+def _daemon(opts: argparse.Namespace, defaults: dict) -> int:
+    from .daemon import Daemon, TemplatePool, control
+
+    if opts.stop or opts.status:
+        try:
+            response = control("stop" if opts.stop else "stats", opts.socket)
+        except OSError as ex:
+            logger.error(f"The daemon is not running ({ex})")
+            return 1
+        if opts.status:
+            import json
+
+            print(json.dumps(response["stats"], indent=2))
+        return response["exit"]
+
+    pool = TemplatePool(opts.max_templates) if opts.max_templates else TemplatePool()
+    daemon = Daemon(opts.socket, opts.idle_timeout, pool, defaults)
+    daemon.preload(opts.preload)
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+@exceptions2exit([RuntimeError, ValueError, OSError])
+def run(args: Optional[List[str]] = None):
+    """Entry point for console script"""
+    sys.exit(main(sys.argv[1:] if args is None else args))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,172 @@
+"""Thin client for the scaffolding daemon (``putup-cookiecutter-client`` console
+script), see :mod:`~.daemon`.
+
+The client accepts the same arguments as ``putup``, sends them to the daemon and
+prints its output. When the daemon is not running, ``putup`` is executed in-process
+instead (with the same result, only slower). Therefore, the client can be used as a
+drop-in replacement for ``putup`` in tools that scaffold many projects::
+
+    putup-cookiecutter-client mypkg --cookiecutter gh:org/service-template
+
+This module only depends on the standard library (the whole point of the client is
+to avoid the cost of importing PyScaffold and cookiecutter).
+"""
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+from typing import Iterator, List, Optional
+
+PROTOCOL_VERSION = 1
+SOCKET_ENV = "PYSCAFFOLDEXT_COOKIECUTTER_SOCKET"
+SOCKET_NAME = "pyscaffoldext-cookiecutter.sock"
+
+LOCAL_ONLY = ("-i", "--interactive")
+"""Options that require a terminal and are never sent to the daemon"""
+
+PEERCRED = struct.Struct("3i")
+"""Credentials (pid, uid, gid) of the process connected to a Unix socket"""
+
+
+def socket_path() -> str:
+    """Socket used by the daemon (``PYSCAFFOLDEXT_COOKIECUTTER_SOCKET``, by default
+    a file in ``XDG_RUNTIME_DIR`` or in a :obj:`private_dir` of the temporary folder)
+    """
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], SOCKET_NAME)
+    return os.path.join(private_dir(), SOCKET_NAME)
+
+
+def private_dir() -> str:
+    """Folder of the temporary folder (shared with other users) for the socket"""
+    name = SOCKET_NAME.replace(".sock", f"-{os.getuid()}")
+    return os.path.join(tempfile.gettempdir(), name)
+
+
+def ensure_private_dir(path: str):
+    """Create ``path`` only accessible by the user, or make sure that it already is
+    (other users could otherwise replace the socket).
+
+    Raises:
+        PermissionError: the folder belongs to another user or is accessible by others
+    """
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"{path} is not a folder owned by the current user")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        raise PermissionError(f"{path} is accessible by other users")
+
+
+def connect(path: Optional[str] = None, timeout: Optional[float] = None):
+    """Connect to the daemon (raises :obj:`OSError` when it is not running and
+    :obj:`PermissionError` when it belongs to another user)
+    """
+    if not hasattr(socket, "AF_UNIX"):  # pragma: no cover
+        raise OSError("Unix sockets are not supported in this platform")
+    path = path or socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        if not same_user(sock):
+            raise PermissionError(f"{path} belongs to another user")
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def same_user(sock: socket.socket) -> bool:
+    """Check if the process on the other side of ``sock`` belongs to the same user"""
+    if not hasattr(socket, "SO_PEERCRED"):  # pragma: no cover
+        return True  # Linux only, the permissions of the socket file still apply
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, PEERCRED.size)
+    _pid, uid, _gid = PEERCRED.unpack(creds)
+    return uid == os.getuid()
+
+
+def request(
+    message: dict, path: Optional[str] = None, timeout: Optional[float] = None
+) -> Iterator[dict]:
+    """Send ``message`` to the daemon and iterate over its responses (JSON objects,
+    the last one contains the ``exit`` code)
+    """
+    with connect(path, timeout) as sock:
+        yield from exchange(sock, message)
+
+
+def exchange(sock: socket.socket, message: dict) -> Iterator[dict]:
+    data = {"version": PROTOCOL_VERSION, **message}
+    sock.sendall(json.dumps(data).encode("utf-8") + b"\n")
+    with sock.makefile("r", encoding="utf-8") as stream:
+        for line in stream:
+            response = json.loads(line)
+            yield response
+            if "exit" in response:
+                return
+    raise ConnectionError("The daemon closed the connection unexpectedly")
+
+
+def main(args: List[str]) -> int:
+    """Main entry point for external applications
+
+    Args:
+        args: command line arguments (the same as ``putup``)
+
+    Returns:
+        exit code
+    """
+    if any(arg in LOCAL_ONLY for arg in args):
+        return _run_locally(args)
+    try:
+        sock = connect()
+    except PermissionError as ex:
+        print(f"WARNING: not using the daemon: {ex}", file=sys.stderr)
+        return _run_locally(args)
+    except OSError:
+        return _run_locally(args)
+
+    message = {
+        "command": "create",
+        "args": args,
+        "cwd": os.getcwd(),
+        "tty": sys.stderr.isatty(),  # PyScaffold uses colors in terminals
+    }
+    with sock:
+        for response in exchange(sock, message):
+            if "stdout" in response:
+                sys.stdout.write(response["stdout"])
+                sys.stdout.flush()
+            if "stderr" in response:
+                sys.stderr.write(response["stderr"])
+            if "exit" in response:
+                return response["exit"]
+    return 1  # pragma: no cover
+
+
+def _run_locally(args: List[str]) -> int:
+    from pyscaffold.cli import run
+
+    try:
+        run(args)
+    except SystemExit as ex:
+        return ex.code if isinstance(ex.code, int) else int(ex.code is not None)
+    return 0
+
+
+def run(args: Optional[List[str]] = None):
+    """Entry point for console script"""
+    sys.exit(main(sys.argv[1:] if args is None else args))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,449 @@
+"""Long-lived process that generates projects on behalf of a thin client
+(``putup-cookiecutter daemon``).
+
+Every ``putup --cookiecutter ...`` invocation pays for starting Python, discovering
+PyScaffold's extensions, importing cookiecutter and Jinja and loading the template.
+The daemon keeps the interpreter, the imported modules and the templates used by
+previous requests in memory, and generates projects for the client
+(``putup-cookiecutter-client``, see :mod:`~.client`) over a Unix socket::
+
+    putup-cookiecutter daemon --preload gh:org/service-template &
+    putup-cookiecutter-client mypkg --cookiecutter gh:org/service-template
+    putup-cookiecutter daemon --stop
+
+Requests are JSON objects (one per line) with a ``command``: ``create`` (with the
+``args`` given to ``putup`` and the ``cwd`` of the client), ``ping``, ``stats`` or
+``stop``. The daemon answers with the output of ``putup`` (``stdout``/``stderr``
+objects) followed by an object with the ``exit`` code.
+
+Projects are generated one at a time (PyScaffold changes the working directory), in
+the working directory of the client but with the environment variables of the daemon
+(e.g. ``COOKIECUTTER_CONFIG``). Only processes of the same user can connect, and the
+client only talks to a daemon of the same user. By default, the socket is created in
+``XDG_RUNTIME_DIR`` or in a folder of the temporary folder only accessible by the user
+(see :obj:`~.client.socket_path`).
+
+Templates are kept in a :obj:`TemplatePool`: remote templates are reused while the
+requested ref still points to the same commit (see :mod:`~.cache`) and local templates
+until their files change. ``--cookiecutter-refresh`` always fetches the template again.
+"""
+import json
+import logging
+import os
+import socketserver
+import time
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from io import TextIOBase
+from threading import Event, Lock, Thread
+from time import perf_counter
+from typing import TYPE_CHECKING, Callable, Iterable, List, NamedTuple, Optional
+
+from pyscaffold.actions import ScaffoldOpts
+from pyscaffold.log import logger
+
+from . import __version__
+from .client import (
+    PROTOCOL_VERSION,
+    connect,
+    ensure_private_dir,
+    private_dir,
+    same_user,
+    socket_path,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .cache import TemplateCache
+    from .template import Template
+
+DEFAULT_MAX_TEMPLATES = 32
+"""Number of templates kept in memory (least recently used ones are dropped)"""
+
+_PIPELINE_LOCK = Lock()
+"""Serialises the generation of projects (PyScaffold changes the working dir)"""
+
+Send = Callable[[dict], None]
+
+
+class PooledTemplate(NamedTuple):
+    template: "Template"
+    loaded: float
+    fingerprint: Optional[str]
+    """Fingerprint of the files of local templates (``None`` for remote ones)"""
+
+
+class TemplatePool:
+    """Templates loaded by previous requests, identified by the options used to fetch
+    them (template, ref, directory and cache settings).
+
+    Args:
+        max_templates: number of templates kept in memory.
+    """
+
+    def __init__(self, max_templates: int = DEFAULT_MAX_TEMPLATES):
+        self.max_templates = max_templates
+        self.hits = 0
+        self.misses = 0
+        self._templates: "OrderedDict[str, PooledTemplate]" = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def get(self, opts: ScaffoldOpts) -> Optional["Template"]:
+        """Template for the (``putup``) options ``opts``, loaded if necessary.
+
+        Returns:
+            ``None`` when the options do not use a template that can be reused (e.g.
+            ``--update``) or it cannot be loaded (the extension reports the error).
+        """
+        from . import snapshot as snapshots
+        from .cache import TemplateCache, clean_directory
+        from .template import Template
+
+        source = opts.get("cookiecutter")
+        if not source or opts.get("update") or opts.get("cookiecutter_template"):
+            return None
+        if os.path.isdir(source):
+            source = os.path.abspath(source)
+        cache = TemplateCache.from_opts(opts)
+        try:
+            directory = clean_directory(opts.get("cookiecutter_directory"))
+        except ValueError:
+            return None
+        settings = [opts.get("cookiecutter_ref"), directory, cache.shallow]
+        settings += [str(cache.root), str(cache.mirror)]
+        key = json.dumps([source, *settings, opts.get("cookiecutter_snapshot", True)])
+
+        with self._lock:
+            pooled = self._templates.get(key)
+        if pooled and not opts.get("cookiecutter_refresh"):
+            if _is_fresh(pooled, cache):
+                with self._lock:
+                    self._templates.move_to_end(key)
+                    self.hits += 1
+                return pooled.template
+
+        with self._lock:
+            self.misses += 1
+        try:
+            template = Template.from_opts({**opts, "cookiecutter": source})
+        except Exception:
+            return None
+        local = os.path.isdir(source)
+        fingerprint = snapshots.fingerprint(template.repo_dir) if local else None
+        with self._lock:
+            self._templates[key] = PooledTemplate(template, time.time(), fingerprint)
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+class Daemon:
+    """Serve generation requests over a Unix socket.
+
+    Args:
+        path: path of the socket (see :obj:`~.client.socket_path`).
+        idle_timeout: seconds without requests after which the daemon stops.
+        pool: templates kept in memory between requests.
+        defaults: options used for all the requests, unless given by the client
+            (e.g. ``cookiecutter_cache_dir`` or ``cookiecutter_mirror``).
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        idle_timeout: Optional[float] = None,
+        pool: Optional[TemplatePool] = None,
+        defaults: Optional[ScaffoldOpts] = None,
+    ):
+        self.path = path or socket_path()
+        self.idle_timeout = idle_timeout
+        self.pool = TemplatePool() if pool is None else pool
+        self.defaults = dict(defaults or {})
+        self.started = time.time()
+        self.last_request = self.started
+        self.requests = 0
+        self._server: Optional[socketserver.BaseServer] = None
+        self._ready = Event()
+        self._stopped = Event()
+
+    def preload(self, templates: Iterable[str]):
+        """Load ``templates`` into the pool before the first request"""
+        for template in templates:
+            if self.pool.get({**self.defaults, "cookiecutter": template}) is None:
+                logger.warning(f"Impossible to preload template: {template}")
+
+    def serve(self):
+        """Serve requests until the daemon is stopped (``stop`` command,
+        :obj:`shutdown` or idle timeout)
+        """
+        _warm_up()
+        folder = os.path.dirname(os.path.abspath(self.path))
+        if folder == private_dir():
+            ensure_private_dir(folder)
+        _remove_stale_socket(self.path)
+        umask = os.umask(0o177)  # Only the user can connect (see also same_user)
+        try:
+            server = _Server(self.path, _Handler)
+        finally:
+            os.umask(umask)
+        server.owner = self
+        self._server = server
+        logger.report("listen", self.path)
+        try:
+            with server:
+                if self.idle_timeout:
+                    Thread(target=self._stop_when_idle, daemon=True).start()
+                self._ready.set()
+                server.serve_forever()
+        finally:
+            self._stopped.set()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            logger.report("stop", f"{self.path} ({self.requests} requests served)")
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the daemon accepts requests (e.g. when :obj:`serve` runs in a
+        different thread)
+        """
+        return self._ready.wait(timeout)
+
+    def shutdown(self):
+        """Stop serving requests (should not be called from the thread running
+        :obj:`serve`)
+        """
+        self._stopped.set()
+        if self._server:
+            self._server.shutdown()
+
+    def stats(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "version": __version__,
+            "uptime": time.time() - self.started,
+            "requests": self.requests,
+            "templates": len(self.pool),
+            "hits": self.pool.hits,
+            "misses": self.pool.misses,
+        }
+
+    def dispatch(self, message: dict, send: Send):
+        """Handle a request from a client"""
+        self.last_request = time.time()
+        command = message.get("command")
+        if message.get("version") != PROTOCOL_VERSION:
+            msg = f"Unsupported protocol version: {message.get('version')}\n"
+            send({"stderr": msg, "exit": 2})
+        elif command == "create" and not _is_create_request(message):
+            msg = (
+                "Invalid create request: 'args' (list of strings) and 'cwd' expected\n"
+            )
+            send({"stderr": msg, "exit": 2})
+        elif command == "create":
+            tty = bool(message.get("tty"))
+            code = self.create(message["args"], message["cwd"], send, tty)
+            send({"exit": code})
+        elif command == "ping":
+            send({"pid": os.getpid(), "version": __version__, "exit": 0})
+        elif command == "stats":
+            send({"stats": self.stats(), "exit": 0})
+        elif command == "stop":
+            send({"exit": 0})
+            Thread(target=self.shutdown).start()
+        else:
+            send({"stderr": f"Unknown command: {command}\n", "exit": 2})
+        self.last_request = time.time()
+
+    def create(self, args: List[str], cwd: str, send: Send, tty=False) -> int:
+        """Run ``putup`` with ``args`` inside ``cwd``, sending its output to the
+        client (``tty`` indicates the client runs in a terminal).
+
+        Returns:
+            exit code
+        """
+        from pyscaffold.cli import parse_args
+
+        out, err = _Forward(send, "stdout", tty), _Forward(send, "stderr", tty)
+        start = perf_counter()
+        with _PIPELINE_LOCK, _chdir(cwd), _log_to(err):
+            with redirect_stdout(out), redirect_stderr(err):  # type: ignore[type-var]
+                try:
+                    opts = parse_args(args)
+                    for key, value in self.defaults.items():
+                        if opts.get(key) is None:
+                            opts[key] = value
+                    template = self.pool.get(opts)
+                    if template is not None:
+                        opts["cookiecutter_template"] = template
+                    opts["command"](opts)
+                    code = 0
+                except SystemExit as ex:
+                    code = ex.code if isinstance(ex.code, int) else int(bool(ex.code))
+                except Exception as ex:
+                    # Same output as ``putup`` (see ``pyscaffold.exceptions``)
+                    if logger.level <= logging.DEBUG:
+                        traceback.print_exc()
+                    print(f"ERROR: {ex}")
+                    code = 1
+            self.requests += 1
+
+        duration = perf_counter() - start
+        logger.report("serve", f"{' '.join(args)} (exit {code}, {duration:.2f}s)")
+        return code
+
+    def _stop_when_idle(self):
+        assert self.idle_timeout
+        while not self._stopped.wait(min(self.idle_timeout, 1)):
+            idle = time.time() - self.last_request
+            if idle > self.idle_timeout and not _PIPELINE_LOCK.locked():
+                logger.report("idle", f"{idle:.0f}s without requests")
+                self.shutdown()
+                return
+
+
+def control(command: str, path: Optional[str] = None) -> dict:
+    """Send a command (``ping``, ``stats`` or ``stop``) to a running daemon
+
+    Returns:
+        Response of the daemon (raises :obj:`OSError` if it is not running)
+    """
+    from .client import request
+
+    responses = list(request({"command": command}, path, timeout=10))
+    return responses[-1]
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    owner: Daemon
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: _Server
+
+    def handle(self):
+        if not same_user(self.request):
+            self.send({"stderr": "Permission denied\n", "exit": 2})
+            return
+        try:
+            message = json.loads(self.rfile.readline())
+        except ValueError:
+            self.send({"stderr": "Invalid request\n", "exit": 2})
+            return
+        self.server.owner.dispatch(message, self.send)
+
+    def send(self, response: dict):
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class _Forward(TextIOBase):
+    """Text stream that sends its contents to the client. If the client goes away
+    the project is still generated (the output is discarded).
+    """
+
+    def __init__(self, send: Send, name: str, tty: bool = False):
+        self._send = send
+        self._name = name
+        self._tty = tty
+        self._connected = True
+
+    def writable(self) -> bool:
+        return True
+
+    def isatty(self) -> bool:
+        return self._tty
+
+    def write(self, text: str) -> int:
+        if self._connected and text:
+            try:
+                self._send({self._name: text})
+            except OSError:
+                self._connected = False
+        return len(text)
+
+
+@contextmanager
+def _chdir(path: str):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+@contextmanager
+def _log_to(stream):
+    """Send PyScaffold's logs (otherwise written to the daemon's stderr) to
+    ``stream``
+    """
+    from pyscaffold.log import ReportFormatter
+
+    handler, formatter, level = logger.handler, logger.formatter, logger.level
+    if not isinstance(handler, logging.StreamHandler):  # pragma: no cover
+        yield
+        return
+    previous = handler.setStream(stream)
+    logger.formatter = ReportFormatter()  # colors depend on the client's terminal
+    try:
+        yield
+    finally:
+        handler.setStream(previous)
+        logger.formatter = formatter
+        logger.level = level  # changed by ``--verbose``/``--very-verbose``
+
+
+def _is_create_request(message: dict) -> bool:
+    args = message.get("args")
+    valid_args = isinstance(args, list) and all(isinstance(a, str) for a in args)
+    return valid_args and isinstance(message.get("cwd"), str)
+
+
+def _is_fresh(pooled: PooledTemplate, cache: "TemplateCache") -> bool:
+    from . import snapshot as snapshots
+    from .cache import expand_template, remote_commit
+
+    template = pooled.template
+    if pooled.fingerprint is None:
+        # Bundles (e.g. from a mirror) never change, git refs might move
+        url = expand_template(template.source)
+        commit = None if cache.mirror else remote_commit(url, template.checkout)
+        if commit:
+            return commit == template.commit
+        return time.time() - pooled.loaded < cache.max_age
+    try:
+        return snapshots.fingerprint(template.repo_dir) == pooled.fingerprint
+    except OSError:  # pragma: no cover
+        return False
+
+
+def _remove_stale_socket(path: str):
+    """Remove the socket left behind by a daemon that was killed"""
+    if not os.path.exists(path):
+        return
+    try:
+        connect(path, timeout=1).close()
+    except OSError:
+        os.unlink(path)
+        return
+    raise OSError(f"Another daemon is already listening on {path}")
+
+
+def _warm_up():
+    """Import the modules necessary for generating projects before the first
+    request arrives
+    """
+    import cookiecutter.main  # noqa: F401
+    import jinja2  # noqa: F401
+    import pyscaffold.api  # noqa: F401
+    import pyscaffold.cli  # noqa: F401
+
+    from . import extension, structure, template, update  # noqa: F401
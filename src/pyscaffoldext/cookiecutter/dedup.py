@@ -0,0 +1,205 @@
+"""Content-addressed store shared by the files of many generated projects.
+
+Projects generated from the same template (e.g. with :obj:`~.batch.create_projects`)
+are mostly made of identical files. When the ``cookiecutter_dedup`` option
+(``--cookiecutter-dedup STORE`` in the CLI) is given, the files of each project are
+hashed once the project is complete (after PyScaffold's own files, the hooks and the
+git repository) and each unique file is kept only once in ``STORE``: the files of the
+project become links to the stored blobs.
+
+By default, files are hardlinked to the blobs. Blobs (and therefore the linked
+files) are made read-only, so they cannot be accidentally modified in place (which
+would change the same file in every project). Tools that replace files instead of
+rewriting them (e.g. git and most editors) are not affected. With
+``--cookiecutter-link reflink``, files are instead copy-on-write clones of the blobs
+(where the file system supports them) and remain writable.
+Files are left untouched when they cannot be linked (e.g. the store is in a different
+file system). The ``.git`` folder, the state file used by ``putup --update`` (see
+:mod:`~.update`) and the files generated by PyScaffold (which are written again when
+the project is updated) are never linked. Updating the files that come from the
+template replaces the links by independent copies (see :obj:`~.stream.break_link`).
+
+Each project gets a :obj:`DedupReport` (stored in the ``cookiecutter_dedup_report``
+option and in :obj:`BatchResult.dedup <.batch.BatchResult.dedup>`), with the number of
+bytes saved and the dedup ratio.
+"""
+import hashlib
+import os
+import stat
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
+
+from pyscaffold.log import logger
+
+from . import stream
+
+PathLike = Union[str, os.PathLike]
+
+OBJECTS_DIRNAME = "objects"
+STAGING_PREFIX = ".tmp-"
+IGNORED_DIRS = (".git", ".hg")
+READ_ONLY = ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+class DedupReport(NamedTuple):
+    """Outcome of deduplicating the files of one (or many) projects"""
+
+    files: int = 0
+    """Number of files inspected"""
+    size: int = 0
+    """Total size of the files (in bytes)"""
+    linked: int = 0
+    """Files that are now links to a blob"""
+    stored: int = 0
+    """Bytes added to the store (files seen for the first time)"""
+    saved: int = 0
+    """Bytes that are not duplicated (files identical to an existing blob)"""
+
+    def __add__(self, other):  # type: ignore[override]
+        return DedupReport(*(a + b for a, b in zip(self, other)))
+
+    @property
+    def ratio(self) -> float:
+        """Size of the files divided by the disk space they actually use"""
+        used = self.size - self.saved
+        return self.size / used if used else 1.0
+
+    @classmethod
+    def total(cls, reports: Iterable[Optional["DedupReport"]]) -> "DedupReport":
+        """Combine the reports of several projects"""
+        return sum((r for r in reports if r), cls())
+
+
+class BlobStore:
+    """Unique files, identified by their contents (SHA-256) and permissions.
+
+    Args:
+        root: directory where blobs are stored (should be in the same file system as
+            the projects, so they can be linked).
+        link: ``"hardlink"`` (default) or ``"reflink"``.
+    """
+
+    def __init__(self, root: PathLike, link: Optional[str] = None):
+        self.root = Path(root)
+        self.link = "reflink" if link == "reflink" else "hardlink"
+
+    def blob(self, digest: str, mode: int) -> Path:
+        return self.root / OBJECTS_DIRNAME / digest[:2] / f"{digest[2:]}-{mode:o}"
+
+    def blobs(self) -> Iterator[Path]:
+        objects = self.root / OBJECTS_DIRNAME
+        if objects.is_dir():
+            for path in objects.glob("*/*"):
+                if not path.name.startswith(STAGING_PREFIX):
+                    yield path
+
+    def usage(self) -> int:
+        """Disk space used by the blobs (in bytes)"""
+        return sum(p.stat().st_size for p in self.blobs())
+
+    def dedup(self, project_dir: PathLike, excluded: Iterable[str] = ()) -> DedupReport:
+        """Replace the files in ``project_dir`` by links to the blobs with the same
+        contents, adding new blobs as necessary.
+
+        Args:
+            excluded: paths (relative to ``project_dir``, POSIX style) that are not
+                linked.
+        """
+        report = DedupReport()
+        for path in _files(Path(project_dir), set(excluded)):
+            report += self._add(path)
+        return report
+
+    def _add(self, path: Path) -> DedupReport:
+        info = path.stat()
+        size = info.st_size
+        mode = stat.S_IMODE(info.st_mode)
+        if self.link == "hardlink":
+            mode &= READ_ONLY  # the permissions are shared with the blob
+        blob = self.blob(_digest(path), mode)
+        if blob.exists():
+            if _same_file(path, blob) or self._replace(path, blob):
+                return DedupReport(1, size, 1, 0, size)
+            return DedupReport(1, size)
+
+        if self._store(path, blob, mode):
+            return DedupReport(1, size, 1, size, 0)
+        return DedupReport(1, size)
+
+    def _store(self, path: Path, blob: Path, mode: int) -> bool:
+        """Add ``path`` as a new blob"""
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        if self.link == "hardlink":
+            # The blob is made read-only, which would also affect other links to
+            # the file (e.g. in the template cache, see ``--cookiecutter-link``)
+            stream.break_link(path)
+            try:
+                os.link(str(path), str(blob))
+            except FileExistsError:  # a concurrent process added it first
+                return self._replace(path, blob)
+            except OSError:
+                return False  # e.g. different file systems
+            os.chmod(str(blob), mode)
+            return True
+
+        staging = blob.with_name(f"{STAGING_PREFIX}{os.getpid()}-{blob.name}")
+        if not stream.clone_file(path, staging):
+            return False
+        try:
+            os.link(str(staging), str(blob))
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(str(staging))
+        return True
+
+    def _replace(self, path: Path, blob: Path) -> bool:
+        """Replace ``path`` by a link to ``blob`` (atomically)"""
+        staging = path.with_name(f"{STAGING_PREFIX}{path.name}")
+        if self.link == "hardlink":
+            try:
+                os.link(str(blob), str(staging))
+            except OSError:
+                return False
+        elif not stream.clone_file(blob, staging):
+            return False
+        os.replace(str(staging), str(path))
+        return True
+
+
+def dedup_project(project_dir: PathLike, store: BlobStore, excluded=()) -> DedupReport:
+    """Deduplicate the files of a project and log the outcome"""
+    from .plan import format_size
+
+    report = store.dedup(project_dir, excluded)
+    logger.report(
+        "dedup",
+        f"{project_dir} ({report.linked}/{report.files} files linked, "
+        f"{format_size(report.saved)} saved)",
+    )
+    return report
+
+
+def _files(root: Path, excluded: set) -> Iterator[Path]:
+    for dirpath, dirnames, filenames in os.walk(str(root)):
+        dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+        for name in filenames:
+            path = Path(dirpath, name)
+            if path.is_symlink() or path.relative_to(root).as_posix() in excluded:
+                continue
+            yield path
+
+
+def _same_file(path: Path, blob: Path) -> bool:
+    try:
+        return os.path.samefile(str(path), str(blob))
+    except OSError:
+        return False
+
+
+def _digest(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(str(path), "rb") as file:
+        for chunk in iter(lambda: file.read(stream.CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
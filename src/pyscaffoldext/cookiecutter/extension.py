@@ -6,6 +6,21 @@ this argument should be a :obj:`dict` (or a similar object that can be converted
 via the :obj:`dict` constructor), and is equivalent to ``extra_context`` in
 :obj:`cookicookiecutter.main.cookiecutter` (PyScaffold will always add some default
 values, even when no ``cookiecutter_params`` are given).
+
+A :obj:`~.template.Template` object that was previously fetched can also be passed as
+``cookiecutter_template``, to avoid fetching/parsing the same template several times
+(see :obj:`~.batch.create_projects`).
+
+The actions registered by this extension never change the current working directory
+(the template is rendered directly into the parent folder of ``project_path``), so they
+are safe to be called concurrently from multiple threads. Please notice however that
+relative values of ``project_path`` are resolved against the working directory and
+that some of PyScaffold's own actions (e.g. the initialisation of the git repository)
+still change it.
+
+This module is imported by ``putup`` for every invocation (e.g. ``putup --help``),
+so it must stay lightweight: cookiecutter, Jinja and the other modules of this package
+are only imported when :obj:`create_cookiecutter` actually runs.
 """
 
 # This file was transfered from the main PyScaffold repository using
@@ -13,19 +28,26 @@ values, even when no ``cookiecutter_params`` are given).
 # commit history.
 # Please refer to ``pyscaffold`` if that is needed.
 
-from typing import Any, Dict, List
+import argparse
+from contextlib import nullcontext
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
 
-from pyscaffold import file_system as fs
 from pyscaffold.actions import Action, ActionParams, ScaffoldOpts, Structure
 from pyscaffold.extensions import Extension, store_with
 from pyscaffold.log import logger
 
+if TYPE_CHECKING:  # pragma: no cover
+    from .template import Template
+
 UPDATE_WARNING = (
     "Updating code generated using external tools is not "
     "supported. The extension `cookiecutter` will be ignored, only "
     "changes in PyScaffold core features will take place."
 )
 
+PLAN_WARNING = "Cannot fetch the template to plan the files it would produce"
+
 
 class Cookiecutter(Extension):
     """Additionally apply a Cookiecutter template.
@@ -50,32 +72,276 @@ class Cookiecutter(Extension):
             "--cookiecutter-params",
             nargs="+",
             required=False,
-            type=lambda kv: kv.split("=", 1),
+            type=parameter,
             help="extra parameters to be passed to cookiecutter in the form of "
             "a space separated list of 'NAME=VALUE' (check the `cookiecutter.json` "
             "file of the template you are using to see the available parameters). "
             "Please notice PyScaffold already add some default parameters, check the "
             "docs for more information.",
         )
+        parser.add_argument(
+            "--cookiecutter-ref",
+            metavar="REF",
+            help="branch, tag or commit of the template repository (only this "
+            "commit is fetched, without the history of the repository)",
+        )
+        parser.add_argument(
+            "--cookiecutter-directory",
+            metavar="DIR",
+            help="directory of the repository that contains the template "
+            "(`cookiecutter.json`), only this directory is fetched",
+        )
+        parser.add_argument(
+            "--cookiecutter-refresh",
+            action="store_true",
+            default=False,
+            help="fetch the template again, even if it is already cached locally",
+        )
+        parser.add_argument(
+            "--cookiecutter-mirror",
+            metavar="DIR",
+            help="use the template bundles stored in DIR instead of fetching remote "
+            "templates from the network (see `pyscaffoldext.cookiecutter.bundle`)",
+        )
+        parser.add_argument(
+            "--cookiecutter-result-cache",
+            action="store_true",
+            default=False,
+            help="reuse the files generated by previous runs with the same template "
+            "and parameters, instead of rendering the template again (templates "
+            "with hooks are always rendered)",
+        )
+        parser.add_argument(
+            "--cookiecutter-dedup",
+            metavar="STORE",
+            help="keep a single copy of identical files across projects in the STORE "
+            "directory, the files of the project become (read-only) hardlinks, or "
+            "reflinks with `--cookiecutter-link reflink`",
+        )
+        parser.add_argument(
+            "--cookiecutter-profile",
+            metavar="FILE",
+            help="write a JSON report with the time spent in each phase of the "
+            "project generation (e.g. fetching and rendering the template) to FILE",
+        )
+        parser.add_argument(
+            "--cookiecutter-in-memory",
+            action="store_true",
+            default=False,
+            help="merge the rendered template into the files generated by PyScaffold "
+            "before writing them (each file is written only once)",
+        )
+        parser.add_argument(
+            "--cookiecutter-precedence",
+            nargs="+",
+            metavar="POLICY",
+            type=precedence_rule,
+            help="which version is kept for files defined by both PyScaffold and the "
+            "template: `pyscaffold` (default), `template` or GLOB=POLICY rules for "
+            "individual files, e.g. 'setup.cfg=template' 'docs/*=pyscaffold' (the "
+            "first matching rule wins)",
+        )
+        parser.add_argument(
+            "--cookiecutter-max-memory",
+            metavar="SIZE",
+            type=memory_size,
+            help="limit the memory used for copying/rendering the template files "
+            "(e.g. 64M), files are streamed to the disk",
+        )
+        parser.add_argument(
+            "--cookiecutter-link",
+            choices=("copy", "reflink", "hardlink"),
+            help="materialize files that are not rendered (e.g. images) as "
+            "reflinks/hardlinks of the template files (copied when not possible). "
+            "Hardlinked files should not be modified in place",
+        )
+        parser.add_argument(
+            "--cookiecutter-skip-hooks",
+            nargs="*",
+            metavar="HOOK",
+            type=hook_name,
+            action=StoreHooks,
+            help="do not run the hooks of the template (only the given ones, e.g. "
+            "`post_gen_project`, or all of them when no name is given)",
+        )
+        parser.add_argument(
+            "--cookiecutter-hook-timeout",
+            nargs="+",
+            metavar="SECONDS",
+            type=hook_timeout,
+            help="fail when a hook script takes longer than SECONDS (killing it), "
+            "HOOK=SECONDS sets the timeout for a specific hook",
+        )
+        parser.add_argument(
+            "--cookiecutter-hook-isolated",
+            action="store_true",
+            default=False,
+            help="run the hooks without standard input and with a minimal "
+            "environment (e.g. PATH and HOME)",
+        )
+        parser.add_argument(
+            "--cookiecutter-hook-env",
+            nargs="+",
+            metavar="NAME=VALUE",
+            type=parameter,
+            help="environment variables for the hooks of the template",
+        )
+        parser.add_argument(
+            "--cookiecutter-jobs",
+            metavar="N",
+            type=int,
+            help="render the template files using N processes in parallel "
+            "(0 means one per CPU)",
+        )
 
     def activate(self, actions: List[Action]) -> List[Action]:
         """Register before_create hooks to generate project using Cookiecutter
         Activate extension. See :obj:`pyscaffold.extension.Extension.activate`."""
         actions = self.register(actions, enforce_options, before="get_default_options")
-        return self.register(actions, create_cookiecutter)
+        actions = self.register(actions, create_cookiecutter)
+        actions = self.register(actions, start_merge, before="create_structure")
+        actions = self.register(actions, end_merge, after="create_structure")
+        actions = self.register(actions, finish_cookiecutter, after="end_merge")
+        actions = self.register(actions, dedup_cookiecutter, before="report_done")
+        return self.register(actions, report_timings, after="report_done")
+
+
+def memory_size(value: str) -> int:
+    """Parse values like ``512K``, ``64M`` or ``1G`` given in the CLI"""
+    from argparse import ArgumentTypeError
+
+    from .stream import parse_size
+
+    try:
+        return parse_size(value)
+    except ValueError as ex:
+        raise ArgumentTypeError(str(ex)) from ex
+
+
+def precedence_rule(value: str) -> str:
+    """Validate policies and ``GLOB=POLICY`` rules given via
+    ``--cookiecutter-precedence``
+    """
+    from argparse import ArgumentTypeError
+
+    from .structure import Precedence
+
+    try:
+        Precedence.parse(value)
+    except ValueError as ex:
+        raise ArgumentTypeError(str(ex)) from ex
+    return value
+
+
+class StoreHooks(argparse.Action):
+    """Store the hooks given via ``--cookiecutter-skip-hooks`` (all of them when no
+    name is given, since PyScaffold ignores options with empty values)
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        if not values:
+            from .hooks import HOOKS
+
+            values = list(HOOKS)
+        setattr(namespace, self.dest, values)
+
+
+def hook_name(value: str) -> str:
+    """Validate hook names given via ``--cookiecutter-skip-hooks``"""
+    from argparse import ArgumentTypeError
+
+    from .hooks import HOOKS
+
+    if value not in HOOKS:
+        raise ArgumentTypeError(f"invalid hook {value!r}, use one of: {HOOKS}")
+    return value
+
+
+def hook_timeout(value: str) -> str:
+    """Validate ``SECONDS`` or ``HOOK=SECONDS`` given via
+    ``--cookiecutter-hook-timeout``
+    """
+    from argparse import ArgumentTypeError
+
+    from .hooks import parse_timeout
+
+    try:
+        parse_timeout(value)
+    except ValueError as ex:
+        raise ArgumentTypeError(str(ex)) from ex
+    return value
+
+
+def parameter(value: str) -> Tuple[str, str]:
+    """Parse ``NAME=VALUE`` pairs given in the CLI via ``--cookiecutter-params``"""
+    from argparse import ArgumentTypeError
+
+    name, sep, param = value.partition("=")
+    if not sep or not name.strip():
+        raise ArgumentTypeError(f"expected NAME=VALUE, got {value!r}")
+    return name.strip(), param
 
 
 def enforce_options(struct: Structure, opts: ScaffoldOpts) -> ActionParams:
     """Make sure options reflect the cookiecutter usage.
     See :obj:`pyscaffold.actions.Action`.
     """
-    opts["force"] = True
+    from .timing import Profile
+
+    profile = opts.get("cookiecutter_timings") or Profile.from_opts(opts)
+    with profile.span("enforce_options") if profile else nullcontext():
+        if not opts.get("cookiecutter_in_memory"):
+            # PyScaffold writes its files over the template rendered to the disk
+            opts["force"] = True
+        if opts.get("cookiecutter_params"):
+            # Iterators (e.g. ``zip``) can only be consumed once
+            opts["cookiecutter_params"] = dict(opts["cookiecutter_params"])
+        if opts.get("cookiecutter_hook_env"):
+            opts["cookiecutter_hook_env"] = dict(opts["cookiecutter_hook_env"])
+        if opts.get("cookiecutter_max_memory"):
+            from .stream import parse_size
+
+            opts["cookiecutter_max_memory"] = parse_size(
+                opts["cookiecutter_max_memory"]
+            )
+        if opts.get("cookiecutter_link"):
+            from .stream import link_mode
+
+            opts["cookiecutter_link"] = link_mode(opts["cookiecutter_link"])
+        if opts.get("cookiecutter_profile"):
+            # PyScaffold might change the working directory in the meantime
+            opts["cookiecutter_profile"] = Path(opts["cookiecutter_profile"]).resolve()
+        if opts.get("cookiecutter_dedup"):
+            opts["cookiecutter_dedup"] = Path(opts["cookiecutter_dedup"]).resolve()
+        if opts.get("cookiecutter_precedence"):
+            from .structure import Precedence
+
+            precedence = Precedence.parse(opts["cookiecutter_precedence"])
+            opts["cookiecutter_precedence"] = precedence
+        if opts.get("cookiecutter_directory"):
+            from .cache import clean_directory
+
+            directory = clean_directory(opts["cookiecutter_directory"])
+            opts["cookiecutter_directory"] = directory
+    if profile:
+        opts["cookiecutter_timings"] = profile
     return struct, opts
 
 
+def project_dir(opts: ScaffoldOpts) -> Path:
+    """Absolute path of ``project_path``, resolved only once per project
+    (the result is kept in the ``cookiecutter_project_dir`` option).
+    """
+    path = opts["project_path"]
+    cached = opts.get("cookiecutter_project_dir")
+    if cached is None or cached[0] != path:
+        cached = opts["cookiecutter_project_dir"] = (path, Path(path).resolve())
+    return cached[1]
+
+
 def parameters(opts: ScaffoldOpts) -> Dict[str, Any]:
     """Parameters to be passed to cookiecutter as ``extra_context``"""
-    project_name = opts["project_path"].resolve().name
+    project_name = project_dir(opts).name
     return {
         "full_name": opts["author"],
         "author": opts["author"],
@@ -98,24 +364,273 @@ def create_cookiecutter(struct: Structure, opts: ScaffoldOpts) -> ActionParams:
     See :obj:`pyscaffold.actions.Action`.
     """
     if opts.get("update"):
+        return update_cookiecutter(struct, opts)
+
+    try:
+        import cookiecutter  # noqa: F401
+    except Exception as e:
+        raise NotInstalled from e
+
+    from . import timing
+    from .structure import keep_files, template_owned
+    from .template import Template, check_cancelled
+    from .update import State, struct_paths
+
+    if not opts.get("cookiecutter"):
+        raise MissingTemplate
+
+    logger.report("run", "cookiecutter " + opts["cookiecutter"])
+    cancel = opts.get("cookiecutter_cancel")
+    profile = opts.get("cookiecutter_timings")
+    with opts.get("cookiecutter_unlocked", nullcontext)(), timing.activate(profile):
+        # ^ Rendering does not depend on the working dir, see the ``aio`` module
+        check_cancelled(cancel)
+        with timing.span("parameters"):
+            extra_context = parameters(opts)
+        template = opts.get("cookiecutter_template")
+        if template is None:
+            with timing.span("fetch", opts["cookiecutter"]):
+                try:
+                    template = Template.from_opts(opts)
+                except Exception as ex:
+                    if not opts.get("pretend"):
+                        raise
+                    logger.warning(f"{PLAN_WARNING}: {ex}")
+                    return struct, opts
+        # Fail before rendering anything, cookiecutter would silently ignore them
+        template.check_parameters(opts.get("cookiecutter_params") or {})
+        if opts.get("pretend"):
+            return plan_cookiecutter(struct, opts, template, extra_context)
+        if opts.get("cookiecutter_in_memory"):
+            return render_into_structure(struct, opts, template, extra_context)
+        project = generate_cookiecutter(opts, template, extra_context)
+        paths = struct_paths(struct)
+        produced = {p for p in paths if (project / p).is_file()}
+        owned = template_owned(paths, produced, opts.get("cookiecutter_precedence"))
+        struct = keep_files(struct, owned)
+        state = State.capture(template, extra_context, project, paths - owned)
+        state.dump(project)
+
+    return struct, opts
+
+
+def generate_cookiecutter(
+    opts: ScaffoldOpts, template: "Template", extra_context: Dict[str, Any]
+) -> Path:
+    """Render the template into the parent folder of the project, or restore the
+    output of a previous identical generation when the result cache is enabled
+    (see :mod:`~.results`).
+
+    As cookiecutter, it refuses to generate the project into an existing folder
+    (:obj:`cookiecutter.exceptions.OutputDirExistsException`).
+    """
+    from . import timing
+    from .hooks import HookPolicy
+    from .results import ResultCache
+
+    path = project_dir(opts)
+    results, key = ResultCache.from_opts(opts), None
+    if results and not path.exists():  # existing folders are rejected when rendering
+        with timing.span("context", template.name):
+            context = template.context_for(extra_context, path.parent)
+        key = results.key(template, context)
+        project = results.restore(key, path.parent) if key else None
+        if project:
+            return project
+
+    project = template.generate(
+        path.parent,
+        extra_context,
+        cancel=opts.get("cookiecutter_cancel"),
+        max_memory=opts.get("cookiecutter_max_memory"),
+        link=opts.get("cookiecutter_link"),
+        jobs=opts.get("cookiecutter_jobs", 1),
+        hooks=HookPolicy.from_opts(opts),
+    )
+    if results and key:
+        results.store(key, project)
+    return project
+
+
+def plan_cookiecutter(
+    struct: Structure,
+    opts: ScaffoldOpts,
+    template: "Template",
+    extra_context: Dict[str, Any],
+) -> ActionParams:
+    """Compute (and log) the files the template would produce, without writing
+    them (``pretend`` option), see :mod:`~.plan`.
+    """
+    from . import timing
+    from .plan import compute_plan
+
+    path = project_dir(opts)
+    with timing.span("plan", str(path)):
+        context = template.context_for(extra_context, path.parent)
+        plan = compute_plan(
+            template, context, struct, opts, opts.get("cookiecutter_cancel")
+        )
+    plan.report()
+    opts["cookiecutter_plan"] = plan
+    return struct, opts
+
+
+def render_into_structure(
+    struct: Structure,
+    opts: ScaffoldOpts,
+    template: "Template",
+    extra_context: Dict[str, Any],
+) -> ActionParams:
+    """Merge the rendered template into ``struct``, see :mod:`~.structure`.
+    The hooks and state that depend on the files being written are left for
+    :obj:`finish_cookiecutter`.
+    """
+    from .hooks import HookPolicy
+    from .structure import (
+        generate_structure,
+        merge_structure,
+        run_post_hooks,
+        template_owned,
+    )
+    from .update import State, struct_paths
+
+    path = project_dir(opts)
+    cancel = opts.get("cookiecutter_cancel")
+    max_memory = opts.get("cookiecutter_max_memory")
+    jobs = opts.get("cookiecutter_jobs", 1)
+    hooks = HookPolicy.from_opts(opts)
+    rendered, context = generate_structure(
+        template, path, extra_context, cancel, max_memory, jobs, hooks
+    )
+    precedence = opts.get("cookiecutter_precedence")
+    merged = merge_structure(struct, rendered, precedence)
+    paths = struct_paths(struct)
+    excluded = paths - template_owned(paths, struct_paths(rendered), precedence)
+
+    def finish():
+        run_post_hooks(template, path, context, hooks)
+        State.capture(template, extra_context, path, excluded).dump(path)
+
+    opts["cookiecutter_finish"] = finish
+    return merged, opts
+
+
+def update_cookiecutter(struct: Structure, opts: ScaffoldOpts) -> ActionParams:
+    """Update a project previously generated with :obj:`create_cookiecutter`,
+    see :mod:`~.update`.
+    """
+    from .update import State
+
+    path = project_dir(opts)
+    state = State.load(path)
+    if state is None:
         logger.warning(UPDATE_WARNING)
         return struct, opts
 
     try:
-        from cookiecutter.main import cookiecutter
+        import cookiecutter  # noqa: F401
     except Exception as e:
         raise NotInstalled from e
 
-    template = opts.get("cookiecutter")
-    if not template:
+    from .cache import TemplateCache
+    from .structure import keep_files, template_owned
+    from .template import Template
+    from .update import struct_paths, update
+
+    if not opts.get("cookiecutter"):
         raise MissingTemplate
 
-    logger.report("run", "cookiecutter " + opts["cookiecutter"])
-    if not opts.get("pretend"):
+    logger.report("update", "cookiecutter " + opts["cookiecutter"])
+    if state.directory and not opts.get("cookiecutter_directory"):
+        opts = {**opts, "cookiecutter_directory": state.directory}
+    template = opts.get("cookiecutter_template") or Template.from_opts(opts)
+    cache = TemplateCache.from_opts(opts)
+    pretend = bool(opts.get("pretend"))
+    # Files kept from the template are updated, instead of rewritten by PyScaffold
+    paths = struct_paths(struct)
+    owned = template_owned(paths, state.files, opts.get("cookiecutter_precedence"))
+    struct = keep_files(struct, owned)
+    excluded = paths - owned
+    # Parameters given again (e.g. ``--cookiecutter-params``) override the old ones
+    params = dict(opts.get("cookiecutter_params") or {})
+    template.check_parameters(params)
+    context = {**state.context, **params}
+    state = update(path, template, state, excluded, pretend, cache, context)
+    if not pretend:
+        state.dump(path)
+
+    return struct, opts
+
+
+def start_merge(struct: Structure, opts: ScaffoldOpts) -> ActionParams:
+    """Start timing PyScaffold's own files being written over the template.
+    Files that already exist with the same contents are not written again (see
+    :obj:`~.structure.skip_identical`).
+    See :obj:`pyscaffold.actions.Action`.
+    """
+    profile = opts.get("cookiecutter_timings")
+    if profile:
+        profile.begin("merge")
+    if opts.get("update") or not opts.get("cookiecutter_in_memory"):
+        from .structure import skip_identical_files
+
+        struct = skip_identical_files(struct)
+    return struct, opts
+
+
+def end_merge(struct: Structure, opts: ScaffoldOpts) -> ActionParams:
+    """Counterpart of :obj:`start_merge`. See :obj:`pyscaffold.actions.Action`."""
+    profile = opts.get("cookiecutter_timings")
+    if profile:
+        profile.end("merge")
+    return struct, opts
 
-        with fs.chdir(opts["project_path"].resolve().parent):
-            cookiecutter(template, no_input=True, extra_context=parameters(opts))
 
+def finish_cookiecutter(struct: Structure, opts: ScaffoldOpts) -> ActionParams:
+    """Run the ``post_gen_project`` hooks of templates rendered in memory
+    (see ``--cookiecutter-in-memory``), once PyScaffold has written the files.
+    See :obj:`pyscaffold.actions.Action`.
+    """
+    from . import timing
+
+    finish = opts.pop("cookiecutter_finish", None)
+    if finish and not opts.get("pretend"):
+        with timing.activate(opts.get("cookiecutter_timings")):
+            finish()
+    return struct, opts
+
+
+def dedup_cookiecutter(struct: Structure, opts: ScaffoldOpts) -> ActionParams:
+    """Replace the files of the finished project by links to a content-addressed
+    store (``--cookiecutter-dedup``), see :mod:`~.dedup`.
+    See :obj:`pyscaffold.actions.Action`.
+    """
+    if not opts.get("cookiecutter_dedup") or opts.get("pretend"):
+        return struct, opts
+
+    from . import timing
+    from .dedup import BlobStore, dedup_project
+    from .update import STATE_FILE, struct_paths
+
+    store = BlobStore(opts["cookiecutter_dedup"], opts.get("cookiecutter_link"))
+    path = project_dir(opts)
+    # PyScaffold rewrites its files in place (e.g. ``putup --update``)
+    excluded = {STATE_FILE, *struct_paths(struct)}
+    with timing.activate(opts.get("cookiecutter_timings")):
+        with timing.span("dedup", str(path)):
+            report = dedup_project(path, store, excluded=excluded)
+    opts["cookiecutter_dedup_report"] = report
+    return struct, opts
+
+
+def report_timings(struct: Structure, opts: ScaffoldOpts) -> ActionParams:
+    """Write the timing report requested via ``--cookiecutter-profile``.
+    See :obj:`pyscaffold.actions.Action`.
+    """
+    profile, path = opts.get("cookiecutter_timings"), opts.get("cookiecutter_profile")
+    if profile and path:
+        logger.report("profile", str(path))
+        profile.dump(Path(path))
     return struct, opts
 
 
@@ -0,0 +1,258 @@
+"""Controlled execution of the ``pre_gen_project``/``post_gen_project`` hooks.
+
+Cookiecutter runs the hooks of a template as scripts (after rendering them with
+Jinja), waiting for them without any time limit and passing down the whole
+environment of the current process. A hook that installs packages or accesses the
+network can therefore stall the generation of many projects. The
+:obj:`HookPolicy` (see :obj:`HookPolicy.from_opts`) allows:
+
+- skipping hooks (``cookiecutter_skip_hooks``, ``--cookiecutter-skip-hooks [HOOK ...]``
+  in the CLI, all the hooks when no name is given),
+- limiting the time each hook script can take (``cookiecutter_hook_timeout``,
+  ``--cookiecutter-hook-timeout SECONDS|HOOK=SECONDS``). Scripts that take longer
+  are killed, together with the processes they started, and fail the generation,
+- running the scripts in a controlled environment (``cookiecutter_hook_isolated``,
+  ``--cookiecutter-hook-isolated``): only a few essential variables (see
+  :obj:`ESSENTIAL_ENV`) are passed down and the scripts cannot read from the
+  standard input. Additional variables can be given via ``cookiecutter_hook_env``
+  (``--cookiecutter-hook-env NAME=VALUE``), also when the hooks are not isolated.
+
+The time taken by each hook script is reported in the logs (and recorded in the
+timing profile, see :mod:`~.timing`).
+"""
+import errno
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any, Dict, FrozenSet, Mapping, NamedTuple, Optional, Tuple
+
+from pyscaffold.actions import ScaffoldOpts
+from pyscaffold.log import logger
+
+from . import timing
+
+HOOKS = ("pre_gen_project", "post_gen_project")
+
+ESSENTIAL_ENV = (
+    "PATH",
+    "HOME",
+    "USER",
+    "LOGNAME",
+    "LANG",
+    "LC_ALL",
+    "LC_CTYPE",
+    "TMPDIR",
+    # Required for starting processes on Windows
+    "SYSTEMROOT",
+    "SYSTEMDRIVE",
+    "COMSPEC",
+    "PATHEXT",
+    "TEMP",
+    "TMP",
+    "USERPROFILE",
+)
+"""Environment variables passed down to isolated hooks"""
+
+Context = Dict[str, Any]
+
+
+class HookPolicy(NamedTuple):
+    """How the hooks of a template are executed (the default policy runs them as
+    cookiecutter does).
+    """
+
+    skip: FrozenSet[str] = frozenset()
+    """Hooks that are not executed"""
+    timeout: Optional[float] = None
+    """Maximum number of seconds each hook script can take"""
+    timeouts: Tuple[Tuple[str, float], ...] = ()
+    """Timeouts for specific hooks (``(hook, seconds)`` pairs)"""
+    isolated: bool = False
+    """Only pass down :obj:`ESSENTIAL_ENV` and close the standard input"""
+    env: Tuple[Tuple[str, str], ...] = ()
+    """Additional environment variables"""
+
+    @classmethod
+    def from_opts(cls, opts: ScaffoldOpts) -> "HookPolicy":
+        """Policy given by the ``cookiecutter_skip_hooks``, ``cookiecutter_hook_*``
+        options. Timeouts can be given as a number of seconds, ``"HOOK=SECONDS"``
+        strings, a list mixing them (as in the CLI) or a ``{hook: seconds}`` dict.
+        Skipped hooks are given as a list of names (``True`` or an empty list mean
+        all the hooks).
+        """
+        skip = opts.get("cookiecutter_skip_hooks")
+        if skip is True or (
+            isinstance(skip, (list, tuple, set, frozenset)) and not skip
+        ):
+            skip = HOOKS  # e.g. ``--cookiecutter-skip-hooks`` without names
+        elif isinstance(skip, str):
+            skip = [skip]
+        names = frozenset(_check_hook(name) for name in skip or ())
+
+        timeout, timeouts = None, []
+        value = opts.get("cookiecutter_hook_timeout")
+        if value is None:
+            value = []
+        elif isinstance(value, Mapping):
+            value = list(value.items())
+        elif isinstance(value, (str, int, float)):
+            value = [value]
+        for item in value:
+            if isinstance(item, str):
+                hook, seconds = parse_timeout(item)
+            elif isinstance(item, (int, float)):
+                hook, seconds = None, item
+            else:
+                hook, seconds = item
+            if seconds <= 0:
+                raise ValueError(f"Invalid timeout {seconds!r}, use a positive number")
+            if hook is None:
+                timeout = float(seconds)
+            else:
+                timeouts.append((_check_hook(hook), float(seconds)))
+
+        env = dict(opts.get("cookiecutter_hook_env") or {})
+        isolated = bool(opts.get("cookiecutter_hook_isolated"))
+        return cls(names, timeout, tuple(timeouts), isolated, tuple(env.items()))
+
+    def timeout_for(self, hook_name: str) -> Optional[float]:
+        """Timeout for the scripts of ``hook_name`` (``None`` means no limit)"""
+        return dict(self.timeouts).get(hook_name, self.timeout)
+
+    def environment(self) -> Optional[Dict[str, str]]:
+        """Environment of the hook scripts (``None`` means the current one)"""
+        if not self.isolated and not self.env:
+            return None
+        names = ESSENTIAL_ENV if self.isolated else os.environ
+        env = {name: os.environ[name] for name in names if name in os.environ}
+        env.update(self.env)
+        return env
+
+    def run(self, hook_name: str, script: Path, cwd: Path, context: Context):
+        """Render ``script`` with the ``context`` (as cookiecutter does) and run it in
+        the ``cwd`` folder, reporting how long it took.
+
+        Raises:
+            :obj:`cookiecutter.exceptions.FailedHookException`: if the script fails or
+                times out.
+        """
+        logger.report("hook", f"{hook_name} ({script.name})")
+        start = time.perf_counter()
+        with timing.span("hook", hook_name):
+            run_script_with_context(
+                script,
+                cwd,
+                context,
+                self.timeout_for(hook_name),
+                self.environment(),
+                self.isolated,
+            )
+        elapsed = time.perf_counter() - start
+        logger.report("done", f"{hook_name} ({script.name}) in {elapsed:.2f}s")
+
+
+def parse_timeout(value: str) -> Tuple[Optional[str], float]:
+    """Parse ``SECONDS`` or ``HOOK=SECONDS`` (see ``--cookiecutter-hook-timeout``)"""
+    hook, _, seconds = value.rpartition("=")
+    try:
+        timeout = float(seconds)
+    except ValueError:
+        timeout = -1
+    if timeout <= 0:
+        raise ValueError(f"expected SECONDS or HOOK=SECONDS, got {value!r}")
+    return (_check_hook(hook) if hook else None), timeout
+
+
+def run_script_with_context(
+    script: Path,
+    cwd: Path,
+    context: Context,
+    timeout: Optional[float] = None,
+    env: Optional[Dict[str, str]] = None,
+    isolated: bool = False,
+):
+    """Equivalent to :obj:`cookiecutter.hooks.run_script_with_context`, but the
+    script is killed after ``timeout`` seconds (with the processes it started) and
+    runs with the given ``env`` (and without standard input, when ``isolated``).
+    """
+    from cookiecutter.utils import create_env_with_context
+
+    source = script.read_text(encoding="utf-8")
+    contents = create_env_with_context(context).from_string(source).render(**context)
+    with NamedTemporaryFile("wb", suffix=script.suffix, delete=False) as file:
+        file.write(contents.encode("utf-8"))
+    try:
+        run_script(Path(file.name), cwd, timeout, env, isolated)
+    finally:
+        os.remove(file.name)
+
+
+def run_script(
+    script: Path,
+    cwd: Path,
+    timeout: Optional[float] = None,
+    env: Optional[Dict[str, str]] = None,
+    isolated: bool = False,
+):
+    """Equivalent to :obj:`cookiecutter.hooks.run_script`,
+    see :obj:`run_script_with_context`.
+    """
+    from cookiecutter.exceptions import FailedHookException
+    from cookiecutter.utils import make_executable
+
+    windows = sys.platform.startswith("win")
+    command = [sys.executable, str(script)] if script.suffix == ".py" else [str(script)]
+    make_executable(str(script))
+    options: Dict[str, Any] = dict(cwd=str(cwd), env=env, shell=windows)
+    if isolated:
+        options["stdin"] = subprocess.DEVNULL
+    if timeout is not None:
+        # The whole group of processes is killed when the timeout expires
+        if windows:  # pragma: no cover
+            options["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            options["start_new_session"] = True
+
+    try:
+        proc = subprocess.Popen(command, **options)  # nosec
+    except OSError as err:
+        msg = f"Hook script failed (error: {err})"
+        if err.errno == errno.ENOEXEC:
+            msg = "Hook script failed, might be an empty file or missing a shebang"
+        raise FailedHookException(msg) from err
+
+    try:
+        exit_status = proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        _kill(proc, windows)
+        raise FailedHookException(
+            f"Hook script failed (timed out after {timeout:g} seconds)"
+        )
+    except BaseException:  # e.g. KeyboardInterrupt
+        _kill(proc, windows or timeout is None)
+        raise
+    if exit_status != 0:
+        raise FailedHookException(f"Hook script failed (exit status: {exit_status})")
+
+
+def _check_hook(name: str) -> str:
+    if name not in HOOKS:
+        options = ", ".join(repr(h) for h in HOOKS)
+        raise ValueError(f"Invalid hook {name!r}, use one of: {options}")
+    return name
+
+
+def _kill(proc: subprocess.Popen, only_process: bool):
+    """Kill ``proc`` (and the processes it started, unless ``only_process``)"""
+    try:
+        if only_process:
+            proc.kill()
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:  # pragma: no cover
+        pass  # already finished
+    proc.wait()
@@ -0,0 +1,183 @@
+"""Plan of the files a template would produce, computed without writing them.
+
+When PyScaffold runs with the ``pretend`` option (``--pretend`` in the CLI), the
+template is rendered in memory only to find out which files would be created, their
+sizes, which of them would be replaced by PyScaffold's own files and how many bytes
+would be written in total. Hooks are not executed and nothing is written to the
+project folder (the template itself is still fetched into the local cache, if
+necessary).
+
+The :obj:`Plan` is logged and stored in the ``cookiecutter_plan`` option, so it can
+be inspected via the Python API (e.g. as a pre-flight check before a large
+:obj:`~.batch.create_projects` run, see :obj:`BatchResult.plan
+<.batch.BatchResult.plan>`)::
+
+    from pyscaffold.api import create_project
+
+    _, opts = create_project(opts, pretend=True)
+    plan = opts["cookiecutter_plan"]
+    print(len(plan.files), plan.write_volume)
+"""
+from pathlib import Path
+from threading import Event
+from typing import Dict, List, NamedTuple, Optional
+
+from pyscaffold.actions import ScaffoldOpts, Structure
+from pyscaffold.log import logger
+from pyscaffold.structure import reify_leaf
+
+from .extension import project_dir
+from .structure import Precedence, walk_template
+from .template import Context, Template, check_cancelled, number_of_workers
+
+
+class PlannedFile(NamedTuple):
+    """File that would be produced by the template"""
+
+    path: str
+    """Path relative to the project folder (POSIX style)"""
+    size: int
+    """Size in bytes (after rendering)"""
+    verbatim: bool = False
+    """Copied without rendering (binary or ``_copy_without_render``)"""
+    overridden: bool = False
+    """Replaced by PyScaffold's own version of the file"""
+
+
+class Plan(NamedTuple):
+    """Files that would be produced when generating a project"""
+
+    project_dir: Path
+    files: List[PlannedFile]
+    """Files produced by the template"""
+    pyscaffold_files: Dict[str, int]
+    """Files written by PyScaffold (path and size)"""
+    in_memory: bool = False
+    """The template would be merged into PyScaffold's structure before writing"""
+
+    @property
+    def overridden(self) -> List[str]:
+        """Files of the template replaced by PyScaffold"""
+        return [f.path for f in self.files if f.overridden]
+
+    @property
+    def template_size(self) -> int:
+        """Total size of the files produced by the template"""
+        return sum(f.size for f in self.files)
+
+    @property
+    def write_volume(self) -> int:
+        """Estimate of the number of bytes written to the disk. When the template is
+        rendered to the disk, overridden files are written twice.
+        """
+        written = (f for f in self.files if not (self.in_memory and f.overridden))
+        return sum(f.size for f in written) + sum(self.pyscaffold_files.values())
+
+    def report(self):
+        """Log the plan (one line per file, followed by a summary)"""
+        for file in self.files:
+            action = "override" if file.overridden else "plan"
+            logger.report(action, f"{file.path} ({format_size(file.size)})")
+        summary = (
+            f"{len(self.files)} files from the template "
+            f"({format_size(self.template_size)}), "
+            f"{len(self.overridden)} overridden by PyScaffold, "
+            f"{format_size(self.write_volume)} to write"
+        )
+        logger.report("plan", summary)
+
+
+def compute_plan(
+    template: Template,
+    context: Context,
+    struct: Structure,
+    opts: ScaffoldOpts,
+    cancel: Optional[Event] = None,
+) -> Plan:
+    """Plan for the files produced by ``template`` (rendered with ``context``) and
+    PyScaffold (``struct``), see :obj:`Plan`.
+    """
+    project = project_dir(opts)
+    in_memory = bool(opts.get("cookiecutter_in_memory"))
+    precedence = Precedence.parse(opts.get("cookiecutter_precedence"))
+    pyscaffold_files = structure_sizes(struct, opts)
+
+    dirs = set()
+    files: Dict[str, PlannedFile] = {}
+    rendered: Dict[str, str] = {}  # path in the project -> path in the template
+    for entry in walk_template(template, context, cancel):
+        path = entry.target.as_posix()
+        if entry.kind == "dir":
+            dirs.add(path)
+            continue
+        if not entry.target.name or path in dirs:
+            continue  # The rendered file name is empty
+        template_wins = precedence.winner(path) == "template"
+        overridden = path in pyscaffold_files and not template_wins
+        verbatim = entry.kind == "copy" or entry.relpath is None
+        size = entry.source.stat().st_size if verbatim else 0
+        files[path] = PlannedFile(path, size, verbatim, overridden)
+        rendered.pop(path, None)
+        if not verbatim:
+            rendered[path] = str(entry.relpath)
+
+    jobs = opts.get("cookiecutter_jobs", 1)
+    sizes = _rendered_sizes(template, context, list(rendered.values()), jobs, cancel)
+    for path, size in zip(rendered, sizes):
+        files[path] = files[path]._replace(size=size)
+
+    pyscaffold_files = {
+        path: size
+        for path, size in pyscaffold_files.items()
+        if path not in files or precedence.winner(path) != "template"
+    }
+    planned = sorted(files.values())
+    return Plan(project, planned, pyscaffold_files, in_memory)
+
+
+def structure_sizes(struct: Structure, opts: ScaffoldOpts, prefix="") -> Dict[str, int]:
+    """Size of each file defined in a PyScaffold structure
+    (files with ``None`` contents are not written and therefore ignored).
+    """
+    sizes: Dict[str, int] = {}
+    for name, node in struct.items():
+        path = f"{prefix}{name}"
+        if isinstance(node, dict):
+            sizes.update(structure_sizes(node, opts, f"{path}/"))
+            continue
+        contents, _ = reify_leaf(node, opts)
+        if contents is not None:
+            sizes[path] = len(contents.encode("utf-8"))
+    return sizes
+
+
+def _rendered_sizes(
+    template: Template,
+    context: Context,
+    relpaths: List[str],
+    jobs: Optional[int] = 1,
+    cancel: Optional[Event] = None,
+) -> List[int]:
+    from cookiecutter.exceptions import UndefinedVariableInTemplate
+    from jinja2.exceptions import UndefinedError
+
+    if number_of_workers(jobs) > 1:
+        return template.in_parallel("rendered_size", relpaths, context, jobs, cancel)
+
+    sizes = []
+    for relpath in relpaths:
+        check_cancelled(cancel)
+        try:
+            sizes.append(template.rendered_size(relpath, context))
+        except UndefinedError as err:
+            msg = f"Unable to create file '{relpath}'"
+            raise UndefinedVariableInTemplate(msg, err, context) from err
+    return sizes
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            break
+        size /= 1024
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
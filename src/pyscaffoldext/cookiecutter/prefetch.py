@@ -0,0 +1,130 @@
+"""Warm the template cache ahead of time (e.g. while building a container image).
+
+Each template is fetched into the cache (see :obj:`~.cache.TemplateCache`), validated
+(``cookiecutter.json``, default values, file names and Jinja syntax of all files) and
+compiled into a snapshot (see :mod:`~.snapshot`), so later runs of
+:obj:`~.extension.create_cookiecutter` start straight from the local copy.
+Templates are prefetched concurrently (fetching is mostly waiting for the network
+and git)::
+
+    from pyscaffoldext.cookiecutter.prefetch import prefetch
+
+    for result in prefetch(["gh:org/service-template", "gh:org/lib-template"]):
+        print(result.source, "ok" if result.ok else result.error)
+
+The same is available in the command line via ``putup-cookiecutter prefetch``
+(see :mod:`~.cli`).
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from pyscaffold.log import logger
+
+from .cache import TemplateCache, disk_usage
+from .plan import format_size
+from .structure import walk_template
+from .template import Template
+
+
+class PrefetchResult(NamedTuple):
+    """Outcome of prefetching a single template"""
+
+    source: str
+    duration: float
+    """Time spent fetching, validating and compiling the template (in seconds)"""
+    path: Optional[Path] = None
+    """Local directory of the template"""
+    commit: Optional[str] = None
+    size: int = 0
+    """Size of the template on disk (in bytes)"""
+    files: int = 0
+    """Number of files in the template"""
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def prefetch(
+    templates: Iterable[str],
+    checkout: Optional[str] = None,
+    refresh: bool = False,
+    cache: Optional[TemplateCache] = None,
+    workers: Optional[int] = None,
+    directory: Optional[str] = None,
+) -> Iterator[PrefetchResult]:
+    """Fetch, validate and compile ``templates`` into the cache.
+
+    Args:
+        templates: paths/URLs of the templates (as in ``--cookiecutter``).
+        checkout: ref of the templates (branch, tag or commit), if any.
+        refresh: fetch the templates again even if they are already cached.
+        cache: cache where the templates are stored (the default one if not given).
+        workers: number of threads used to prefetch templates concurrently (``None``
+            means the default of :obj:`~concurrent.futures.ThreadPoolExecutor`).
+        directory: directory of the repositories containing the templates, if any.
+
+    Returns:
+        Iterator with the results of each template, in the same order as ``templates``
+        (failures are reported in :obj:`PrefetchResult.error` instead of raised).
+    """
+    cache = cache or TemplateCache()
+    sources = list(dict.fromkeys(templates))  # the same template is fetched once
+    if workers == 1 or len(sources) <= 1:
+        for source in sources:
+            yield _prefetch(source, checkout, refresh, cache, directory)
+        return
+
+    with ThreadPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(_prefetch, source, checkout, refresh, cache, directory)
+            for source in sources
+        ]
+        for future in futures:
+            yield future.result()
+
+
+def validate(template: Template):
+    """Make sure the template can be rendered with its default values
+    (without rendering the contents of the files).
+    """
+    from jinja2.exceptions import TemplateSyntaxError
+
+    context = template.context_for()
+    for entry in walk_template(template, context):
+        if entry.kind == "render" and entry.relpath is not None:
+            relpath = str(entry.relpath).replace(os.sep, "/")
+            try:
+                template.environment.get_template(relpath)
+            except TemplateSyntaxError as ex:
+                ex.translated = False  # Verbose information about the error location
+                raise
+
+
+def _prefetch(
+    source: str,
+    checkout: Optional[str],
+    refresh: bool,
+    cache: TemplateCache,
+    directory: Optional[str] = None,
+) -> PrefetchResult:
+    start = perf_counter()
+    try:
+        template = Template.fetch(source, checkout, refresh, cache, directory=directory)
+        validate(template)
+    except Exception as ex:
+        logger.error(f"{source}: {ex!r}")
+        return PrefetchResult(source, perf_counter() - start, error=ex)
+
+    size = disk_usage(template.repo_dir)
+    files = len(template.snapshot.files) if template.snapshot else 0
+    duration = perf_counter() - start
+    logger.report(
+        "prefetch", f"{source} ({files} files, {format_size(size)}, {duration:.2f}s)"
+    )
+    path, commit = template.repo_dir, template.commit
+    return PrefetchResult(source, duration, path, commit, size, files)
@@ -0,0 +1,289 @@
+"""Cache of generated projects, for repeated identical generations.
+
+When enabled (``--cookiecutter-result-cache`` in the CLI, ``cookiecutter_result_cache``
+in the Python API), the files produced by the template are stored in an archive after
+the project is generated. Later generations with the same template (same files,
+see :func:`~.snapshot.fingerprint`) and the same context (``cookiecutter.json``
+combined with ``cookiecutter_params`` and PyScaffold's default parameters) restore
+the archive instead of rendering the template again.
+
+Only the template output is cached: PyScaffold's own files are still generated
+normally. Templates with ``pre/post_gen_project`` hooks are never cached (the effects
+of the hooks cannot be replayed), and neither are projects generated into folders that
+already exist. The folder where the project is generated (``cookiecutter._output_dir``)
+is not part of the key, so templates should not depend on it.
+
+Archives are stored inside the template cache (``results`` folder, see
+:obj:`~.cache.TemplateCache`) unless ``cookiecutter_result_cache_dir`` is given.
+Entries older than ``max_age`` seconds are removed, as are the least recently used
+ones once the archives grow beyond ``max_size`` bytes. The number of hits and
+misses is recorded in a ``stats.json`` file (see :obj:`ResultCache.stats`).
+"""
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import time
+from pathlib import Path
+from tempfile import mkstemp
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Union
+
+from pyscaffold.actions import ScaffoldOpts
+from pyscaffold.log import logger
+
+from . import snapshot as snapshots
+from . import timing
+from .template import Context, Template
+
+PathLike = Union[str, os.PathLike]
+
+FORMAT_VERSION = 1
+RESULTS_DIRNAME = "results"
+STATS_FILE = "stats.json"
+ARCHIVE_SUFFIX = ".tar"
+META_SUFFIX = ".json"
+
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+"""Age (in seconds) after which a stored project is removed (30 days)"""
+
+DEFAULT_MAX_SIZE = 1024**3
+"""Size (in bytes) after which the least recently used projects are removed (1 GiB)"""
+
+_STATS_LOCK = Lock()
+
+
+class ResultEntry:
+    """Archive of a generated project, with an accompanying metadata file
+    (its modification time records the last time the entry was used).
+    """
+
+    def __init__(self, root: Path, key: str, meta: dict):
+        self.root = root
+        self.key = key
+        self.meta = meta
+
+    @classmethod
+    def load(cls, root: Path, key: str) -> Optional["ResultEntry"]:
+        try:
+            text = (root / f"{key}{META_SUFFIX}").read_text(encoding="utf-8")
+            return cls(root, key, json.loads(text))
+        except (OSError, ValueError):
+            return None
+
+    @property
+    def archive(self) -> Path:
+        return self.root / f"{self.key}{ARCHIVE_SUFFIX}"
+
+    @property
+    def size(self) -> int:
+        return self.meta["size"]
+
+    @property
+    def created(self) -> float:
+        return self.meta["created"]
+
+    @property
+    def last_used(self) -> float:
+        try:
+            return (self.root / f"{self.key}{META_SUFFIX}").stat().st_mtime
+        except OSError:
+            return self.created
+
+    def touch(self):
+        try:
+            os.utime(self.root / f"{self.key}{META_SUFFIX}")
+        except OSError:  # pragma: no cover
+            pass  # Removed in the meantime by a concurrent eviction
+
+    def remove(self):
+        for path in (self.root / f"{self.key}{META_SUFFIX}", self.archive):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+class ResultCache:
+    """Archives of previously generated projects.
+
+    Args:
+        root: directory where the archives are stored.
+        max_age: age in seconds after which entries are removed.
+        max_size: size in bytes after which least recently used entries are removed.
+    """
+
+    def __init__(
+        self,
+        root: PathLike,
+        max_age: float = DEFAULT_MAX_AGE,
+        max_size: int = DEFAULT_MAX_SIZE,
+    ):
+        self.root = Path(root)
+        self.max_age = max_age
+        self.max_size = max_size
+
+    @classmethod
+    def from_opts(cls, opts: ScaffoldOpts) -> Optional["ResultCache"]:
+        """Result cache configured in ``opts`` (``None`` when it is not enabled)"""
+        if not opts.get("cookiecutter_result_cache"):
+            return None
+        from .cache import TemplateCache
+
+        root = opts.get("cookiecutter_result_cache_dir")
+        return cls(
+            root or TemplateCache.from_opts(opts).root / RESULTS_DIRNAME,
+            opts.get("cookiecutter_result_cache_max_age") or DEFAULT_MAX_AGE,
+            opts.get("cookiecutter_result_cache_max_size") or DEFAULT_MAX_SIZE,
+        )
+
+    def key(self, template: Template, context: Context) -> Optional[str]:
+        """Identifier of the project generated by ``template`` with ``context``
+        (``None`` if the output cannot be cached, e.g. the template has hooks).
+        """
+        if template.hooks("pre_gen_project") or template.hooks("post_gen_project"):
+            return None
+        if template.snapshot:
+            fingerprint = template.snapshot.meta["fingerprint"]
+        else:
+            fingerprint = snapshots.fingerprint(template.repo_dir)
+        obj = {k: v for k, v in context["cookiecutter"].items() if k != "_output_dir"}
+        ident = [FORMAT_VERSION, str(template.repo_dir), fingerprint, obj, os.linesep]
+        text = json.dumps(ident, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+    def entries(self) -> Iterator[ResultEntry]:
+        if not self.root.is_dir():
+            return
+        for path in self.root.glob(f"*{META_SUFFIX}"):
+            if path.name == STATS_FILE or path.name.startswith(".tmp-"):
+                continue
+            entry = ResultEntry.load(self.root, path.stem)
+            if entry:
+                yield entry
+
+    def restore(self, key: str, output_dir: PathLike) -> Optional[Path]:
+        """Extract the project stored for ``key`` into ``output_dir``
+
+        Returns:
+            Path to the restored project, or ``None`` when there is no such project.
+        """
+        entry = ResultEntry.load(self.root, key)
+        if entry is None or not _is_complete(entry):
+            self._count("misses")
+            return None
+
+        project = Path(output_dir, entry.meta["project"])
+        with timing.span("restore", str(project)):
+            logger.report("restore", f"{project} (result cache)")
+            with tarfile.open(str(entry.archive)) as archive:
+                _extract_all(archive, Path(output_dir))
+        entry.touch()
+        self._count("hits")
+        return project
+
+    def store(self, key: str, project_dir: PathLike) -> ResultEntry:
+        """Store the files in ``project_dir`` for ``key``"""
+        project = Path(project_dir)
+        self.root.mkdir(parents=True, exist_ok=True)
+        with timing.span("store", str(project)):
+            fd, staging = mkstemp(prefix=".tmp-", suffix=ARCHIVE_SUFFIX, dir=self.root)
+            os.close(fd)
+            try:
+                with tarfile.open(staging, "w") as archive:
+                    archive.add(str(project), arcname=project.name)
+                meta = {
+                    "project": project.name,
+                    "created": time.time(),
+                    "size": os.path.getsize(staging),
+                }
+                os.replace(staging, str(self.root / f"{key}{ARCHIVE_SUFFIX}"))
+            finally:
+                if os.path.exists(staging):
+                    os.unlink(staging)
+            meta_file = self.root / f"{key}{META_SUFFIX}"
+            meta_file.write_text(json.dumps(meta), encoding="utf-8")
+
+        self.evict(keep=key)
+        return ResultEntry(self.root, key, meta)
+
+    def evict(self, keep: Optional[str] = None) -> List[ResultEntry]:
+        """Remove stale entries and, if the cache is still too big, the least recently
+        used ones. The entry identified by ``keep`` is never removed.
+        """
+        now = time.time()
+        removed, remaining = [], []
+        for entry in self.entries():
+            if entry.key != keep and (now - entry.created) > self.max_age:
+                removed.append(entry)
+            else:
+                remaining.append(entry)
+
+        total = sum(e.size for e in remaining)
+        for entry in sorted(remaining, key=lambda e: e.last_used):
+            if total <= self.max_size:
+                break
+            if entry.key != keep:
+                removed.append(entry)
+                total -= entry.size
+
+        for entry in removed:
+            entry.remove()
+        if removed:
+            self._count("evictions", len(removed))
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """Number of ``hits``, ``misses`` and ``evictions`` recorded so far, and the
+        current number of ``entries`` and their total ``size`` (in bytes).
+        """
+        try:
+            text = (self.root / STATS_FILE).read_text(encoding="utf-8")
+            counters = json.loads(text)
+        except (OSError, ValueError):
+            counters = {}
+        entries = list(self.entries())
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": len(entries),
+            "size": sum(e.size for e in entries),
+        }
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _count(self, counter: str, increment: int = 1):
+        """Update the counters in the stats file (atomically replaced, concurrent
+        processes might occasionally miss an increment).
+        """
+        path = self.root / STATS_FILE
+        with _STATS_LOCK:
+            try:
+                counters = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                counters = {}
+            counters[counter] = counters.get(counter, 0) + increment
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+                staging = path.with_name(f".tmp-{os.getpid()}-{STATS_FILE}")
+                staging.write_text(json.dumps(counters), encoding="utf-8")
+                os.replace(str(staging), str(path))
+            except OSError as ex:  # pragma: no cover
+                logger.warning(f"Impossible to update the result cache stats ({ex})")
+
+
+def _is_complete(entry: ResultEntry) -> bool:
+    try:
+        return entry.archive.stat().st_size == entry.size
+    except OSError:
+        return False
+
+
+def _extract_all(archive: tarfile.TarFile, dest: Path):
+    if hasattr(tarfile, "data_filter"):
+        archive.extractall(str(dest), filter="data")
+    else:  # pragma: no cover
+        archive.extractall(str(dest))
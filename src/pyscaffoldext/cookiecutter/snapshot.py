@@ -0,0 +1,170 @@
+"""Precompiled snapshots of cookiecutter templates.
+
+Before rendering, cookiecutter has to parse ``cookiecutter.json``, walk the template
+tree, detect binary files/newlines and compile every file with Jinja. A snapshot
+stores the results of this work in a directory next to the template, so later runs
+can render straight away:
+
+- ``snapshot.json`` contains the parsed context and a manifest of the template files
+  (in the same order :obj:`os.walk` would produce them),
+- ``bytecode`` is a :obj:`jinja2.FileSystemBytecodeCache` with the compiled templates.
+
+Snapshots are identified by a fingerprint of the template files (names, sizes and
+modification times), so changes in the template automatically invalidate them.
+See :obj:`.template.Template.compile`.
+"""
+import hashlib
+import json
+import os
+import shutil
+from collections import OrderedDict
+from pathlib import Path
+from tempfile import mkdtemp
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+VERSION = 1
+"""Format of the snapshot, snapshots with other versions are ignored"""
+
+SNAPSHOT_FILE = "snapshot.json"
+BYTECODE_DIR = "bytecode"
+STAGING_PREFIX = ".tmp-"
+IGNORED_DIRS = (".git", ".hg")
+
+Walk = Iterator[Tuple[str, List[str], List[str]]]
+
+
+class Snapshot:
+    """Precompiled template stored in ``path``"""
+
+    def __init__(self, path: Path, meta: dict):
+        self.path = path
+        self.meta = meta
+
+    @classmethod
+    def load(cls, path: Path, repo_dir: Path) -> Optional["Snapshot"]:
+        """Load the snapshot in ``path`` if it is still valid for ``repo_dir``"""
+        try:
+            text = (path / SNAPSHOT_FILE).read_text(encoding="utf-8")
+            meta = json.loads(text, object_pairs_hook=OrderedDict)
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != VERSION or meta.get("repo_dir") != str(repo_dir):
+            return None
+        if meta.get("fingerprint") != fingerprint(repo_dir):
+            return None
+        return cls(path, meta)
+
+    @property
+    def context(self) -> "OrderedDict[str, Any]":
+        """Parsed ``cookiecutter.json``"""
+        return self.meta["context"]
+
+    @property
+    def template_dir(self) -> str:
+        """Name of the directory with the files to be rendered"""
+        return self.meta["template_dir"]
+
+    @property
+    def files(self) -> Dict[str, dict]:
+        """Information about each file (relative to :obj:`template_dir`):
+        ``binary`` and ``newline`` (as detected by cookiecutter).
+        """
+        return self.meta["files"]
+
+    @property
+    def bytecode_dir(self) -> Path:
+        return self.path / BYTECODE_DIR
+
+    def bytecode_cache(self):
+        from jinja2 import FileSystemBytecodeCache
+
+        return FileSystemBytecodeCache(str(self.bytecode_dir))
+
+    def walk(self) -> Walk:
+        """Equivalent to :obj:`os.walk` (top-down) over :obj:`template_dir`, with
+        paths relative to it. As in :obj:`os.walk`, removing names from the yielded
+        list of directories prevents them from being visited.
+        """
+        pruned: List[str] = []
+        for root, dirs, files in self.meta["tree"]:
+            if any(_is_inside(root, p) for p in pruned):
+                continue
+            visit = list(dirs)
+            yield root, visit, list(files)
+            removed = (d for d in dirs if d not in visit)
+            pruned.extend(os.path.normpath(os.path.join(root, d)) for d in removed)
+
+
+def create(dest: Path, repo_dir: Path, context: dict, template_dir: Path) -> Snapshot:
+    """Create a snapshot for the template in ``repo_dir`` (``context`` is its parsed
+    ``cookiecutter.json``). Jinja bytecode is added later, when templates are first
+    compiled with :obj:`Snapshot.bytecode_cache`.
+    """
+    from binaryornot.check import is_binary
+
+    from .template import detect_newline
+
+    tree, files = [], {}
+    for root, dirs, names in os.walk(str(template_dir)):
+        dirs.sort()
+        names.sort()
+        rel_root = os.path.relpath(root, str(template_dir))
+        tree.append([rel_root, list(dirs), list(names)])
+        for name in names:
+            path = os.path.join(root, name)
+            binary = is_binary(path)
+            newline = None if binary else detect_newline(Path(path))
+            relpath = os.path.normpath(os.path.join(rel_root, name))
+            files[relpath] = {"binary": binary, "newline": newline}
+
+    meta = {
+        "version": VERSION,
+        "repo_dir": str(repo_dir),
+        "fingerprint": fingerprint(repo_dir),
+        "template_dir": template_dir.name,
+        "context": context,
+        "tree": tree,
+        "files": files,
+    }
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(mkdtemp(prefix=STAGING_PREFIX, dir=str(dest.parent)))
+    try:
+        (staging / BYTECODE_DIR).mkdir()
+        (staging / SNAPSHOT_FILE).write_text(json.dumps(meta), encoding="utf-8")
+        _publish(staging, dest, repo_dir)
+    finally:
+        shutil.rmtree(str(staging), ignore_errors=True)
+
+    return Snapshot(dest, meta)
+
+
+def fingerprint(repo_dir: Path) -> str:
+    """Hash of the names, sizes and modification times of the template files"""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(str(repo_dir)):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            info = os.lstat(path)
+            relpath = os.path.relpath(path, str(repo_dir))
+            digest.update(f"{relpath}\0{info.st_size}\0{info.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def _is_inside(path: str, parent: str) -> bool:
+    return path == parent or path.startswith(parent + os.sep)
+
+
+def _publish(staging: Path, dest: Path, repo_dir: Path):
+    """Replace the (outdated) snapshot in ``dest``.
+    If a concurrent process publishes a snapshot first, its copy is kept (valid
+    snapshots might be in use, e.g. Jinja bytecode is still being written to them).
+    """
+    if dest.exists():
+        if Snapshot.load(dest, repo_dir):
+            return
+        shutil.rmtree(str(dest), ignore_errors=True)
+    try:
+        os.rename(str(staging), str(dest))
+    except OSError:
+        pass  # another process won the race
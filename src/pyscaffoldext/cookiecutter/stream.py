@@ -0,0 +1,264 @@
+"""Copy and write files using bounded memory, independently of their sizes.
+
+Templates might include large assets (e.g. vendored binaries or data fixtures) that
+are copied verbatim to the project. Instead of reading whole files, they are copied
+in kernel space when the platform supports it (:obj:`os.copy_file_range` or
+:obj:`os.sendfile`), or otherwise in chunks of a fixed size, reusing the same buffer.
+Rendered files are written as Jinja produces them (see
+:obj:`Template.stream_contents <.template.Template.stream_contents>`), instead of
+being joined into a single string first.
+
+Verbatim files can also be materialized as reflinks (copy-on-write clones, where the
+file system supports them) or hardlinks of the template files, saving both time and
+disk space when many projects are generated (see the ``cookiecutter_link`` option,
+``--cookiecutter-link`` in the CLI). Files are copied when the source and destination
+are in different file systems or links are not supported. Please notice hardlinked
+files share their contents with the (cached) template, so they should not be modified
+in place: files that are written again (e.g. by PyScaffold or when the project is
+updated) are replaced by independent copies first, see :obj:`break_link`.
+
+The ``cookiecutter_max_memory`` option (``--cookiecutter-max-memory SIZE`` in the CLI)
+limits the size of the buffers used for copying files and, when the template is
+rendered in memory (see :mod:`~.structure`), how much rendered text is kept in the
+project structure before it is written.
+"""
+import errno
+import os
+import re
+import shutil
+import stat
+import sys
+from pathlib import Path
+from tempfile import mkstemp
+from typing import Iterable, Optional, Union
+
+PathLike = Union[str, os.PathLike]
+
+CHUNK_SIZE = 1 << 20  # 1 MiB
+"""Default (and maximum) size of the buffer used for copying files"""
+ZERO_COPY_BLOCK = 1 << 30
+"""Maximum number of bytes copied in kernel space in a single system call"""
+
+LINK_MODES = ("copy", "reflink", "hardlink")
+FICLONE = 0x40049409
+"""``ioctl`` request for cloning files in Linux (see ``linux/fs.h``)"""
+
+UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+_SIZE = re.compile(r"^\s*(\d+)\s*([KMG]?)i?B?\s*$", re.I)
+_ZERO_COPY_ERRORS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EBADF,
+    errno.ENOTSOCK,  # e.g. ``sendfile`` in macOS
+    errno.ENOTSUP,
+    errno.EOPNOTSUPP,
+    errno.ETXTBSY,
+}
+_LINK_ERRORS = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EMLINK,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.ENOSYS,
+    errno.ENOTSUP,
+    errno.EOPNOTSUPP,
+}
+
+
+def parse_size(value: Union[str, int]) -> int:
+    """Number of bytes in a size like ``512``, ``64K``, ``256M`` or ``1GiB``"""
+    if isinstance(value, int):
+        return value
+    match = _SIZE.match(value)
+    if not match or int(match[1]) == 0:
+        raise ValueError(f"Invalid size: {value!r} (e.g. 512K, 256M or 1G)")
+    return int(match[1]) * UNITS[match[2].upper()]
+
+
+def link_mode(link: Optional[str] = None) -> str:
+    """Validate the ``link`` mode (see :obj:`LINK_MODES`), copies by default"""
+    link = link or LINK_MODES[0]
+    if link not in LINK_MODES:
+        options = ", ".join(repr(m) for m in LINK_MODES)
+        raise ValueError(f"Invalid link mode {link!r}, use one of: {options}")
+    return link
+
+
+def chunk_size(max_memory: Optional[int] = None) -> int:
+    """Size of the buffer used for copying files under the ``max_memory`` limit"""
+    return min(CHUNK_SIZE, max_memory) if max_memory else CHUNK_SIZE
+
+
+def copy_file(
+    src: PathLike,
+    dst: PathLike,
+    max_memory: Optional[int] = None,
+    link: Optional[str] = None,
+) -> Path:
+    """Copy contents and permissions of ``src`` to ``dst``
+    (similar to :obj:`shutil.copy`, but with bounded memory).
+
+    Args:
+        link: one of :obj:`LINK_MODES`, ``"reflink"`` and ``"hardlink"`` fall back to
+            a copy when the link cannot be created.
+    """
+    link = link_mode(link)
+    if link == "hardlink" and _hardlink(src, dst):
+        return Path(dst)
+
+    _unlink_shared(dst)
+    with open(str(src), "rb") as fsrc, open(str(dst), "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        if link == "reflink" and _reflink(fsrc.fileno(), fdst.fileno()):
+            copied = size
+        else:
+            copied = _zero_copy(fsrc.fileno(), fdst.fileno(), size)
+        if copied < size:
+            fsrc.seek(copied)
+            fdst.seek(copied)
+            _chunked_copy(fsrc, fdst, chunk_size(max_memory))
+    shutil.copymode(str(src), str(dst))
+    return Path(dst)
+
+
+def clone_file(src: PathLike, dst: PathLike) -> bool:
+    """Create ``dst`` as a reflink (copy-on-write clone) of ``src``.
+
+    Returns:
+        ``False`` (and ``dst`` is not created) when the file system does not support
+        reflinks.
+    """
+    with open(str(src), "rb") as fsrc, open(str(dst), "wb") as fdst:
+        cloned = _reflink(fsrc.fileno(), fdst.fileno())
+    if not cloned:
+        os.unlink(str(dst))
+        return False
+    shutil.copymode(str(src), str(dst))
+    return True
+
+
+def copy_tree(
+    src: PathLike,
+    dst: PathLike,
+    max_memory: Optional[int] = None,
+    link: Optional[str] = None,
+) -> Path:
+    """Copy a directory (see :obj:`shutil.copytree`) using :obj:`copy_file`"""
+
+    def _copy(source: str, dest: str):
+        copy_file(source, dest, max_memory, link)
+
+    shutil.copytree(str(src), str(dst), copy_function=_copy)
+    return Path(dst)
+
+
+def write_text(path: PathLike, chunks: Iterable[str], newline: Optional[str] = None):
+    """Write the text produced by ``chunks`` (e.g. a generator) as it comes"""
+    _unlink_shared(path)
+    with open(str(path), "w", encoding="utf-8", newline=newline) as file:
+        for chunk in chunks:
+            file.write(chunk)
+
+
+def break_link(path: PathLike) -> bool:
+    """Replace ``path`` by an independent copy when it is a hardlink (i.e. it shares
+    its contents with other paths, e.g. the template or a :mod:`~.dedup` store), so
+    it can be modified in place. The copy keeps the permissions of the file, but
+    it is always writable by its owner.
+
+    Returns:
+        ``True`` when the link was broken.
+    """
+    if not _is_shared(path):
+        return False
+    fd, tmp = mkstemp(dir=os.path.dirname(str(path)) or ".", prefix=".link-")
+    os.close(fd)
+    try:
+        copy_file(path, tmp)
+        os.chmod(tmp, stat.S_IMODE(os.stat(tmp).st_mode) | stat.S_IWUSR)
+        os.replace(tmp, str(path))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return True
+
+
+def _is_shared(path: PathLike) -> bool:
+    try:
+        info = os.lstat(str(path))
+    except FileNotFoundError:
+        return False
+    return stat.S_ISREG(info.st_mode) and info.st_nlink > 1
+
+
+def _unlink_shared(path: PathLike):
+    """Files that are completely rewritten do not need to be copied"""
+    if _is_shared(path):
+        os.unlink(str(path))
+
+
+def _zero_copy(src: int, dst: int, size: int) -> int:
+    """Copy in kernel space, returns the number of bytes copied (which is less than
+    ``size`` when the platform/file system does not support it).
+    """
+    copied = 0
+    for copy in (_copy_file_range, _sendfile):
+        try:
+            while copied < size:
+                sent = copy(src, dst, copied, min(size - copied, ZERO_COPY_BLOCK))
+                if sent == 0:
+                    break  # e.g. the file was truncated in the meantime
+                copied += sent
+            return copied
+        except (AttributeError, OSError) as ex:
+            if isinstance(ex, OSError) and ex.errno not in _ZERO_COPY_ERRORS:
+                raise
+            if copied:
+                return copied  # the remaining bytes are copied in chunks
+    return copied
+
+
+def _hardlink(src: PathLike, dst: PathLike) -> bool:
+    try:
+        if os.path.lexists(str(dst)):
+            os.unlink(str(dst))
+        os.link(str(src), str(dst))
+        return True
+    except OSError as ex:
+        if ex.errno in _LINK_ERRORS:
+            return False
+        raise
+
+
+def _reflink(src: int, dst: int) -> bool:
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+
+    try:
+        fcntl.ioctl(dst, FICLONE, src)
+        return True
+    except OSError as ex:
+        if ex.errno in _LINK_ERRORS | _ZERO_COPY_ERRORS:
+            return False
+        raise
+
+
+def _copy_file_range(src: int, dst: int, offset: int, count: int) -> int:
+    return os.copy_file_range(src, dst, count, offset, offset)  # type: ignore
+
+
+def _sendfile(src: int, dst: int, offset: int, count: int) -> int:
+    os.lseek(dst, offset, os.SEEK_SET)
+    return os.sendfile(dst, src, offset, count)  # type: ignore
+
+
+def _chunked_copy(fsrc, fdst, size: int):
+    buffer = memoryview(bytearray(size))
+    while True:
+        read = fsrc.readinto(buffer)
+        if not read:
+            break
+        fdst.write(buffer[:read])
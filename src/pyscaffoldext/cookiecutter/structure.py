@@ -0,0 +1,517 @@
+"""Render cookiecutter templates into PyScaffold's in-memory project structure.
+
+By default, the template is rendered straight to the disk and PyScaffold (forcefully)
+writes its own files afterwards, so files that exist in both are written twice. When
+the ``cookiecutter_in_memory`` option (``--cookiecutter-in-memory`` in the CLI) is
+used, the rendered template is instead merged into the :obj:`~pyscaffold.structure`
+dict received by the action, and PyScaffold's single writing pass
+(``create_structure``) produces the final tree, without forced overwrites.
+
+The ``cookiecutter_precedence`` option (``--cookiecutter-precedence`` in the CLI)
+decides which version is kept when PyScaffold and the template both define the same
+file, see :obj:`Precedence`:
+
+- ``"pyscaffold"`` (default): PyScaffold's files win,
+- ``"template"``: the files rendered from the template win,
+- ``GLOB=POLICY`` rules choose one of the policies above for individual files.
+
+The same policy applies when the template is rendered to the disk: PyScaffold does
+not write the files kept from the template (see :obj:`keep_files`), and files whose
+contents would not change are not written again (see :obj:`skip_identical`), so their
+modification time is preserved.
+
+Rendered files keep the newlines and permissions of the original template files, and
+binary (or ``_copy_without_render``) files are copied when the structure is written.
+When ``cookiecutter_max_memory`` is given, rendered text is only kept in the structure
+up to that limit: the remaining files are rendered when the structure is written
+(streamed to the disk, see :mod:`~.stream`) and have empty contents in the structure.
+Since nothing is written before ``create_structure``, ``pre_gen_project`` hooks run in
+a temporary folder, while ``post_gen_project`` hooks run in the project folder once
+the structure is written.
+"""
+import os
+import shutil
+from fnmatch import fnmatchcase
+from functools import partial
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Event
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Container,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from pyscaffold import file_system as fs
+from pyscaffold.actions import ScaffoldOpts, Structure
+from pyscaffold.log import logger
+from pyscaffold.operations import FileContents, FileOp
+from pyscaffold.structure import Leaf, resolve_leaf
+
+from . import stream, timing
+from .template import Context, Template, check_cancelled, number_of_workers
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .hooks import HookPolicy
+
+PRECEDENCE = ("pyscaffold", "template")
+
+
+class Precedence(NamedTuple):
+    """Which version of a file is kept when both PyScaffold and the template define
+    it. The first of the ``rules`` (``(glob, policy)`` pairs) that matches the path of
+    the file (relative to the project folder, POSIX style) decides, otherwise the
+    ``default`` policy is used. Policies are ``"pyscaffold"`` or ``"template"``.
+    Globs are matched with :obj:`~fnmatch.fnmatchcase` (``*`` also matches ``/``).
+    """
+
+    default: str = PRECEDENCE[0]
+    rules: Tuple[Tuple[str, str], ...] = ()
+
+    @classmethod
+    def parse(cls, value: "PrecedenceSpec" = None) -> "Precedence":
+        """Create a policy from a single policy name, ``"GLOB=POLICY"`` strings (or
+        ``(glob, policy)`` pairs), a list mixing them (as given in the CLI) or a
+        ``{glob: policy}`` dict. ``None`` means the default policy.
+        """
+        if value is None:
+            return cls()
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, str):
+            value = [value]
+        elif isinstance(value, Mapping):
+            value = list(value.items())
+
+        default, rules = PRECEDENCE[0], []
+        for item in value:
+            if isinstance(item, str):
+                glob, sep, policy = item.rpartition("=")
+                if not sep:
+                    default = _check_policy(item)
+                    continue
+            else:
+                glob, policy = item
+            if not glob:
+                raise ValueError(f"Invalid precedence rule {item!r}, use GLOB=POLICY")
+            rules.append((glob, _check_policy(policy)))
+        return cls(default, tuple(rules))
+
+    def winner(self, path: str) -> str:
+        """Policy for the file in ``path`` (relative to the project folder)"""
+        for glob, policy in self.rules:
+            if fnmatchcase(path, glob):
+                return policy
+        return self.default
+
+
+PrecedenceSpec = Union[
+    None, str, Precedence, Mapping[str, str], Iterable[Union[str, Tuple[str, str]]]
+]
+
+
+def generate_structure(
+    template: Template,
+    project_dir: Path,
+    extra_context: Optional[Context] = None,
+    cancel: Optional[Event] = None,
+    max_memory: Optional[int] = None,
+    jobs: Optional[int] = 1,
+    hooks: Optional["HookPolicy"] = None,
+) -> Tuple[Structure, Context]:
+    """Equivalent to :obj:`Template.generate <.template.Template.generate>`, but
+    nothing is written to ``project_dir`` (only the ``pre_gen_project`` hooks run, in
+    a temporary folder). Use :obj:`run_post_hooks` once the structure is written.
+
+    Returns:
+        Structure with the rendered files and context used for rendering them
+    """
+    with timing.span("context", template.name):
+        context = template.context_for(extra_context, project_dir.parent)
+    template.dump_replay(context)
+    with TemporaryDirectory(prefix="pyscaffoldext-pre-gen-") as tmp:
+        template.run_hook("pre_gen_project", Path(tmp), context, hooks)
+    with timing.span("render", str(project_dir)):
+        struct = render_structure(template, context, cancel, max_memory, jobs)
+    check_cancelled(cancel)
+    return struct, context
+
+
+def run_post_hooks(
+    template: Template,
+    project_dir: Path,
+    context: Context,
+    hooks: Optional["HookPolicy"] = None,
+):
+    """Run the ``post_gen_project`` hooks after the structure is written"""
+    template.run_hook("post_gen_project", project_dir, context, hooks)
+
+
+def render_structure(
+    template: Template,
+    context: Context,
+    cancel: Optional[Event] = None,
+    max_memory: Optional[int] = None,
+    jobs: Optional[int] = 1,
+) -> Structure:
+    """Equivalent to :obj:`Template.render_files <.template.Template.render_files>`,
+    but producing a :obj:`~pyscaffold.structure` (relative to the project folder).
+    At most ``max_memory`` bytes of rendered text are kept in the structure (when
+    rendering in parallel, i.e. ``jobs`` other than ``1``, the size of the template
+    files is used as an estimate, since they are rendered all at once).
+    """
+    from cookiecutter.exceptions import UndefinedVariableInTemplate
+    from jinja2.exceptions import UndefinedError
+
+    struct: Structure = {}
+    held = 0
+    deferred: Optional[List[_Deferred]] = [] if number_of_workers(jobs) > 1 else None
+    for entry in walk_template(template, context, cancel):
+        if entry.kind == "dir":
+            _directory(struct, entry.target.parts)
+            continue
+        available = None if max_memory is None else max(max_memory - held, 0)
+        try:
+            held += _add_file(struct, template, entry, context, available, deferred)
+        except UndefinedError as err:
+            msg = f"Unable to create file '{entry.relpath}'"
+            raise UndefinedVariableInTemplate(msg, err, context) from err
+
+    if deferred:
+        relpaths = [d.relpath for d in deferred]
+        rendered = template.in_parallel(
+            "render_contents", relpaths, context, jobs, cancel
+        )
+        for leaf, contents in zip(deferred, rendered):
+            leaf.parent[leaf.name] = (
+                contents,
+                rendered_file(leaf.source, leaf.newline),
+            )
+
+    return struct
+
+
+class Entry(NamedTuple):
+    """File or folder produced by the template, see :obj:`walk_template`"""
+
+    target: Path
+    """Path relative to the project folder"""
+    source: Path
+    """Path of the template file/folder"""
+    relpath: Optional[str]
+    """Path relative to the template folder (``None`` inside copy-only folders)"""
+    kind: str
+    """``"dir"``, ``"copy"`` (copied verbatim) or ``"render"``"""
+
+
+def walk_template(
+    template: Template, context: Context, cancel: Optional[Event] = None
+) -> Iterator[Entry]:
+    """Files and folders produced by the template (with rendered paths), in the same
+    order as :obj:`Template.render_files <.template.Template.render_files>`.
+    Files whose rendered name is empty are also included.
+    """
+    from cookiecutter.exceptions import UndefinedVariableInTemplate
+    from cookiecutter.generate import is_copy_only_path
+    from jinja2.exceptions import UndefinedError
+
+    template_dir = template.template_dir
+    for rel_root, dirs, files in template.walk():
+        # Directories that are only copied are not walked into
+        copy_dirs, render_dirs = [], []
+        for name in sorted(dirs):
+            relpath = os.path.normpath(os.path.join(rel_root, name))
+            is_copy = is_copy_only_path(relpath, context)
+            (copy_dirs if is_copy else render_dirs).append(relpath)
+
+        dirs[:] = [os.path.basename(d) for d in render_dirs]
+        entries: List[Entry] = []
+        try:
+            for relpath in copy_dirs:
+                target = Path(template.render_path(relpath, context))
+                entries.extend(_copied_tree(target, template_dir / relpath))
+            for relpath in render_dirs:
+                target = Path(template.render_path(relpath, context))
+                entries.append(Entry(target, template_dir / relpath, relpath, "dir"))
+        except UndefinedError as err:
+            msg = f"Unable to create directory '{relpath}'"
+            raise UndefinedVariableInTemplate(msg, err, context) from err
+        yield from entries
+
+        for name in sorted(files):
+            check_cancelled(cancel)
+            relpath = os.path.normpath(os.path.join(rel_root, name))
+            try:
+                target = Path(template.render_path(relpath, context))
+            except UndefinedError as err:
+                msg = f"Unable to create file '{relpath}'"
+                raise UndefinedVariableInTemplate(msg, err, context) from err
+            kind = "copy" if template.is_verbatim(relpath, context) else "render"
+            yield Entry(target, template_dir / relpath, relpath, kind)
+
+
+def merge_structure(
+    struct: Structure, rendered: Structure, precedence: PrecedenceSpec = None
+) -> Structure:
+    """Merge the ``rendered`` template into PyScaffold's ``struct``
+    according to the ``precedence`` policy (see :obj:`Precedence`).
+    """
+    return _merge(struct, rendered, Precedence.parse(precedence))
+
+
+def template_owned(
+    paths: Iterable[str], produced: Container[str], precedence: PrecedenceSpec = None
+) -> Set[str]:
+    """Files defined by PyScaffold (``paths``) that are kept from the template, i.e.
+    files the template ``produced`` and that win according to ``precedence``.
+    """
+    precedence = Precedence.parse(precedence)
+    return {p for p in paths if p in produced and precedence.winner(p) == "template"}
+
+
+def keep_files(struct: Structure, paths: Container[str], prefix="") -> Structure:
+    """Copy of PyScaffold's ``struct`` where the files in ``paths`` (relative POSIX
+    paths) are not written, because the file rendered from the template is kept.
+    """
+    kept: Structure = {}
+    for name, node in struct.items():
+        path = f"{prefix}{name}"
+        if isinstance(node, dict):
+            kept[name] = keep_files(node, paths, f"{path}/")
+        elif path in paths:
+            kept[name] = (resolve_leaf(node)[0], _kept_file)
+        else:
+            kept[name] = node
+    return kept
+
+
+def skip_identical(file_op: FileOp) -> FileOp:
+    """File op modifier. Returns a :obj:`~pyscaffold.operations.FileOp` that does not
+    write files that already have the given contents (preserving their modification
+    time). The path is still returned, as the file is part of the project.
+
+    Files that are written are no longer linked to the template (or to a
+    :mod:`~.dedup` store), since PyScaffold modifies them in place (see
+    :obj:`~.stream.break_link`).
+    """
+
+    def _skip_identical(path: Path, contents: FileContents, opts: ScaffoldOpts):
+        if contents is None or opts.get("pretend"):
+            return file_op(path, contents, opts)
+        if not _same_text(path, contents):
+            stream.break_link(path)
+            return file_op(path, contents, opts)
+        logger.report("identical", path)
+        return path
+
+    return _skip_identical
+
+
+def skip_identical_files(struct: Structure) -> Structure:
+    """Copy of ``struct`` where all the file ops are modified by
+    :obj:`skip_identical`.
+    """
+    skipped: Structure = {}
+    for name, node in struct.items():
+        if isinstance(node, dict):
+            skipped[name] = skip_identical_files(node)
+        else:
+            contents, file_op = resolve_leaf(node)
+            skipped[name] = (contents, skip_identical(file_op))
+    return skipped
+
+
+def rendered_file(source: Path, newline: Optional[str]) -> FileOp:
+    """:obj:`~pyscaffold.operations.FileOp` that writes the rendered contents with
+    the given ``newline`` and the same permissions as the ``source`` template file.
+    """
+
+    def _rendered_file(path: Path, contents: FileContents, opts: ScaffoldOpts):
+        if contents is None:
+            return None
+        pretend = opts.get("pretend")
+        if not path.parent.is_dir():
+            fs.create_directory(path.parent, pretend=pretend)
+        if not pretend:
+            with open(str(path), "w", encoding="utf-8", newline=newline) as file:
+                file.write(contents)
+            shutil.copymode(str(source), str(path))
+        logger.report("create", path)
+        return path
+
+    return _rendered_file
+
+
+def streamed_file(
+    source: Path, newline: Optional[str], chunks: Callable[[], Iterable[str]]
+) -> FileOp:
+    """Similar to :obj:`rendered_file`, but the text is only rendered when the file
+    is written, by calling ``chunks`` (the contents in the structure are ignored,
+    unless they are ``None``).
+    """
+
+    def _streamed_file(path: Path, contents: FileContents, opts: ScaffoldOpts):
+        if contents is None:
+            return None
+        pretend = opts.get("pretend")
+        if not path.parent.is_dir():
+            fs.create_directory(path.parent, pretend=pretend)
+        if not pretend:
+            stream.write_text(path, chunks(), newline)
+            shutil.copymode(str(source), str(path))
+        logger.report("create", path)
+        return path
+
+    return _streamed_file
+
+
+def copied_file(source: Path) -> FileOp:
+    """:obj:`~pyscaffold.operations.FileOp` that copies the ``source`` file
+    (the contents in the structure are ignored, unless they are ``None``).
+    """
+
+    def _copied_file(path: Path, contents: FileContents, opts: ScaffoldOpts):
+        if contents is None:
+            return None
+        pretend = opts.get("pretend")
+        if not path.parent.is_dir():
+            fs.create_directory(path.parent, pretend=pretend)
+        if not pretend:
+            max_memory = opts.get("cookiecutter_max_memory")
+            stream.copy_file(source, path, max_memory, opts.get("cookiecutter_link"))
+        logger.report("copy", path)
+        return path
+
+    return _copied_file
+
+
+def _add_file(
+    struct: Structure,
+    template: Template,
+    entry: Entry,
+    context: Context,
+    available: Optional[int] = None,
+    deferred: Optional[List["_Deferred"]] = None,
+) -> int:
+    """Add a leaf for the file to ``struct`` (or to ``deferred``, when its contents
+    are rendered later). Returns the number of bytes of text kept in the leaf.
+    """
+    target, source, relpath = entry.target, entry.source, entry.relpath
+    if not target.name or target.parts[-1] == "..":
+        return 0  # The rendered file name is empty
+    parent = _directory(struct, target.parts[:-1])
+    if isinstance(parent.get(target.name), dict):
+        return 0  # The rendered file name is empty (the path points to a directory)
+
+    if entry.kind == "copy" or relpath is None:
+        parent[target.name] = ("", copied_file(source))
+        return 0
+
+    newline = template.newline(relpath, context)
+    if available is not None and source.stat().st_size > available:
+        chunks = partial(template.stream_contents, relpath, context)
+        parent[target.name] = ("", streamed_file(source, newline, chunks))
+        return 0
+
+    if deferred is not None:
+        deferred.append(_Deferred(parent, target.name, relpath, source, newline))
+        return source.stat().st_size
+
+    contents = template.render_contents(relpath, context)
+    parent[target.name] = (contents, rendered_file(source, newline))
+    return len(contents)
+
+
+class _Deferred(NamedTuple):
+    """Leaf whose contents are rendered in parallel, see :obj:`render_structure`"""
+
+    parent: Structure
+    name: str
+    relpath: str
+    source: Path
+    newline: Optional[str]
+
+
+def _copied_tree(target: Path, source: Path) -> Iterator[Entry]:
+    """Entries for all the folders and files in ``source`` (copied verbatim)"""
+    for root, dirs, files in os.walk(str(source)):
+        dirs.sort()
+        relative = Path(os.path.normpath(Path(target, os.path.relpath(root, source))))
+        yield Entry(relative, Path(root), None, "dir")
+        for name in sorted(files):
+            yield Entry(relative / name, Path(root, name), None, "copy")
+
+
+def _directory(struct: Structure, parts) -> Structure:
+    """Nested dict for the directory given by ``parts`` (created if necessary)"""
+    for part in parts:
+        if part in ("", "."):
+            continue
+        node = struct.get(part)
+        if not isinstance(node, dict):
+            node = struct[part] = {}
+        struct = node
+    return struct
+
+
+def _merge(
+    pyscaffold: Structure, rendered: Structure, precedence: Precedence, prefix=""
+) -> Structure:
+    """Merge two structures, ``precedence`` decides the winner for files that exist in
+    both. Differently from :obj:`pyscaffold.structure.merge`, leaves are not combined
+    (i.e. each file is written by the file op that defines its contents).
+    """
+    merged = dict(pyscaffold)
+    for name, node in rendered.items():
+        current, path = merged.get(name), f"{prefix}{name}"
+        if isinstance(node, dict) and isinstance(current, dict):
+            merged[name] = _merge(current, node, precedence, f"{path}/")
+        elif current is None:
+            merged[name] = node
+        else:
+            high, low = node, current
+            if precedence.winner(path) != "template":
+                high, low = low, high
+            merged[name] = low if _is_empty(high) else high
+    return merged
+
+
+def _check_policy(policy: str) -> str:
+    if policy not in PRECEDENCE:
+        options = ", ".join(repr(p) for p in PRECEDENCE)
+        raise ValueError(f"Invalid precedence {policy!r}, use one of: {options}")
+    return policy
+
+
+def _kept_file(path: Path, contents: FileContents, opts: ScaffoldOpts):
+    """File op for the files kept from the template, see :obj:`keep_files`"""
+    logger.report("keep", path)
+    return path
+
+
+def _same_text(path: Path, contents: str) -> bool:
+    """``path`` already contains ``contents`` (as written by
+    :obj:`pyscaffold.file_system.create_file`, i.e. with platform newlines)
+    """
+    expected = contents.replace("\n", os.linesep) if os.linesep != "\n" else contents
+    data = expected.encode("utf-8")
+    try:
+        if path.stat().st_size != len(data):
+            return False
+        return path.read_bytes() == data
+    except OSError:
+        return False
+
+
+def _is_empty(node: Leaf) -> bool:
+    """``None`` contents mean the file should not be written"""
+    return not isinstance(node, dict) and resolve_leaf(node)[0] is None
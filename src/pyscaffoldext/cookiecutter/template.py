@@ -0,0 +1,804 @@
+"""Cookiecutter templates prepared for (repeated) rendering.
+
+A :obj:`Template` fetches the template (see :obj:`~.cache.TemplateCache`), parses its
+``cookiecutter.json`` file and sets up the Jinja environment only once, so the same
+object can be used to generate several projects without paying these costs again
+(compiled Jinja templates are also kept in memory between projects).
+Templates can also be compiled into a snapshot stored on disk (see :mod:`~.snapshot`),
+so later runs (or processes) skip this preparation altogether.
+
+The rendering mirrors :obj:`cookiecutter.generate.generate_files` (including
+``_copy_without_render``, binary files, file permissions, newline handling and
+``pre/post_gen_project`` hooks) but it is implemented only in terms of absolute paths:
+the current working directory of the process is never changed. Therefore, the same
+:obj:`Template` object can be safely used to generate projects from multiple threads.
+"""
+import os
+import shutil
+import sys
+import warnings
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from copy import deepcopy
+from pathlib import Path, PurePosixPath
+from tempfile import NamedTemporaryFile
+from threading import Event, RLock
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Union
+
+from pyscaffold.actions import ScaffoldOpts
+from pyscaffold.log import logger
+
+from . import snapshot as snapshots
+from . import stream, timing
+from .cache import TemplateCache, clean_directory, git_head, recorded_commit
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .hooks import HookPolicy
+
+PathLike = Union[str, os.PathLike]
+Context = Dict[str, Any]
+
+CONTEXT_FILE = "cookiecutter.json"
+HOOKS_DIR = "hooks"
+
+CHUNKS_PER_WORKER = 4
+"""Files rendered in parallel are split in this number of chunks per process"""
+
+_IMPORT_PATH_LOCK = RLock()
+
+
+class Template:
+    """Cookiecutter template available in the local file system.
+
+    Args:
+        repo_dir: directory containing the ``cookiecutter.json`` file.
+        source: how the template was originally referred to (e.g. the git URL).
+            Exposed to the template as ``cookiecutter._template``.
+        checkout: ref used to checkout the template, if any.
+        snapshot: precompiled version of the template (see :obj:`compile`).
+        directory: path of ``repo_dir`` relative to the root of the repository,
+            for templates that are not in the root of the repository.
+    """
+
+    def __init__(
+        self,
+        repo_dir: PathLike,
+        source: Optional[str] = None,
+        checkout: Optional[str] = None,
+        snapshot: Optional[snapshots.Snapshot] = None,
+        directory: Optional[str] = None,
+    ):
+        from cookiecutter.config import get_user_config
+
+        self.repo_dir = Path(repo_dir).resolve()
+        self.source = source or str(repo_dir)
+        self.checkout = checkout
+        self.directory = directory
+        self.config = get_user_config()
+        self.snapshot = snapshot
+        self._env = None
+        self._template_dir: Optional[Path] = None
+        if snapshot:
+            self.context = snapshot.context
+            self._template_dir = self.repo_dir / snapshot.template_dir
+        else:
+            self.context = load_context(self.repo_dir / CONTEXT_FILE)
+        self.variables = frozenset(self.context)
+        """Variables declared in ``cookiecutter.json``"""
+        self._path_templates: Dict[str, Any] = {}
+        self._lock = RLock()
+
+    @classmethod
+    def fetch(
+        cls,
+        source: str,
+        checkout: Optional[str] = None,
+        refresh: bool = False,
+        cache: Optional[TemplateCache] = None,
+        snapshot: bool = True,
+        directory: Optional[str] = None,
+    ) -> "Template":
+        """Obtain the template from ``source`` (a local path, a git URL, a zip file
+        or an abbreviation such as ``gh:user/repo``), using the cache if possible.
+
+        When ``snapshot`` is ``True``, the template is loaded from its precompiled
+        snapshot (stored in the cache), which is created first if necessary.
+        Templates that are not in the root of the repository can be selected with
+        ``directory`` (only this directory is checked out, see :mod:`~.cache`).
+        """
+        from cookiecutter.config import get_user_config
+        from cookiecutter.repository import determine_repo_dir
+
+        cache = cache or TemplateCache()
+        directory = clean_directory(directory)
+        local = cache.fetch(source, checkout, refresh, directory)
+        config = get_user_config()
+        repo_dir, cleanup = determine_repo_dir(
+            template=local,
+            abbreviations=config["abbreviations"],
+            clone_to_dir=config["cookiecutters_dir"],
+            checkout=checkout,
+            no_input=True,
+            directory=directory,
+        )
+        base_dir = run_pre_prompt_hook(Path(repo_dir))
+        # Unzipped or copied because of ``pre_prompt`` hooks: temporary
+        temporary = cleanup or base_dir != Path(repo_dir)
+        snapshot_cache = cache if snapshot and not temporary else None
+        args = (source, checkout, snapshot_cache, directory)
+        template = cls._prepare(base_dir, *args)
+        nested = template.nested_template()
+        if nested:
+            template = cls._prepare(Path(nested), *args)
+        if temporary:
+            weakref.finalize(template, shutil.rmtree, str(base_dir), True)
+
+        return template
+
+    @classmethod
+    def _prepare(
+        cls,
+        repo_dir: Path,
+        source: str,
+        checkout: Optional[str],
+        cache: Optional[TemplateCache],
+        directory: Optional[str] = None,
+    ) -> "Template":
+        if cache is None:
+            return cls(repo_dir, source, checkout, directory=directory)
+
+        dest = cache.snapshot_dir(repo_dir)
+        snapshot = snapshots.Snapshot.load(dest, repo_dir.resolve())
+        if snapshot:
+            return cls(repo_dir, source, checkout, snapshot, directory)
+
+        template = cls(repo_dir, source, checkout, directory=directory)
+        try:
+            template.compile(dest)
+        except OSError as ex:  # pragma: no cover
+            logger.warning(f"Impossible to store template snapshot ({ex})")
+        return template
+
+    @classmethod
+    def from_opts(cls, opts: ScaffoldOpts) -> "Template":
+        cache = TemplateCache.from_opts(opts)
+        refresh = bool(opts.get("cookiecutter_refresh"))
+        snapshot = opts.get("cookiecutter_snapshot", True)
+        checkout, directory = opts.get("cookiecutter_ref"), opts.get(
+            "cookiecutter_directory"
+        )
+        return cls.fetch(
+            opts["cookiecutter"], checkout, refresh, cache, snapshot, directory
+        )
+
+    def compile(self, dest: PathLike) -> snapshots.Snapshot:
+        """Store a precompiled snapshot of the template in ``dest`` (parsed context,
+        file manifest and Jinja bytecode). The snapshot is also used by this object.
+        """
+        from cookiecutter.generate import is_copy_only_path
+        from jinja2.exceptions import TemplateError
+
+        logger.report("compile", str(self.repo_dir))
+        template_dir = self.template_dir
+        snapshot = snapshots.create(
+            Path(dest), self.repo_dir, self.context, template_dir
+        )
+        with self._lock:
+            self.snapshot = snapshot
+            self._env = None
+
+        context = {"cookiecutter": self.context}
+        for relpath, info in snapshot.files.items():
+            if info["binary"] or is_copy_only_path(relpath, context):
+                continue
+            try:
+                self.environment.get_template(relpath.replace(os.sep, "/"))
+            except TemplateError:
+                continue  # errors are reported when the file is rendered
+
+        return snapshot
+
+    def __getstate__(self) -> dict:
+        # The Jinja environment cannot be pickled, it is created again when needed
+        state = self.__dict__.copy()
+        state.update(_env=None, _path_templates={}, _lock=None)
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state, _lock=RLock())
+
+    @property
+    def name(self) -> str:
+        return self.repo_dir.name
+
+    @property
+    def root(self) -> Path:
+        """Root of the repository containing the template (see ``directory``)"""
+        depth = len(PurePosixPath(self.directory).parts) if self.directory else 0
+        return self.repo_dir.parents[depth - 1] if depth else self.repo_dir
+
+    @property
+    def commit(self) -> Optional[str]:
+        """Commit of the template, if it is a git repository (e.g. a cloned URL)"""
+        return git_head(self.root) or recorded_commit(self.root)
+
+    @property
+    def environment(self):
+        """Jinja environment shared by all the projects generated from the template"""
+        with self._lock:
+            if self._env is None:
+                self._env = self._create_environment()
+            return self._env
+
+    def _create_environment(self):
+        from cookiecutter.environment import StrictEnvironment
+        from jinja2 import FileSystemLoader
+
+        envvars = self.context.get("_jinja2_env_vars", {})
+        context = {"cookiecutter": self.context}
+        with import_path(self.repo_dir):
+            env = StrictEnvironment(
+                context=context, keep_trailing_newline=True, **envvars
+            )
+        dirs = [self._find_template_dir(env), self.repo_dir / "templates"]
+        env.loader = FileSystemLoader([str(d) for d in dirs])
+        if self.snapshot:
+            env.bytecode_cache = self.snapshot.bytecode_cache()
+        return env
+
+    @property
+    def template_dir(self) -> Path:
+        """Directory with the files to be rendered,
+        e.g. ``{{cookiecutter.project_name}}``
+        """
+        return self._find_template_dir(self.environment)
+
+    def _find_template_dir(self, env) -> Path:
+        from cookiecutter.exceptions import NonTemplatedInputDirException
+
+        if self._template_dir is None:
+            start, end = env.variable_start_string, env.variable_end_string
+            for name in sorted(os.listdir(str(self.repo_dir))):
+                if "cookiecutter" in name and start in name and end in name:
+                    self._template_dir = self.repo_dir / name
+                    break
+            else:
+                raise NonTemplatedInputDirException
+        return self._template_dir
+
+    def nested_template(self) -> Optional[str]:
+        """Path of the nested template that would be automatically chosen by
+        cookiecutter when running with ``no_input`` (if any).
+        """
+        if not {"template", "templates"} & set(self.context.keys()):
+            return None
+
+        from cookiecutter.prompt import choose_nested_template
+
+        context = {"cookiecutter": deepcopy(self.context)}
+        return choose_nested_template(context, self.repo_dir, no_input=True)
+
+    def check_parameters(self, params: Context):
+        """Make sure the given ``extra_context`` only contains variables declared in
+        ``cookiecutter.json`` (cookiecutter silently ignores the other ones).
+
+        Raises:
+            UnknownParameters: with suggestions for mistyped names.
+        """
+        unknown = [name for name in params if name not in self.variables]
+        if unknown:
+            raise UnknownParameters(unknown, sorted(self.variables), self.source)
+
+    def context_for(
+        self, extra_context: Optional[Context] = None, output_dir: PathLike = "."
+    ) -> Context:
+        """Context used for rendering, equivalent to the one produced by cookiecutter
+        without prompting the user.
+        """
+        from cookiecutter.generate import apply_overwrites_to_context
+        from cookiecutter.prompt import prompt_for_config
+
+        obj = deepcopy(self.context)
+        default_context = self.config.get("default_context")
+        if default_context:
+            try:
+                apply_overwrites_to_context(obj, default_context)
+            except ValueError as error:
+                warnings.warn(f"Invalid default received: {error}")
+        if extra_context:
+            apply_overwrites_to_context(obj, extra_context)
+
+        context: Context = OrderedDict([("cookiecutter", obj)])
+        context["_cookiecutter"] = {k: v for k, v in obj.items() if k[0] != "_"}
+        with import_path(self.repo_dir):
+            obj.update(prompt_for_config(context, no_input=True))
+
+        obj["_template"] = self.source
+        obj["_output_dir"] = os.path.abspath(str(output_dir))
+        obj["_repo_dir"] = str(self.repo_dir)
+        obj["_checkout"] = self.checkout
+        return context
+
+    def generate(
+        self,
+        output_dir: PathLike = ".",
+        extra_context: Optional[Context] = None,
+        overwrite_if_exists: bool = False,
+        accept_hooks: bool = True,
+        cancel: Optional[Event] = None,
+        max_memory: Optional[int] = None,
+        link: Optional[str] = None,
+        jobs: Optional[int] = 1,
+        hooks: Optional["HookPolicy"] = None,
+    ) -> Path:
+        """Generate a project inside ``output_dir``, similarly to
+        :obj:`cookiecutter.main.cookiecutter`.
+
+        As cookiecutter, :obj:`cookiecutter.exceptions.OutputDirExistsException` is
+        raised if the project folder already exists, unless ``overwrite_if_exists``.
+
+        The generation can be interrupted by setting the ``cancel`` event (e.g. from
+        another thread). In that case :obj:`GenerationCancelled` is raised and the
+        partially generated project is removed.
+
+        Files are streamed to the disk, ``max_memory`` limits the size of the
+        buffers used for copying them and ``link`` allows files that are not rendered
+        to be reflinked/hardlinked instead of copied (see :mod:`~.stream`).
+
+        With ``jobs`` other than ``1``, files are rendered concurrently by a pool of
+        that many processes (``None`` or ``0`` means one per CPU), see
+        :obj:`in_parallel`. Hooks still run before/after all the files are rendered.
+
+        ``hooks`` controls how the hooks are executed (e.g. timeouts), see
+        :mod:`~.hooks`.
+
+        Returns:
+            Path to the generated project
+        """
+        with timing.span("context", self.name):
+            context = self.context_for(extra_context, output_dir)
+        self.dump_replay(context)
+        return self.render(
+            context,
+            output_dir,
+            overwrite_if_exists,
+            accept_hooks,
+            cancel,
+            max_memory,
+            link,
+            jobs,
+            hooks,
+        )
+
+    def dump_replay(self, context: Context):
+        """Store the context as cookiecutter would, so it can be used for replay.
+        The file is atomically replaced (projects might be generated in parallel).
+        """
+        import json
+
+        from cookiecutter.replay import get_file_name
+
+        replay_dir = Path(self.config["replay_dir"])
+        replay_dir.mkdir(parents=True, exist_ok=True)
+        replay_file = Path(get_file_name(str(replay_dir), self.name))
+        with NamedTemporaryFile("w", dir=str(replay_dir), delete=False) as file:
+            json.dump(context, file, indent=2)
+        os.replace(file.name, str(replay_file))
+
+    def render(
+        self,
+        context: Context,
+        output_dir: PathLike = ".",
+        overwrite_if_exists: bool = False,
+        accept_hooks: bool = True,
+        cancel: Optional[Event] = None,
+        max_memory: Optional[int] = None,
+        link: Optional[str] = None,
+        jobs: Optional[int] = 1,
+        hooks: Optional["HookPolicy"] = None,
+    ) -> Path:
+        """Render the template files using the given context, see :obj:`generate`."""
+        from cookiecutter.exceptions import (
+            OutputDirExistsException,
+            UndefinedVariableInTemplate,
+        )
+        from jinja2.exceptions import UndefinedError
+
+        unrendered = self.template_dir.name
+        try:
+            project_dir = Path(output_dir, self.render_path(unrendered, context))
+        except UndefinedError as err:
+            msg = f"Unable to create project directory '{unrendered}'"
+            raise UndefinedVariableInTemplate(msg, err, context) from err
+
+        project_dir = project_dir.resolve()
+        created = not project_dir.exists()
+        if not created and not overwrite_if_exists:
+            msg = f'Error: "{project_dir}" directory already exists'
+            raise OutputDirExistsException(msg)
+        project_dir.mkdir(parents=True, exist_ok=True)
+
+        try:
+            if accept_hooks:
+                self.run_hook("pre_gen_project", project_dir, context, hooks)
+            with timing.span("render", str(project_dir)):
+                self.render_files(context, project_dir, cancel, max_memory, link, jobs)
+            check_cancelled(cancel)
+            if accept_hooks:
+                self.run_hook("post_gen_project", project_dir, context, hooks)
+        except BaseException:
+            if created:
+                shutil.rmtree(str(project_dir), ignore_errors=True)
+            raise
+
+        return project_dir
+
+    def render_files(
+        self,
+        context: Context,
+        project_dir: Path,
+        cancel: Optional[Event] = None,
+        max_memory: Optional[int] = None,
+        link: Optional[str] = None,
+        jobs: Optional[int] = 1,
+    ):
+        from cookiecutter.exceptions import UndefinedVariableInTemplate
+        from cookiecutter.generate import is_copy_only_path
+        from jinja2.exceptions import UndefinedError
+
+        template_dir = str(self.template_dir)
+        parallel = number_of_workers(jobs) > 1
+        pending: List[str] = []  # files rendered in parallel (after the folders exist)
+        for rel_root, dirs, files in self.walk():
+            # Directories that are only copied are not walked into
+            copy_dirs, render_dirs = [], []
+            for name in sorted(dirs):
+                relpath = os.path.normpath(os.path.join(rel_root, name))
+                is_copy = is_copy_only_path(relpath, context)
+                (copy_dirs if is_copy else render_dirs).append(relpath)
+
+            dirs[:] = [os.path.basename(d) for d in render_dirs]
+            try:
+                for relpath in copy_dirs:
+                    outdir = project_dir / self.render_path(relpath, context)
+                    if outdir.is_dir():
+                        shutil.rmtree(str(outdir))
+                    source = os.path.join(template_dir, relpath)
+                    stream.copy_tree(source, outdir, max_memory, link)
+                for relpath in render_dirs:
+                    outdir = project_dir / self.render_path(relpath, context)
+                    outdir.mkdir(parents=True, exist_ok=True)
+            except UndefinedError as err:
+                msg = f"Unable to create directory '{relpath}'"
+                raise UndefinedVariableInTemplate(msg, err, context) from err
+
+            for name in sorted(files):
+                check_cancelled(cancel)
+                relpath = os.path.normpath(os.path.join(rel_root, name))
+                if parallel:
+                    pending.append(relpath)
+                    continue
+                try:
+                    self.render_file(relpath, context, project_dir, max_memory, link)
+                except UndefinedError as err:
+                    msg = f"Unable to create file '{relpath}'"
+                    raise UndefinedVariableInTemplate(msg, err, context) from err
+
+        if pending:
+            kwargs = dict(project_dir=project_dir, max_memory=max_memory, link=link)
+            self.in_parallel("render_file", pending, context, jobs, cancel, **kwargs)
+
+    def in_parallel(
+        self,
+        method: str,
+        relpaths: List[str],
+        context: Context,
+        jobs: Optional[int] = None,
+        cancel: Optional[Event] = None,
+        **kwargs,
+    ) -> list:
+        """Call ``method`` (e.g. ``"render_file"`` or ``"render_contents"``) for each
+        file in ``relpaths`` using a pool of ``jobs`` processes (``None`` or ``0``
+        means one per CPU). The files are split in contiguous chunks, so errors are
+        reported for the same file as when rendering sequentially.
+
+        Returns:
+            Results of each call, in the same order as ``relpaths``
+        """
+        from cookiecutter.exceptions import UndefinedVariableInTemplate
+
+        workers = number_of_workers(jobs)
+        size = -(-len(relpaths) // (workers * CHUNKS_PER_WORKER)) or 1
+        chunks = [relpaths[i : i + size] for i in range(0, len(relpaths), size)]
+        init = (self, context, kwargs)
+        results: list = []
+        with process_pool(workers, _init, init) as pool:
+            futures = [pool.submit(_call_in_worker, method, c) for c in chunks]
+            try:
+                for future in futures:
+                    check_cancelled(cancel)
+                    results.extend(future.result())
+            except _FileFailed as ex:
+                msg = f"Unable to create file '{ex.relpath}'"
+                raise UndefinedVariableInTemplate(msg, ex.error, context) from ex.error
+            finally:
+                for future in futures:
+                    future.cancel()
+        return results
+
+    def walk(self) -> snapshots.Walk:
+        """Equivalent to :obj:`os.walk` over :obj:`template_dir` (with relative
+        paths), using the manifest of the snapshot when available.
+        """
+        if self.snapshot:
+            yield from self.snapshot.walk()
+            return
+
+        template_dir = str(self.template_dir)
+        for root, dirs, files in os.walk(template_dir):
+            yield os.path.relpath(root, template_dir), dirs, files
+
+    def render_file(
+        self,
+        relpath: str,
+        context: Context,
+        project_dir: Path,
+        max_memory: Optional[int] = None,
+        link: Optional[str] = None,
+    ) -> Optional[Path]:
+        """Render a single file (``relpath`` is relative to :obj:`template_dir`)"""
+        infile = self.template_dir / relpath
+        outfile = project_dir / self.render_path(relpath, context)
+        if outfile.is_dir():
+            return None  # The rendered file name is empty
+
+        if self.is_verbatim(relpath, context):
+            return stream.copy_file(infile, outfile, max_memory, link)
+
+        newline = self.newline(relpath, context)
+        stream.write_text(outfile, self.stream_contents(relpath, context), newline)
+        shutil.copymode(str(infile), str(outfile))
+        return outfile
+
+    def is_verbatim(self, relpath: str, context: Context) -> bool:
+        """Files copied without rendering (binary or in ``_copy_without_render``)"""
+        from binaryornot.check import is_binary
+        from cookiecutter.generate import is_copy_only_path
+
+        if is_copy_only_path(relpath, context):
+            return True
+        info = self.snapshot.files.get(relpath) if self.snapshot else None
+        return info["binary"] if info else is_binary(str(self.template_dir / relpath))
+
+    def newline(self, relpath: str, context: Context) -> Optional[str]:
+        """Newline used when writing the rendered file (as cookiecutter would)"""
+        newline = context["cookiecutter"].get("_new_lines")
+        if newline:
+            return newline
+        info = self.snapshot.files.get(relpath) if self.snapshot else None
+        return info["newline"] if info else detect_newline(self.template_dir / relpath)
+
+    def render_contents(self, relpath: str, context: Context) -> str:
+        return self._get_template(relpath).render(**context)
+
+    def stream_contents(self, relpath: str, context: Context) -> Iterator[str]:
+        """Equivalent to :obj:`render_contents`, but producing the text in pieces"""
+        return self._get_template(relpath).generate(**context)
+
+    def rendered_size(self, relpath: str, context: Context) -> int:
+        """Number of bytes :obj:`render_file` would write (without writing them)"""
+        newline = self.newline(relpath, context)
+        newline = os.linesep if newline is None else (newline or "\n")
+        size = 0
+        for chunk in self.stream_contents(relpath, context):
+            size += len(chunk.encode("utf-8"))
+            size += chunk.count("\n") * (len(newline) - 1)
+        return size
+
+    def _get_template(self, relpath: str):
+        from jinja2.exceptions import TemplateSyntaxError
+
+        # Jinja always expect forward slashes
+        try:
+            return self.environment.get_template(relpath.replace(os.sep, "/"))
+        except TemplateSyntaxError as ex:
+            ex.translated = False  # Verbose information about the error location
+            raise
+
+    def render_path(self, relpath: str, context: Context) -> str:
+        """Render a path (relative to :obj:`template_dir`).
+        Compiled Jinja templates for paths are cached in memory.
+        """
+        tmpl = self._path_templates.get(relpath)
+        if tmpl is None:
+            tmpl = self.environment.from_string(relpath)
+            tmpl = self._path_templates.setdefault(relpath, tmpl)
+        return tmpl.render(**context)
+
+    def hooks(self, hook_name: str) -> List[Path]:
+        """Hook scripts provided by the template for ``hook_name``"""
+        from cookiecutter.hooks import valid_hook
+
+        hooks_dir = self.repo_dir / HOOKS_DIR
+        if not hooks_dir.is_dir():
+            return []
+        files = sorted(os.listdir(str(hooks_dir)))
+        return [hooks_dir / f for f in files if valid_hook(f, hook_name)]
+
+    def run_hook(
+        self,
+        hook_name: str,
+        project_dir: Path,
+        context: Context,
+        policy: Optional["HookPolicy"] = None,
+    ):
+        """Run the scripts of ``hook_name`` in ``project_dir`` according to the
+        ``policy`` (by default, as cookiecutter does), see :mod:`~.hooks`.
+        """
+        from .hooks import HookPolicy
+
+        policy = policy or HookPolicy()
+        scripts = self.hooks(hook_name)
+        if scripts and hook_name in policy.skip:
+            logger.report("skip", f"{hook_name} hooks")
+            return
+        for script in scripts:
+            policy.run(hook_name, script, project_dir, context)
+
+
+class GenerationCancelled(RuntimeError):
+    """The generation of the project was cancelled before completion."""
+
+    DEFAULT_MESSAGE = "project generation cancelled"
+
+    def __init__(self, message=DEFAULT_MESSAGE, *args, **kwargs):
+        super().__init__(message, *args, **kwargs)
+
+
+class UnknownParameters(ValueError):
+    """Parameters given to the template are not declared in its ``cookiecutter.json``
+    file (e.g. mistyped ``--cookiecutter-params``).
+    """
+
+    def __init__(self, names: List[str], variables: List[str], template: str):
+        super().__init__(names, variables, template)
+        self.names = names
+        self.variables = variables
+        self.template = template
+
+    def __str__(self) -> str:
+        from difflib import get_close_matches
+
+        unknown = []
+        for name in self.names:
+            matches = get_close_matches(name, self.variables, n=1)
+            hint = f" (did you mean {matches[0]!r}?)" if matches else ""
+            unknown.append(f"{name!r}{hint}")
+        return (
+            f"unknown parameters for the template {self.template!r}: "
+            f"{', '.join(unknown)}. Check its `{CONTEXT_FILE}` file for the "
+            "available parameters"
+        )
+
+
+class _FileFailed(Exception):
+    """Undefined variable in a file rendered by a worker process"""
+
+    def __init__(self, relpath: str, error: Exception):
+        super().__init__(relpath, error)
+        self.relpath = relpath
+        self.error = error
+
+
+def number_of_workers(jobs: Optional[int]) -> int:
+    """Number of processes used for rendering (``None`` or ``0`` means one per CPU)"""
+    return jobs or os.cpu_count() or 1
+
+
+def process_pool(
+    workers: int, initializer: Callable, initargs: tuple
+) -> ProcessPoolExecutor:
+    """:obj:`~concurrent.futures.ProcessPoolExecutor` whose workers are not forked
+    from the current process, which might be running other threads (e.g. the
+    :mod:`~.aio` and :mod:`~.daemon` modules), see :obj:`multiprocessing.get_context`.
+    """
+    import multiprocessing
+
+    methods = multiprocessing.get_all_start_methods()
+    method = "forkserver" if "forkserver" in methods else "spawn"
+    context = multiprocessing.get_context(method)
+    return ProcessPoolExecutor(
+        workers, mp_context=context, initializer=initializer, initargs=initargs
+    )
+
+
+def check_cancelled(cancel: Optional[Event]):
+    if cancel is not None and cancel.is_set():
+        raise GenerationCancelled
+
+
+def load_context(context_file: Path) -> "OrderedDict[str, Any]":
+    """Parse a ``cookiecutter.json`` file"""
+    import json
+
+    from cookiecutter.exceptions import ContextDecodingException
+
+    try:
+        with open(str(context_file), encoding="utf-8") as file:
+            return json.load(file, object_pairs_hook=OrderedDict)
+    except ValueError as ex:
+        msg = (
+            f"JSON decoding error while loading '{context_file.resolve()}'. "
+            f"Decoding error details: '{ex}'"
+        )
+        raise ContextDecodingException(msg) from ex
+
+
+def detect_newline(path: Path) -> Optional[str]:
+    """Newline used in the first line of the file (as cookiecutter does)"""
+    with open(str(path), encoding="utf-8") as file:
+        file.readline()
+    newlines = file.newlines
+    return newlines[0] if isinstance(newlines, tuple) else newlines
+
+
+def run_pre_prompt_hook(repo_dir: Path) -> Path:
+    """Run the ``pre_prompt`` hook in a temporary copy of the template
+    (as cookiecutter does), if the template provides it.
+    """
+    from cookiecutter.hooks import run_script, valid_hook
+    from cookiecutter.utils import create_tmp_repo_dir
+
+    hooks_dir = repo_dir / HOOKS_DIR
+    if not hooks_dir.is_dir():
+        return repo_dir
+    if not any(valid_hook(f, "pre_prompt") for f in os.listdir(str(hooks_dir))):
+        return repo_dir
+
+    tmp_dir = create_tmp_repo_dir(repo_dir)
+    for name in sorted(os.listdir(str(tmp_dir / HOOKS_DIR))):
+        if valid_hook(name, "pre_prompt"):
+            run_script(str(tmp_dir / HOOKS_DIR / name), str(tmp_dir))
+    return tmp_dir
+
+
+@contextmanager
+def import_path(path: Path):
+    """Temporarily make local Jinja extensions (shipped with the template)
+    importable, as cookiecutter does.
+    """
+    with _IMPORT_PATH_LOCK:
+        entry = str(path)
+        added = entry not in sys.path
+        if added:
+            sys.path.append(entry)
+        try:
+            yield
+        finally:
+            if added and entry in sys.path:
+                sys.path.remove(entry)
+
+
+# ---- Worker processes ----
+
+_WORKER: dict = {}
+"""State of each worker process (the template is prepared once per process)"""
+
+
+def _init(template: Template, context: Context, kwargs: dict):
+    _WORKER.update(template=template, context=context, kwargs=kwargs)
+
+
+def _call_in_worker(method: str, relpaths: List[str]) -> list:
+    from jinja2.exceptions import UndefinedError
+
+    fn = getattr(_WORKER["template"], method)
+    results = []
+    for relpath in relpaths:
+        try:
+            results.append(fn(relpath, _WORKER["context"], **_WORKER["kwargs"]))
+        except UndefinedError as err:
+            raise _FileFailed(relpath, err) from None
+    return results
@@ -0,0 +1,132 @@
+"""Timing of the different phases of the project generation.
+
+A :obj:`Profile` records a :obj:`Span` for each phase, e.g. ``enforce_options``,
+``parameters``, ``fetch`` (template download or cache lookup), ``context`` (building
+the cookiecutter context), ``render``, ``hook`` (each ``pre/post_gen_project``
+script), ``merge`` (PyScaffold writing its own files over the rendered template) and
+``plan`` (files planned with ``--pretend``).
+
+When used via PyScaffold's Python API, a ``cookiecutter_on_span`` callback can be
+passed to :obj:`pyscaffold.api.create_project` to receive each :obj:`Span` as soon as
+it finishes. The ``cookiecutter_profile`` option (``--cookiecutter-profile FILE`` in
+the CLI) writes a JSON report with all the spans at the end of the generation.
+
+The active profile is stored in a :obj:`~contextvars.ContextVar`, so the :obj:`span`
+function can be used anywhere in the code, without passing the profile around. When
+no profile is active, spans are not recorded.
+"""
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from pyscaffold.actions import ScaffoldOpts
+
+
+class Span(NamedTuple):
+    """Time spent in a phase of the project generation"""
+
+    name: str
+    start: float
+    """Seconds since the beginning of the profile"""
+    duration: float
+    """Seconds spent in the phase"""
+    subject: str = ""
+    """Additional information (e.g. the name of the hook)"""
+
+
+SpanCallback = Callable[[Span], None]
+
+_CURRENT: ContextVar[Optional["Profile"]] = ContextVar("profile", default=None)
+
+
+class Profile:
+    """Collection of timing spans.
+
+    Args:
+        callback: function called with each :obj:`Span` when it finishes.
+    """
+
+    def __init__(self, callback: Optional[SpanCallback] = None):
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self.callback = callback
+        self._open: Dict[str, float] = {}
+        self._lock = Lock()
+
+    @classmethod
+    def from_opts(cls, opts: ScaffoldOpts) -> Optional["Profile"]:
+        """Profile requested via ``cookiecutter_on_span``/``cookiecutter_profile``"""
+        callback = opts.get("cookiecutter_on_span")
+        if callback or opts.get("cookiecutter_profile"):
+            return cls(callback)
+        return None
+
+    @contextmanager
+    def span(self, name: str, subject: str = "") -> Iterator[None]:
+        """Record the time spent inside the ``with`` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter(), subject)
+
+    def begin(self, name: str):
+        """Start a span that cannot be delimited by a ``with`` block
+        (e.g. it starts in one action and finishes in another)
+        """
+        self._open[name] = time.perf_counter()
+
+    def end(self, name: str, subject: str = ""):
+        """Finish a span started with :obj:`begin`"""
+        start = self._open.pop(name, None)
+        if start is not None:
+            self.add(name, start, time.perf_counter(), subject)
+
+    def add(self, name: str, start: float, end: float, subject: str = ""):
+        span = Span(name, start - self.origin, end - start, subject)
+        with self._lock:
+            self.spans.append(span)
+        if self.callback:
+            self.callback(span)
+
+    def totals(self) -> Dict[str, float]:
+        """Total time spent in each phase"""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0) + span.duration
+        return totals
+
+    def report(self) -> dict:
+        return {
+            "elapsed": time.perf_counter() - self.origin,
+            "phases": self.totals(),
+            "spans": [s._asdict() for s in self.spans],
+        }
+
+    def dump(self, path: Path):
+        path.write_text(json.dumps(self.report(), indent=2), encoding="utf-8")
+
+
+@contextmanager
+def activate(profile: Optional[Profile]) -> Iterator[Optional[Profile]]:
+    """Make ``profile`` the current profile inside the ``with`` block"""
+    token = _CURRENT.set(profile)
+    try:
+        yield profile
+    finally:
+        _CURRENT.reset(token)
+
+
+@contextmanager
+def span(name: str, subject: str = "") -> Iterator[None]:
+    """Record a span in the current profile (if any)"""
+    profile = _CURRENT.get()
+    if profile is None:
+        yield
+        return
+    with profile.span(name, subject):
+        yield
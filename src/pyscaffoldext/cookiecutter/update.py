@@ -0,0 +1,410 @@
+"""Incremental update of projects generated from cookiecutter templates.
+
+When a project is created, a :obj:`State` file (``.cookiecutter-state.json``) is
+stored in the project folder. It records the template, its git commit, the
+parameters given to cookiecutter and a hash of each file produced by the template
+(files generated by PyScaffold itself are not included).
+
+When the project is updated (``putup --update``), the template is rendered again
+into a temporary folder (with the same parameters, unless new values are given via
+``--cookiecutter-params``) and only the files whose output changed are considered.
+If both versions of the template are known git commits and the parameters did not
+change, only the files changed between them (``git diff``) are rendered, unless
+something else that affects the output changed (e.g. ``cookiecutter.json``). The
+hooks of the template are never run for these renders:
+
+- files that were not modified in the project are simply replaced,
+- files that were modified in the project are combined with a three-way merge
+  (``git merge-file``), using the output of the template in the recorded commit as
+  the common ancestor (conflicts are marked in the file, as git would do). When the
+  previous version of the template is not available (e.g. local templates that
+  are not git repositories), the new version is saved next to the file (with the
+  ``.new`` suffix) to be merged manually,
+- files that were removed from the template are removed from the project (unless
+  they were modified or the previous version of the template is not available).
+
+Projects without a state file (e.g. created by previous versions) cannot be updated.
+"""
+import hashlib
+import json
+import os
+import subprocess
+from pathlib import Path, PurePosixPath
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from pyscaffold.actions import Structure
+from pyscaffold.log import logger
+
+from .cache import TemplateCache, expand_template, is_remote
+from .stream import break_link, copy_file
+from .template import Context, Template
+
+STATE_FILE = ".cookiecutter-state.json"
+IGNORED_DIRS = (".git",)
+NEW_SUFFIX = ".new"
+"""Added to the new version of files that cannot be merged"""
+
+
+class State:
+    """Information about how a project was generated from a template.
+
+    Args:
+        template: path/URL of the template.
+        commit: git commit of the template, if available.
+        context: parameters given to cookiecutter (``extra_context``).
+        files: hash of each file produced by the template (relative POSIX paths).
+        directory: directory of the repository containing the template, if any.
+    """
+
+    def __init__(
+        self,
+        template: str,
+        commit: Optional[str],
+        context: Context,
+        files: Dict[str, str],
+        directory: Optional[str] = None,
+    ):
+        self.template = template
+        self.commit = commit
+        self.context = context
+        self.files = files
+        self.directory = directory
+
+    @classmethod
+    def load(cls, project_dir: Path) -> Optional["State"]:
+        try:
+            text = (project_dir / STATE_FILE).read_text(encoding="utf-8")
+            data = json.loads(text)
+            return cls(
+                data["template"],
+                data["commit"],
+                data["context"],
+                data["files"],
+                data.get("directory"),
+            )
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def capture(
+        cls,
+        template: Template,
+        context: Context,
+        output: Path,
+        excluded: Iterable[str] = (),
+    ) -> "State":
+        """State for the ``output`` of ``template`` (rendered with ``context``)"""
+        source = template.source
+        if os.path.isdir(source):
+            source = os.path.abspath(source)
+        files = hash_tree(output, set(excluded))
+        return cls(source, template.commit, context, files, template.directory)
+
+    def dump(self, project_dir: Path):
+        data = {
+            "template": self.template,
+            "commit": self.commit,
+            "context": self.context,
+            "files": self.files,
+        }
+        if self.directory:
+            data["directory"] = self.directory
+        text = json.dumps(data, indent=2, sort_keys=True)
+        (project_dir / STATE_FILE).write_text(text + "\n", encoding="utf-8")
+
+    def base_template(
+        self, cache: Optional[TemplateCache] = None
+    ) -> Optional[Template]:
+        """Template in the recorded commit, if it can still be obtained"""
+        url = git_url(self.template)
+        if not (url and self.commit):
+            return None
+        return Template.fetch(url, self.commit, cache=cache, directory=self.directory)
+
+
+def update(
+    project_dir: Path,
+    template: Template,
+    state: State,
+    excluded: Iterable[str] = (),
+    pretend: bool = False,
+    cache: Optional[TemplateCache] = None,
+    context: Optional[Context] = None,
+) -> State:
+    """Apply the changes in the output of ``template`` to the project.
+
+    Args:
+        project_dir: folder of the project to be updated.
+        template: (new version of the) template used to generate the project.
+        state: state recorded the last time the project was generated/updated.
+        excluded: paths (relative to ``project_dir``) that should not be touched
+            (e.g. files managed by PyScaffold).
+        pretend: only report what would be done.
+        cache: cache used to fetch the version of the template recorded in
+            ``state`` (when needed for merging).
+        context: parameters given to cookiecutter, by default the ones recorded in
+            ``state``. If they are different, the whole template is rendered again.
+
+    Returns:
+        New state of the project
+    """
+    excluded = {*excluded, STATE_FILE}
+    context = state.context if context is None else context
+    same_context = context == state.context
+    sources = changed_sources(template, state.commit) if same_context else None
+    with TemporaryDirectory(prefix="pyscaffoldext-update-") as tmp:
+        new_dir = render_sources(template, context, Path(tmp, "new"), sources)
+        new_files = hash_tree(new_dir, excluded)
+        if sources is not None:
+            # Only the changed files were rendered, the others have the same output
+            rendering = template.context_for(context)
+            stale = {output_path(template, s, rendering) for s in sources}
+            unchanged = {k: v for k, v in state.files.items() if k not in stale}
+            new_files = {**unchanged, **new_files}
+        base_dirs: Dict[str, Optional[Path]] = {}
+
+        def base_dir() -> Optional[Path]:
+            # The old version is only rendered if something has to be merged
+            if "base" not in base_dirs:
+                base = state.base_template(cache)
+                out = Path(tmp, "base")
+                rendered = base and render_sources(base, state.context, out, sources)
+                base_dirs["base"] = rendered
+            return base_dirs["base"]
+
+        for relpath in sorted(new_files):
+            _update_file(
+                relpath, project_dir, new_dir, new_files, state, base_dir, pretend
+            )
+
+        for relpath in sorted(set(state.files) - set(new_files) - excluded):
+            _remove_file(relpath, project_dir, state, base_dir, pretend)
+
+        commit = template.commit
+        return State(state.template, commit, context, new_files, template.directory)
+
+
+def changed_sources(template: Template, commit: Optional[str]) -> Optional[Set[str]]:
+    """Files of the template (relative to :obj:`~.Template.template_dir`) changed
+    since ``commit``, according to ``git diff``.
+
+    Returns:
+        ``None`` if the changes cannot be determined (e.g. the template is not a git
+        repository) or if something else that affects all the files changed (e.g.
+        ``cookiecutter.json``, hooks or templates used in ``{% include %}``).
+    """
+    new = template.commit
+    if not (commit and new and (template.root / ".git").exists()):
+        return None
+    if commit == new:
+        return set()
+
+    root = template.root
+    repo_dir = template.repo_dir.relative_to(root).as_posix()
+    template_dir = template.template_dir.relative_to(root).as_posix()
+    # Cached templates are shallow clones, the old commit might be missing
+    exists = ["git", "cat-file", "-e", f"{commit}^{{commit}}"]
+    if subprocess.run(exists, cwd=str(root), capture_output=True).returncode:
+        depth = ["--depth", "1", "--filter=blob:none"]
+        fetch = ["git", "fetch", "-q", *depth, "origin", commit]
+        subprocess.run(fetch, cwd=str(root), capture_output=True)
+    diff = ["git", "diff", "--name-only", "--no-renames", "-z", commit, new]
+    cmd = [*diff, "--", repo_dir]
+    proc = subprocess.run(cmd, cwd=str(root), capture_output=True, text=True)
+    if proc.returncode:
+        return None
+
+    sources = set()
+    for name in filter(None, proc.stdout.split("\0")):
+        try:
+            relpath = PurePosixPath(name).relative_to(template_dir)
+        except ValueError:
+            return None
+        sources.add(os.path.normpath(str(relpath)))
+    return sources
+
+
+def render_sources(
+    template: Template,
+    extra_context: Context,
+    output_dir: Path,
+    sources: Optional[Set[str]] = None,
+) -> Path:
+    """Render the template into ``output_dir`` without running its hooks.
+    If ``sources`` is given, only these files (relative to
+    :obj:`~.Template.template_dir`) are rendered.
+
+    Returns:
+        Path to the (partially) rendered project
+    """
+    if sources is None:
+        return template.generate(output_dir, extra_context, accept_hooks=False)
+
+    context = template.context_for(extra_context, output_dir)
+    project = output_dir / template.render_path(template.template_dir.name, context)
+    project.mkdir(parents=True, exist_ok=True)
+    for relpath in sorted(sources):
+        source = template.template_dir / relpath
+        if not source.is_file():
+            continue  # removed from the template
+        outfile = project / output_path(template, relpath, context)
+        outfile.parent.mkdir(parents=True, exist_ok=True)
+        if _copied_folder(relpath, context):
+            copy_file(source, outfile)
+        else:
+            template.render_file(relpath, context, project)
+    return project
+
+
+def output_path(template: Template, relpath: str, context: Context) -> str:
+    """Path (relative POSIX path) of the file produced for ``relpath`` (relative to
+    :obj:`~.Template.template_dir`)
+    """
+    folder = _copied_folder(relpath, context)
+    if folder:  # the names inside are not rendered
+        rendered = template.render_path(folder, context)
+        return Path(rendered, os.path.relpath(relpath, folder)).as_posix()
+    return Path(template.render_path(relpath, context)).as_posix()
+
+
+def _copied_folder(relpath: str, context: Context) -> Optional[str]:
+    """Outermost folder containing ``relpath`` copied without rendering, if any"""
+    from cookiecutter.generate import is_copy_only_path
+
+    parts = Path(relpath).parts
+    for i in range(1, len(parts)):
+        folder = os.path.join(*parts[:i])
+        if is_copy_only_path(folder, context):
+            return folder
+    return None
+
+
+def _update_file(
+    relpath: str,
+    project_dir: Path,
+    new_dir: Path,
+    new_files: Dict[str, str],
+    state: State,
+    base_dir: Callable[[], Optional[Path]],
+    pretend: bool,
+):
+    new, old = new_files[relpath], state.files.get(relpath)
+    if new == old:
+        return  # the output of the template did not change
+
+    target = project_dir / relpath
+    current = file_hash(target) if target.is_file() else None
+    if current == new:
+        return
+    if current is None and old is not None:
+        logger.report("skip", f"{relpath} (removed from the project)")
+        return
+    if current is None or current == old:
+        logger.report("update" if current else "create", relpath)
+        if not pretend:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            copy_file(new_dir / relpath, target)
+        return
+
+    if old is None:
+        logger.report("skip", f"{relpath} (already exists in the project)")
+        return
+
+    base = base_dir()
+    if base is None or not (base / relpath).is_file():
+        # Keep the new version next to the file, so it can be merged manually
+        logger.warning(
+            f"Cannot merge {relpath}: previous version of template missing, "
+            f"new version saved as {relpath}{NEW_SUFFIX}"
+        )
+        if not pretend:
+            copy_file(new_dir / relpath, target.with_name(target.name + NEW_SUFFIX))
+        return
+    logger.report("merge", relpath)
+    if not pretend:
+        break_link(target)  # ``git merge-file`` writes the file in place
+        merge(target, base / relpath, new_dir / relpath)
+
+
+def _remove_file(
+    relpath: str,
+    project_dir: Path,
+    state: State,
+    base_dir: Callable[[], Optional[Path]],
+    pretend: bool,
+):
+    target = project_dir / relpath
+    if not target.is_file():
+        return
+    base = base_dir()
+    if base is None or not (base / relpath).is_file():
+        return  # not produced by the template (e.g. existing file in the folder)
+    if file_hash(target) != state.files[relpath]:
+        logger.report("skip", f"{relpath} (removed from the template, but modified)")
+        return
+    logger.report("remove", relpath)
+    if not pretend:
+        target.unlink()
+
+
+def merge(current: Path, base: Path, other: Path) -> bool:
+    """Three-way merge of ``other`` into ``current`` (changes are written to
+    ``current``), see ``git merge-file``.
+
+    Returns:
+        ``True`` if the merge was clean, ``False`` if there are conflicts.
+    """
+    labels = ["-L", "project", "-L", "previous template", "-L", "template"]
+    cmd = ["git", "merge-file", *labels, str(current), str(base), str(other)]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode >= 128:  # e.g. binary files
+        logger.warning(f"Cannot merge {current}: {proc.stderr.decode().strip()}")
+        return False
+    if proc.returncode > 0:
+        logger.warning(f"Merge conflicts in {current}, please solve them manually")
+        return False
+    return True
+
+
+def git_url(template: str) -> Optional[str]:
+    """URL that can be used to clone the git repository of the template"""
+    url = expand_template(template)
+    if is_remote(url):
+        return url
+    if Path(template, ".git").exists():
+        return "git+" + Path(template).resolve().as_uri()
+    return None
+
+
+def hash_tree(path: Path, excluded: Set[str] = frozenset()) -> Dict[str, str]:
+    """Hash of all the files inside ``path`` (keys are relative POSIX paths)"""
+    hashes = {}
+    for root, dirs, files in os.walk(str(path)):
+        dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+        for name in files:
+            file = Path(root, name)
+            relpath = file.relative_to(path).as_posix()
+            if relpath not in excluded:
+                hashes[relpath] = file_hash(file)
+    return hashes
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(str(path), "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def struct_paths(struct: Structure, prefix: str = "") -> Set[str]:
+    """Relative POSIX paths of all the files defined in a PyScaffold structure"""
+    paths: Set[str] = set()
+    for name, value in struct.items():
+        path = f"{prefix}{name}"
+        if isinstance(value, dict):
+            paths |= struct_paths(value, f"{path}/")
+        else:
+            paths.add(path)
+    return paths
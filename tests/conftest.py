@@ -11,7 +11,15 @@ from textwrap import dedent
 import pytest
 from pyscaffold.log import ReportFormatter
 
-from .helpers import rmpath, uniqstr
+from .helpers import (
+    PYPACKAGE_CONTEXT,
+    PYPACKAGE_FILES,
+    PYPACKAGE_URL,
+    GitServer,
+    create_template,
+    rmpath,
+    uniqstr,
+)
 
 
 @pytest.fixture
@@ -81,3 +89,21 @@ def isolated_log(request, monkeypatch, caplog):
         yield caplog
     finally:
         new_handler.close()
+
+
+@pytest.fixture
+def git_server(tmp_path):
+    """Local replacement for remote git repositories, see :obj:`helpers.GitServer`"""
+    return GitServer(tmp_path / "git-server")
+
+
+@pytest.fixture(params=["local", pytest.param("remote", marks=pytest.mark.slow)])
+def pypackage_url(request, git_server, tmp_path):
+    """URL of ``cookiecutter-pypackage``. The remote template requires network
+    access, its local stand-in is served by a :obj:`~.helpers.GitServer`.
+    """
+    if request.param == "remote":
+        return PYPACKAGE_URL
+    path = tmp_path / "cookiecutter-pypackage"
+    path = create_template(path, PYPACKAGE_FILES, PYPACKAGE_CONTEXT)
+    return git_server.publish(path)
@@ -1,4 +1,5 @@
 import builtins
+import json
 import os
 import shlex
 import stat
@@ -7,13 +8,16 @@ import traceback
 from contextlib import contextmanager
 from pathlib import Path
 from shutil import rmtree
-from subprocess import STDOUT, CalledProcessError, check_output
+from subprocess import STDOUT, CalledProcessError, check_call, check_output
 from time import sleep
 from uuid import uuid4
 from warnings import warn
 
+from pyscaffold.api import NO_CONFIG, create_project
 from pyscaffold.shell import get_executable
 
+from pyscaffoldext.cookiecutter.extension import Cookiecutter
+
 IS_POSIX = os.name == "posix"
 
 PYTHON = sys.executable
@@ -76,6 +80,218 @@ def disable_import(prefix):
         builtins.__import__ = realimport
 
 
+TEMPLATE_JSON = """\
+{
+    "project_name": "proj",
+    "package_name": "{{ cookiecutter.project_name }}",
+    "author": "Nobody",
+    "email": "nobody@example.com"
+}
+"""
+
+TEMPLATE_FILES = {
+    "Makefile": "all:\n\t@echo {{ cookiecutter.project_name }}\n",
+    "src/{{cookiecutter.package_name}}/info.py": "EMAIL = '{{cookiecutter.email}}'",
+}
+
+
+def create_template(path, files=None, context=None):
+    """Create a minimal cookiecutter template (compatible with PyScaffold) in ``path``
+
+    Args:
+        path: directory where the template will be created
+        files: dict mapping paths (relative to the ``{{cookiecutter.project_name}}``
+            folder) to their (text) contents
+        context: additional variables for ``cookiecutter.json``
+    """
+    files = TEMPLATE_FILES if files is None else files
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    if context:
+        variables = {**json.loads(TEMPLATE_JSON), **context}
+        (path / "cookiecutter.json").write_text(json.dumps(variables, indent=4))
+    else:
+        (path / "cookiecutter.json").write_text(TEMPLATE_JSON)
+    for name, contents in files.items():
+        file = path / "{{cookiecutter.project_name}}" / name
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_text(contents)
+    return path
+
+
+FEATURE_FILES = {
+    "Makefile": "all:\n\t@echo {{ cookiecutter.project_name }}\n",
+    "windows.txt": "{{ cookiecutter.author }}\r\nsecond line\r\n",
+    "setup.cfg": "[metadata]\nname = {{ cookiecutter.project_name }}\n",
+    "src/{{cookiecutter.package_name}}/info.py": "EMAIL = '{{cookiecutter.email}}'",
+    "raw/{{cookiecutter.package_name}}.txt": "{{ not rendered }}",
+    "{% if False %}skipped.txt{% endif %}": "empty file name",
+    "data/logo.bin": "",
+}
+"""Files exercising how cookiecutter renders templates (see
+:obj:`create_feature_template`): newlines, a file shared with PyScaffold, files copied
+without rendering, empty file names and binary files
+"""
+
+
+def create_feature_template(path, files=None):
+    """Same as :obj:`create_template` (by default with :obj:`FEATURE_FILES`), but the
+    ``raw`` folder is copied without rendering and ``data/logo.bin`` is binary
+    """
+    path = create_template(path, FEATURE_FILES if files is None else files)
+    context = json.loads((path / "cookiecutter.json").read_text())
+    context["_copy_without_render"] = ["raw"]
+    (path / "cookiecutter.json").write_text(json.dumps(context))
+    root = path / "{{cookiecutter.project_name}}"
+    (root / "data/logo.bin").write_bytes(bytes(range(256)) * 4)
+    return path
+
+
+def generate(template, project_path="proj", **kwargs):
+    """Generate a project from ``template`` with the cookiecutter extension (ignoring
+    the configuration files of the dev's machine)
+
+    Returns:
+        Options after generating the project, see :obj:`pyscaffold.api.create_project`
+    """
+    opts = dict(
+        project_path=project_path,
+        cookiecutter=str(template),
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+    _, opts = create_project(opts, **kwargs)
+    return opts
+
+
+SYNTHETIC_FILE = """\
+# {{ cookiecutter.project_name }} by {{ cookiecutter.author }}
+{%- for i in range(3) %}
+VALUE_{{ i }} = "{{ cookiecutter.package_name }}-{{ i }}"
+{%- endfor %}
+"""
+
+
+PYPACKAGE_URL = "https://github.com/pyscaffold/cookiecutter-pypackage.git"
+
+PYPACKAGE_FILES = {
+    "Makefile": "all:\n\t@echo {{ cookiecutter.project_name }}\n",
+    ".github/ISSUE_TEMPLATE.md": "* {{ cookiecutter.project_name }} version:\n",
+    "README.rst": "{{ cookiecutter.project_name }}\n{{ '=' * 20 }}\n",
+    "setup.py": "from setuptools import setup\n\nsetup()\n",
+    "src/{{cookiecutter.package_name}}/__init__.py": "",
+    "src/{{cookiecutter.package_name}}/cli.py": (
+        "{% if cookiecutter.command_line_interface == 'Argparse' %}import argparse"
+        "{% else %}import click{% endif %}\n"
+    ),
+    "tests/test_{{cookiecutter.package_name}}.py": (
+        "{% if cookiecutter.use_pytest == 'y' %}import pytest"
+        "{% else %}import unittest{% endif %}\n"
+    ),
+}
+"""Offline stand-in for https://github.com/pyscaffold/cookiecutter-pypackage"""
+
+PYPACKAGE_CONTEXT = {
+    "command_line_interface": ["Click", "Argparse", "No command-line interface"],
+    "use_pytest": "n",
+}
+"""Variables of ``cookiecutter-pypackage`` used by the tests (besides the ones in
+:obj:`TEMPLATE_JSON`)
+"""
+
+
+def create_synthetic_template(
+    path, n_files, files_per_dir=100, depth=1, file_size=0, n_binary=0, binary_size=0
+):
+    """Create a template with ``n_files`` (small) Jinja files, spread over several
+    sub-folders, e.g. for benchmarks.
+
+    Args:
+        files_per_dir: number of files in each sub-folder
+        depth: nesting level of the sub-folders
+        file_size: minimum size of each Jinja file (padded with a comment)
+        n_binary: number of (random) binary files, copied without rendering
+        binary_size: size of each binary file
+    """
+    contents = SYNTHETIC_FILE
+    if file_size > len(contents):
+        contents += "#" * (file_size - len(contents) - 1) + "\n"
+    files = {}
+    for i in range(n_files):
+        folder = "/".join(f"data{i // files_per_dir}" for _ in range(depth))
+        files[f"{folder}/file{i}.py"] = contents
+    path = create_template(path, files)
+    for i in range(n_binary):
+        file = path / "{{cookiecutter.project_name}}" / f"assets/blob{i}.bin"
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_bytes(os.urandom(binary_size))
+    return path
+
+
+def git_commit_all(path, message="template"):
+    """Initialise (if necessary) a git repository in ``path`` and commit everything,
+    independently of the git configuration in the dev's machine.
+    """
+    cfg = ["-c", "user.name=Test", "-c", "user.email=test@example.com"]
+    if not has_git(path):
+        check_call(["git", "init", "-q", str(path)])
+    check_call(["git", *cfg, "-C", str(path), "add", "-A"])
+    check_call(["git", *cfg, "-C", str(path), "commit", "-q", "-m", message])
+    head = check_output(["git", "-C", str(path), "rev-parse", "HEAD"])
+    return head.decode().strip()
+
+
+class GitServer:
+    """Offline stand-in for a git hosting service (e.g. GitHub).
+
+    Templates are published into bare repositories inside ``root`` and served via
+    ``file://`` URLs, which git fetches using the same protocol as for remote
+    servers. As in most hosting services, partial clones and fetching any commit
+    are allowed.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def url(self, name):
+        # The `.git` suffix helps cookiecutter to identify the repository type
+        return (self.root / f"{name}.git").as_uri()
+
+    def publish(self, path, name=None, message="template"):
+        """Commit the changes in ``path`` (e.g. a template created with
+        :obj:`create_template`) and push them (and the tags) to the repository
+        ``name`` (by default the name of the folder).
+
+        Returns:
+            URL of the repository
+        """
+        path = Path(path)
+        name = name or path.name
+        git = ["git", "-C", str(path)]
+        status = check_output([*git, "status", "--porcelain"]) if has_git(path) else 1
+        if status:
+            git_commit_all(path, message)
+
+        bare = self.root / f"{name}.git"
+        if not bare.exists():
+            check_call(["git", "init", "-q", "--bare", str(bare)])
+            for setting in ("allowFilter", "allowAnySHA1InWant"):
+                check_call(
+                    ["git", "-C", str(bare), "config", f"uploadpack.{setting}", "1"]
+                )
+            check_call(
+                ["git", "-C", str(bare), "symbolic-ref", "HEAD", "refs/heads/main"]
+            )
+        refs = ["HEAD:refs/heads/main", "refs/tags/*:refs/tags/*"]
+        check_call([*git, "push", "-q", "--force", str(bare), *refs])
+        return self.url(name)
+
+
+def has_git(path):
+    return (Path(path) / ".git").exists()
+
+
 def run(*args, **kwargs):
     """Run the external command. See ``subprocess.check_output``."""
     # normalize args
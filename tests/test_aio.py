@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import NO_CONFIG
+
+from pyscaffoldext.cookiecutter import extension
+from pyscaffoldext.cookiecutter import template as template_mod
+from pyscaffoldext.cookiecutter.aio import AsyncScaffolder
+
+from .helpers import create_template
+
+SLOW_HOOK = "import time; time.sleep(0.5)\n"
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    return create_template(tmp_path / "template")
+
+
+def test_create_projects_concurrently(tmpfolder, template_dir):
+    async def main():
+        async with AsyncScaffolder(max_concurrency=2) as scaffolder:
+            return await asyncio.gather(
+                *(
+                    scaffolder.create_project(
+                        project_path=f"proj{i}",
+                        cookiecutter=str(template_dir),
+                        config_files=NO_CONFIG,
+                    )
+                    for i in range(3)
+                )
+            )
+
+    paths = asyncio.run(main())
+    assert paths == [tmpfolder / f"proj{i}" for i in range(3)]
+    for i, path in enumerate(paths):
+        assert (path / f"src/proj{i}/info.py").exists()
+        assert (path / "Makefile").exists()
+
+
+def test_event_loop_is_not_blocked(tmpfolder, template_dir):
+    (template_dir / "hooks").mkdir()
+    (template_dir / "hooks/pre_gen_project.py").write_text(SLOW_HOOK)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def main():
+        task = asyncio.create_task(ticker())
+        async with AsyncScaffolder() as scaffolder:
+            await scaffolder.create_project(
+                project_path="proj",
+                cookiecutter=str(template_dir),
+                config_files=NO_CONFIG,
+            )
+        task.cancel()
+
+    asyncio.run(main())
+    assert Path("proj/Makefile").exists()
+    # The ticker kept running while the hook was sleeping
+    assert len(ticks) > 10
+
+
+def test_cancel(tmpfolder, template_dir, monkeypatch):
+    started = threading.Event()
+    render_file = template_mod.Template.render_file
+
+    def _slow_render_file(*args, **kwargs):
+        render_file(*args, **kwargs)
+        started.set()
+        time.sleep(0.1)
+
+    monkeypatch.setattr(template_mod.Template, "render_file", _slow_render_file)
+
+    async def main():
+        async with AsyncScaffolder() as scaffolder:
+            task = asyncio.create_task(
+                scaffolder.create_project(
+                    project_path="proj",
+                    cookiecutter=str(template_dir),
+                    config_files=NO_CONFIG,
+                )
+            )
+            while not started.is_set() and not task.done():
+                await asyncio.sleep(0.01)
+            if task.done():  # failed before rendering (e.g. git not configured)
+                task.result()
+                pytest.fail("the project was created before being cancelled")
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(main())
+    # Partially rendered projects are removed
+    assert not Path("proj").exists()
+
+
+def test_cancel_after_rendering(tmpfolder, template_dir, monkeypatch):
+    started = threading.Event()
+    finish_cookiecutter = extension.finish_cookiecutter
+
+    def _slow_finish(struct, opts):
+        started.set()
+        time.sleep(0.2)
+        return finish_cookiecutter(struct, opts)
+
+    monkeypatch.setattr(extension, "finish_cookiecutter", _slow_finish)
+
+    async def main():
+        async with AsyncScaffolder() as scaffolder:
+            task = asyncio.create_task(
+                scaffolder.create_project(
+                    project_path="proj",
+                    cookiecutter=str(template_dir),
+                    config_files=NO_CONFIG,
+                )
+            )
+            while not started.is_set() and not task.done():
+                await asyncio.sleep(0.01)
+            if task.done():
+                task.result()
+                pytest.fail("the project was created before being cancelled")
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(main())
+    # The cancellation is honoured once PyScaffold is done
+    assert not Path("proj").exists()
@@ -0,0 +1,123 @@
+import pickle
+import sys
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import NO_CONFIG
+from pyscaffold.exceptions import InvalidIdentifier
+
+from pyscaffoldext.cookiecutter import batch
+from pyscaffoldext.cookiecutter import template as template_mod
+from pyscaffoldext.cookiecutter.batch import create_projects
+from pyscaffoldext.cookiecutter.extension import NotInstalled
+from pyscaffoldext.cookiecutter.template import Template
+
+from .helpers import create_template
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    return create_template(tmp_path / "template")
+
+
+def test_create_projects(tmpfolder, template_dir, monkeypatch):
+    calls = []
+    load_context = template_mod.load_context
+    monkeypatch.setattr(
+        template_mod, "load_context", lambda f: calls.append(f) or load_context(f)
+    )
+
+    # Given a list of projects (one of them with invalid options)
+    projects = [
+        {"project_path": "proj1", "cookiecutter_params": {"author": "Alice"}},
+        {"project_path": "proj2", "package": "not valid"},
+        {"project_path": "proj3", "cookiecutter_params": {"email": "bob@x.com"}},
+    ]
+
+    # when they are all generated from the same template,
+    results = list(create_projects(str(template_dir), projects, config_files=NO_CONFIG))
+
+    # then the results are reported in order,
+    assert [r.project_path for r in results] == [Path(f"proj{i}") for i in (1, 2, 3)]
+    assert [r.ok for r in results] == [True, False, True]
+    assert isinstance(results[1].error, InvalidIdentifier)
+    assert all(r.duration > 0 for r in results)
+
+    # the template is parsed only once,
+    assert len(calls) == 1
+
+    # and the projects are generated with their own parameters
+    assert Path("proj1/Makefile").exists()
+    assert not Path("proj2").exists()
+    assert "bob@x.com" in Path("proj3/src/proj3/info.py").read_text()
+
+
+def test_create_projects_with_prepared_template(tmpfolder, template_dir):
+    template = Template(template_dir)
+    projects = ({"project_path": f"proj{i}"} for i in range(2))
+    results = create_projects(template, projects, config_files=NO_CONFIG)
+
+    # Projects are streamed (generated lazily)
+    first = next(results)
+    assert first.ok and Path("proj0/Makefile").exists()
+    assert not Path("proj1").exists()
+    assert next(results).ok
+    assert Path("proj1/Makefile").exists()
+
+
+def test_create_projects_in_parallel(tmpfolder, template_dir):
+    projects = [{"project_path": f"proj{i}"} for i in range(4)]
+    projects[2]["package"] = "not valid"
+    results = create_projects(
+        str(template_dir), projects, workers=2, config_files=NO_CONFIG
+    )
+    results = list(results)
+    assert [r.project_path for r in results] == [Path(f"proj{i}") for i in range(4)]
+    assert [r.ok for r in results] == [True, True, False, True]
+    assert isinstance(results[2].error, InvalidIdentifier)
+    for i in (0, 1, 3):
+        assert Path(f"proj{i}/src/proj{i}/info.py").exists()
+
+
+def test_create_projects_bounded(tmpfolder, template_dir):
+    consumed = []
+
+    def projects():
+        for i in range(8):
+            consumed.append(i)
+            yield {"project_path": f"proj{i}"}
+
+    results = create_projects(
+        str(template_dir), projects(), workers=2, config_files=NO_CONFIG
+    )
+    assert next(results).ok
+    # Only a few projects per worker are submitted ahead of time
+    assert len(consumed) <= 2 * batch.TASKS_PER_WORKER
+    results.close()
+    assert not Path("proj7").exists()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_create_projects_invalid(tmpfolder, template_dir, workers):
+    projects = [{"project_path": "proj0"}, None, {"project_path": "proj2"}]
+    results = create_projects(
+        str(template_dir), projects, workers=workers, config_files=NO_CONFIG
+    )
+    with pytest.raises(TypeError, match="None"):
+        list(results)
+    assert not Path("proj2").exists()
+
+
+def test_create_projects_not_installed(tmpfolder, template_dir, monkeypatch):
+    monkeypatch.setitem(sys.modules, "cookiecutter", None)
+    # The error is raised when called, not when the results are consumed
+    with pytest.raises(NotInstalled):
+        create_projects(str(template_dir), [{"project_path": "proj"}])
+
+
+def test_template_can_be_pickled(template_dir, tmpfolder):
+    template = Template(template_dir)
+    template.generate(tmpfolder / "a")  # <- Jinja environment is created
+    clone = pickle.loads(pickle.dumps(template))
+    assert clone.context == template.context
+    assert clone.generate(tmpfolder / "b").exists()
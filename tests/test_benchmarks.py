@@ -0,0 +1,142 @@
+"""Performance benchmarks (requires ``pytest-benchmark``), run with::
+
+    tox -e benchmark
+    # or
+    pytest -m benchmark --benchmark-only --no-cov
+
+Benchmarks are skipped unless explicitly selected with ``-m benchmark``.
+Projects are generated end-to-end (:obj:`pyscaffold.api.create_project` with the
+:obj:`~pyscaffoldext.cookiecutter.extension.Cookiecutter` extension) from templates
+of increasing size, fetched from a local :obj:`~.helpers.GitServer` (no network is
+necessary). The peak memory (as measured by :mod:`tracemalloc`) is reported in the
+``extra_info`` of each benchmark.
+"""
+import shutil
+import tracemalloc
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import NO_CONFIG, create_project
+
+from pyscaffoldext.cookiecutter.extension import Cookiecutter
+
+from .helpers import GitServer, create_synthetic_template
+
+pytest.importorskip("pytest_benchmark")
+
+SIZES = [10, 1000, pytest.param(10000, marks=pytest.mark.slow)]
+ROUNDS = 3
+
+pytestmark = [pytest.mark.benchmark(group="create_project")]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def only_when_selected(request):
+    # Benchmarks are too slow to be part of the normal test run
+    markexpr = request.config.option.markexpr or ""
+    if "benchmark" not in markexpr or "not benchmark" in markexpr:
+        pytest.skip("benchmarks only run with `-m benchmark`")
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    return GitServer(tmp_path_factory.mktemp("git-server"))
+
+
+@pytest.fixture(scope="module", params=SIZES, ids=lambda n: f"{n}-files")
+def template_url(request, server, tmp_path_factory):
+    path = tmp_path_factory.mktemp("templates") / f"template-{request.param}"
+    create_synthetic_template(path, request.param)
+    return server.publish(path)
+
+
+@pytest.fixture(scope="module")
+def monorepo_url(server, tmp_path_factory):
+    """Small template next to big (binary) ones in the same repository"""
+    path = tmp_path_factory.mktemp("templates") / "monorepo"
+    create_synthetic_template(path / "small", 10)
+    create_synthetic_template(path / "big", 10, n_binary=50, binary_size=2**20)
+    return server.publish(path)
+
+
+@pytest.fixture
+def run(tmpfolder, template_url, benchmark):
+    cache_dir = tmpfolder / "cache"
+    project = tmpfolder / "proj"
+    opts = dict(
+        project_path=project,
+        cookiecutter=template_url,
+        cookiecutter_cache_dir=cache_dir,
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+
+    def _run(cold=False, **kwargs):
+        def setup():
+            shutil.rmtree(str(project), ignore_errors=True)
+            if cold:
+                shutil.rmtree(str(cache_dir), ignore_errors=True)
+
+        def target():
+            create_project(opts, **kwargs)
+
+        setup()
+        target()  # <- warm up (fills the cache)
+        benchmark.extra_info["peak_memory"] = peak_memory(target, setup)
+        benchmark.pedantic(target, setup=setup, rounds=ROUNDS, iterations=1)
+        return project
+
+    return _run
+
+
+def peak_memory(fn, setup) -> int:
+    """Maximum memory allocated (in bytes) while calling ``fn``"""
+    setup()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_cold_cache(run):
+    project = run(cold=True)
+    assert Path(project, "data0/file0.py").exists()
+
+
+def test_warm_cache(run):
+    project = run()
+    assert Path(project, "data0/file0.py").exists()
+
+
+def test_pretend(run):
+    project = run(cold=True, pretend=True)
+    assert not Path(project).exists()
+
+
+def test_parallel_rendering(run):
+    project = run(cookiecutter_jobs=0)
+    assert Path(project, "data0/file0.py").exists()
+
+
+@pytest.mark.parametrize("directory", ["small", "big"])
+def test_fetch_from_monorepo(tmpfolder, monorepo_url, benchmark, directory):
+    # Only the selected template is fetched, its size should dominate the timing
+    cache_dir = tmpfolder / "cache"
+    opts = dict(
+        cookiecutter=monorepo_url,
+        cookiecutter_directory=directory,
+        cookiecutter_cache_dir=cache_dir,
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+
+    def setup():
+        shutil.rmtree(str(cache_dir), ignore_errors=True)
+        shutil.rmtree(str(tmpfolder / "proj"), ignore_errors=True)
+
+    def target():
+        create_project(opts, project_path=tmpfolder / "proj")
+
+    benchmark.pedantic(target, setup=setup, rounds=ROUNDS, iterations=1)
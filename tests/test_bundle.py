@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import zipfile
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import create_project
+from pyscaffold.cli import parse_args
+
+from pyscaffoldext.cookiecutter import bundle
+from pyscaffoldext.cookiecutter import cache as cache_mod
+from pyscaffoldext.cookiecutter.cache import TemplateCache
+from pyscaffoldext.cookiecutter.template import Template
+from pyscaffoldext.cookiecutter.update import STATE_FILE
+
+from .helpers import create_template, generate, git_commit_all
+
+pytestmark = [pytest.mark.usefixtures("cookiecutter_config")]
+
+
+@pytest.fixture
+def template_repo(tmp_path):
+    # The `.git` suffix helps cookiecutter to identify the repository type
+    path = create_template(tmp_path / "template-repo.git")
+    root = path / "{{cookiecutter.project_name}}"
+    (root / "run.sh").write_text("#!/bin/sh\necho {{ cookiecutter.project_name }}\n")
+    (root / "run.sh").chmod(0o755)
+    git_commit_all(path)
+    return path
+
+
+@pytest.fixture
+def url(template_repo):
+    return template_repo.resolve().as_uri()
+
+
+@pytest.fixture
+def no_clone(monkeypatch):
+    def _fail(*_args, **_kwargs):
+        raise AssertionError("template should not be fetched from the network")
+
+    monkeypatch.setattr(cache_mod, "_clone", _fail)
+
+
+def test_export(tmpfolder, url, template_repo):
+    path = bundle.export_bundle(url, tmpfolder / "template.ccbundle")
+    assert bundle.is_bundle(path)
+    with zipfile.ZipFile(str(path)) as archive:
+        assert archive.namelist()[0] == bundle.MANIFEST
+        assert all(".git/" not in name for name in archive.namelist())
+        manifest = json.loads(archive.read(bundle.MANIFEST))
+    assert manifest["source"] == url
+    assert manifest["commit"] == Template.fetch(url).commit
+    assert "{{cookiecutter.project_name}}/src" in manifest["dirs"]
+    assert manifest["files"]["{{cookiecutter.project_name}}/run.sh"]["mode"] == 0o755
+
+    # Bundles are reproducible
+    again = bundle.export_bundle(str(template_repo), tmpfolder / "again.ccbundle")
+    assert again.read_bytes() != path.read_bytes()  # different source
+    again = bundle.export_bundle(url, tmpfolder / "again.ccbundle")
+    assert again.read_bytes() == path.read_bytes()
+
+
+def test_generate_from_bundle(tmpfolder, template_repo, request):
+    # Empty folders are not stored in git, but they are kept in bundles
+    (template_repo / "{{cookiecutter.project_name}}/empty").mkdir()
+    path = bundle.export_bundle(str(template_repo), tmpfolder / "template.ccbundle")
+    request.getfixturevalue("no_clone")
+    generate(path)
+    assert Path("proj/run.sh").read_text() == "#!/bin/sh\necho proj\n"
+    assert os.access("proj/run.sh", os.X_OK)
+    assert Path("proj/empty").is_dir()
+
+    # The bundle is extracted only once
+    cache = TemplateCache()
+    (entry,) = cache.entries()
+    assert entry.url == str(template_repo) and entry.commit
+    assert cache.fetch(str(path)) == str(entry.template)
+    assert Template.fetch(str(path)).commit == entry.commit
+
+
+def test_export_relative_path(tmpfolder, template_repo, monkeypatch):
+    monkeypatch.chdir(template_repo)
+    path = bundle.export_bundle(".", tmpfolder / "template.ccbundle")
+    with zipfile.ZipFile(str(path)) as archive:
+        manifest = json.loads(archive.read(bundle.MANIFEST))
+        assert all(
+            name.startswith("template-repo.git/") for name in archive.namelist()[1:]
+        )
+    assert manifest["dirname"] == "template-repo.git"
+
+    monkeypatch.chdir(tmpfolder)
+    generate(path)
+    assert Path("proj/run.sh").read_text() == "#!/bin/sh\necho proj\n"
+
+
+def test_mirror(tmpfolder, url, request, monkeypatch):
+    mirror = tmpfolder / "mirror"
+    mirror.mkdir()
+    exported = bundle.export_bundle(url, mirror)
+    assert exported.name == bundle.bundle_filename(url)
+    request.getfixturevalue("no_clone")
+
+    opts = parse_args(
+        ["proj", "--cookiecutter", url, "--cookiecutter-mirror", "mirror"]
+    )
+    create_project(opts)
+    state = json.loads(Path("proj", STATE_FILE).read_text())
+    assert state["template"] == url
+    with bundle.open_bundle(exported) as archive:
+        assert state["commit"] == bundle.read_manifest(archive)["commit"]
+
+    # The mirror can also be configured via environment variable
+    monkeypatch.setenv(bundle.MIRROR_ENV, str(mirror))
+    generate(url, project_path="other")
+    assert Path("other/run.sh").exists()
+
+
+def test_not_in_mirror(tmpfolder, url, isolated_log):
+    isolated_log.set_level(logging.WARNING)
+    (tmpfolder / "mirror").mkdir()
+    generate(url, cookiecutter_mirror="mirror")
+    assert "not found in mirror" in isolated_log.text
+    assert Path("proj/run.sh").exists()
+
+
+def test_corrupted_bundle(tmpfolder, url):
+    path = bundle.export_bundle(url, tmpfolder / "template.ccbundle")
+    with zipfile.ZipFile(str(path)) as archive:
+        members = {i.filename: archive.read(i) for i in archive.infolist()}
+    makefile = "template-repo/{{cookiecutter.project_name}}/Makefile"
+    assert makefile in members
+    members[makefile] = b"tampered"
+    with zipfile.ZipFile(str(path), "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+
+    with pytest.raises(bundle.InvalidBundle, match="corrupted"):
+        bundle.extract(path, tmpfolder / "out")
+
+
+def test_unsafe_bundle(tmpfolder):
+    path = tmpfolder / "evil.ccbundle"
+    manifest = {"format": 1, "dirname": "..", "files": {}, "source": "x"}
+    with zipfile.ZipFile(str(path), "w") as archive:
+        archive.writestr(bundle.MANIFEST, json.dumps(manifest))
+    with pytest.raises(bundle.InvalidBundle, match="invalid path"):
+        bundle.extract(path, tmpfolder / "out")
+
+
+def test_not_a_bundle(tmpfolder):
+    Path("empty.zip").write_bytes(b"")
+    with zipfile.ZipFile("plain.zip", "w") as archive:
+        archive.writestr("file.txt", "contents")
+    assert not bundle.is_bundle("empty.zip")
+    assert not bundle.is_bundle("plain.zip")
+    assert not bundle.is_bundle("missing.zip")
@@ -0,0 +1,185 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import NO_CONFIG, create_project
+from pyscaffold.cli import parse_args
+
+from pyscaffoldext.cookiecutter import cache as cache_mod
+from pyscaffoldext.cookiecutter.cache import TemplateCache
+from pyscaffoldext.cookiecutter.extension import Cookiecutter
+
+from .helpers import create_template, git_commit_all
+
+pytestmark = [pytest.mark.usefixtures("cookiecutter_config")]
+
+
+@pytest.fixture
+def template_repo(tmp_path):
+    # The `.git` suffix helps cookiecutter to identify the repository type
+    path = create_template(tmp_path / "template-repo.git")
+    git_commit_all(path)
+    return path
+
+
+@pytest.fixture
+def no_clone(monkeypatch):
+    def _fail(*_args, **_kwargs):
+        raise AssertionError("template should not be fetched again")
+
+    monkeypatch.setattr(cache_mod, "_clone", _fail)
+
+
+def url(path):
+    return Path(path).resolve().as_uri()
+
+
+def test_fetch_stores_commit(tmpfolder, template_repo):
+    cache = TemplateCache(tmpfolder / "cache")
+    local = Path(cache.fetch(url(template_repo)))
+    assert local.is_dir()
+    assert (local / "cookiecutter.json").exists()
+    assert local.name == "template-repo"  # same name cookiecutter would use
+    (entry,) = cache.entries()
+    assert entry.url == url(template_repo)
+    assert entry.commit and len(entry.commit) == 40
+    assert entry.size > 0
+
+
+def test_fetch_twice_does_not_clone(tmpfolder, template_repo, request):
+    cache = TemplateCache(tmpfolder / "cache")
+    first = cache.fetch(url(template_repo))
+    request.getfixturevalue("no_clone")
+    assert cache.fetch(url(template_repo)) == first
+
+
+def test_moved_branch_is_fetched_again(tmpfolder, template_repo, request):
+    cache = TemplateCache(tmpfolder / "cache")
+    first = cache.fetch(url(template_repo))
+    (template_repo / "cookiecutter.json").write_text('{"project_name": "other"}')
+    new_head = git_commit_all(template_repo, "change")
+
+    # The ref is resolved every time, so the new commit is fetched
+    second = cache.fetch(url(template_repo))
+    assert second != first
+    assert cache.get(url(template_repo)).commit == new_head
+    request.getfixturevalue("no_clone")
+    assert cache.fetch(url(template_repo)) == second
+
+
+def test_refresh(tmpfolder, template_repo, monkeypatch):
+    cache = TemplateCache(tmpfolder / "cache")
+    cache.fetch(url(template_repo))
+    created = cache.get(url(template_repo)).created
+
+    # With refresh, the template is fetched again (replacing the entry)
+    calls = []
+    original = cache_mod._clone
+    monkeypatch.setattr(cache_mod, "_clone", lambda *a: calls.append(a) or original(*a))
+    cache.fetch(url(template_repo), refresh=True)
+    assert len(calls) == 1
+    assert cache.get(url(template_repo)).created > created
+    assert len(list(cache.entries())) == 1
+
+
+def test_offline(tmpfolder, template_repo, request, monkeypatch, isolated_log):
+    cache = TemplateCache(tmpfolder / "cache")
+    first = cache.fetch(url(template_repo))
+    # When the ref cannot be resolved, the most recent entry is used
+    monkeypatch.setattr(cache_mod, "remote_commit", lambda *_: None)
+    request.getfixturevalue("no_clone")
+    assert cache.fetch(url(template_repo)) == first
+    assert "using the cached version" in isolated_log.text
+
+
+def test_remote_commit(template_repo):
+    head = cache_mod.git_head(template_repo)
+    assert cache_mod.remote_commit(url(template_repo)) == head
+    branch = subprocess.check_output(
+        ["git", "rev-parse", "--abbrev-ref", "HEAD"], cwd=str(template_repo), text=True
+    )
+    assert cache_mod.remote_commit(url(template_repo), branch.strip()) == head
+    assert cache_mod.remote_commit(url(template_repo), head.upper()) == head
+    assert cache_mod.remote_commit(url(template_repo), "missing") is None
+    assert cache_mod.remote_commit("https://example.com/template.zip") is None
+
+
+def test_valid_entry_is_kept(tmpfolder, template_repo):
+    # Entries published by concurrent processes might be in use
+    cache = TemplateCache(tmpfolder / "cache")
+    local = Path(cache.fetch(url(template_repo)))
+    entry = cache.get(url(template_repo))
+    staging = tmpfolder / "staging"
+    staging.mkdir()
+    assert cache_mod._publish(staging, entry.path).created == entry.created
+    assert staging.exists() and local.is_dir()
+
+    (staging / cache_mod.ENTRY_FILE).write_text(
+        entry.path.joinpath("entry.json").read_text()
+    )
+    assert cache_mod._publish(staging, entry.path, replace=True)
+    assert not staging.exists() and not local.exists()
+
+
+def test_unused_entries_are_evicted(tmpfolder, tmp_path):
+    repos = [create_template(tmp_path / f"tpl{i}.git") for i in range(2)]
+    for repo in repos:
+        git_commit_all(repo)
+    cache = TemplateCache(tmpfolder / "cache", max_age=-1)
+    for repo in repos:
+        cache.fetch(url(repo))
+    assert [e.url for e in cache.entries()] == [url(repos[1])]
+
+
+def test_evict_least_recently_used(tmpfolder, tmp_path):
+    repos = [create_template(tmp_path / f"tpl{i}.git") for i in range(3)]
+    for repo in repos:
+        git_commit_all(repo)
+    cache = TemplateCache(tmpfolder / "cache")
+    for repo in repos:
+        cache.fetch(url(repo))
+    assert len(list(cache.entries())) == 3
+
+    # when the cache is too small to fit everything,
+    cache.max_size = cache.get(url(repos[2])).size
+    cache.fetch(url(repos[2]))  # <- make sure it is the most recently used
+    removed = cache.evict()
+
+    # then only the most recently used entry is kept
+    assert {e.url for e in removed} == {url(r) for r in repos[:2]}
+    assert [e.url for e in cache.entries()] == [url(repos[2])]
+
+
+def test_local_templates_are_not_cached(tmpfolder, tmp_path):
+    template = str(create_template(tmp_path / "local-template"))
+    cache = TemplateCache(tmpfolder / "cache")
+    assert cache.fetch(template) == template
+    assert not list(cache.entries())
+
+
+def test_create_project_uses_cache(tmpfolder, template_repo, request):
+    opts = dict(
+        cookiecutter=url(template_repo),
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+    create_project(opts, project_path="proj1")
+    assert Path("proj1/Makefile").exists()
+
+    # Once the template is cached, no fetching is necessary
+    request.getfixturevalue("no_clone")
+    create_project(opts, project_path="proj2")
+    assert Path("proj2/Makefile").exists()
+
+
+def test_cli_refresh(tmpfolder, template_repo, monkeypatch):
+    args = ["proj", "--no-config", "--cookiecutter", url(template_repo)]
+    assert parse_args(args)["cookiecutter_refresh"] is False
+    create_project(parse_args(args))
+
+    calls = []
+    original = cache_mod._clone
+    monkeypatch.setattr(cache_mod, "_clone", lambda *a: calls.append(a) or original(*a))
+    opts = parse_args(["proj2", *args[1:], "--cookiecutter-refresh"])
+    create_project(opts)
+    assert len(calls) == 1
@@ -1,6 +1,7 @@
 import logging
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
 from pathlib import Path
 
@@ -14,28 +15,28 @@ from pyscaffoldext.cookiecutter.extension import (
     Cookiecutter,
     MissingTemplate,
     NotInstalled,
+    create_cookiecutter,
 )
 
-from .helpers import disable_import
+from .helpers import PYPACKAGE_URL, create_template, disable_import
 
 pytestmark = [pytest.mark.usefixtures("cookiecutter_config")]
 
 PROJ_NAME = "proj"
-COOKIECUTTER_URL = "https://github.com/pyscaffold/cookiecutter-pypackage.git"
+COOKIECUTTER_URL = PYPACKAGE_URL
 COOKIECUTTER_FILES = ["proj/Makefile", "proj/.github/ISSUE_TEMPLATE.md"]
 
 FLAG = Cookiecutter().flag
 
 
-@pytest.mark.slow
-def test_create_project_with_cookiecutter(tmpfolder):
+def test_create_project_with_cookiecutter(tmpfolder, pypackage_url):
     # Given options with the cookiecutter extension,
     opts = dict(
         project_path=PROJ_NAME,
         name=PROJ_NAME,
         package=PROJ_NAME,
         version=pyscaffold_version,
-        cookiecutter=COOKIECUTTER_URL,
+        cookiecutter=pypackage_url,
         extensions=[Cookiecutter()],
         config_files=NO_CONFIG,
     )
@@ -79,6 +80,53 @@ def test_pretend_create_project_with_cookiecutter(tmpfolder, isolated_log):
     assert re.search(r"run.+cookiecutter", logs)
 
 
+def test_create_cookiecutter_from_threads(tmpfolder, monkeypatch):
+    # Given a template and the options for several projects
+    template = str(create_template(tmpfolder / "template"))
+    info = dict(author="A", email="a@b.c", release_date="now", year="2000")
+    projects = [
+        dict(
+            project_path=tmpfolder / f"proj{i}",
+            name=f"proj{i}",
+            package="pkg",
+            description="...",
+            cookiecutter=template,
+            **info,
+        )
+        for i in range(4)
+    ]
+
+    # when the cookiecutter action runs from different threads
+    monkeypatch.setattr(os, "chdir", pytest.fail)
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda opts: create_cookiecutter({}, opts), projects))
+
+    # then the template should be rendered directly into the correct folders
+    for i in range(4):
+        assert (tmpfolder / f"proj{i}/src/pkg/info.py").exists()
+
+
+def test_create_project_cookiecutter_existing_folder(tmpfolder):
+    from cookiecutter.exceptions import OutputDirExistsException
+
+    # Given a folder with the same name as the project
+    template = str(create_template(tmpfolder / "template"))
+    Path("proj").mkdir()
+    Path("proj/Makefile").write_text("precious")
+    opts = dict(
+        project_path="proj",
+        cookiecutter=template,
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+
+    # when the project is created, then it should fail (as cookiecutter does)
+    with pytest.raises(OutputDirExistsException, match="already exists"):
+        create_project(opts)
+    # and the existing files should not be touched.
+    assert Path("proj/Makefile").read_text() == "precious"
+
+
 def test_create_project_with_cookiecutter_but_no_template(tmpfolder):
     # Given options with the cookiecutter extension, but no template
     opts = dict(
@@ -150,12 +198,11 @@ def test_create_project_cookiecutter_and_update(tmpfolder, capfd):
             raise
 
 
-@pytest.mark.slow
-def test_cli_with_cookiecutter(tmpfolder):
+def test_cli_with_cookiecutter(tmpfolder, pypackage_url):
     assert not (tmpfolder / PROJ_NAME).exists()
 
     # Given the command line with the cookiecutter option,
-    args = ["--no-config", PROJ_NAME, FLAG, COOKIECUTTER_URL]
+    args = ["--no-config", PROJ_NAME, FLAG, pypackage_url]
     # --no-config: avoid extra config from dev's machine interference
 
     # when pyscaffold runs,
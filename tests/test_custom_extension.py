@@ -8,18 +8,14 @@ from pyscaffoldext.cookiecutter.extension import Cookiecutter
 
 from .helpers import run_common_tasks
 
-EXT_FLAGS = [
-    Cookiecutter().flag,
-    "https://github.com/pyscaffold/cookiecutter-pypackage.git",
-]
-
 # If you need to check logs with caplog, have a look on
 # pyscaffoldext-custom-extension's tests/conftest.py file and the
 # `isolated_logger` fixture.
 
 
-def test_add_custom_extension(tmpfolder):
-    args = ["--no-config", *EXT_FLAGS, "my_project", "-p", "my_package"]
+def test_add_custom_extension(tmpfolder, pypackage_url):
+    ext_flags = [Cookiecutter().flag, pypackage_url]
+    args = ["--no-config", *ext_flags, "my_project", "-p", "my_package"]
     # --no-config: avoid extra config from dev's machine interference
     cli.main(args)
 
@@ -28,8 +24,9 @@ def test_add_custom_extension(tmpfolder):
 
 @pytest.mark.slow
 @pytest.mark.system
-def test_generated_extension(tmpfolder):
-    args = ["--no-config", "--venv", "--pre-commit", *EXT_FLAGS, "my_project"]
+def test_generated_extension(tmpfolder, pypackage_url):
+    ext_flags = [Cookiecutter().flag, pypackage_url]
+    args = ["--no-config", "--venv", "--pre-commit", *ext_flags, "my_project"]
     # --no-config: avoid extra config from dev's machine interference
     # --venv: generate a venv so we can install the resulting project
     # --pre-commit: ensure generated files respect repository conventions
@@ -0,0 +1,250 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from tempfile import mkdtemp
+from threading import Thread
+
+import pytest
+
+from pyscaffoldext.cookiecutter import cli
+from pyscaffoldext.cookiecutter.client import (
+    SOCKET_ENV,
+    SOCKET_NAME,
+    connect,
+    ensure_private_dir,
+    private_dir,
+    request,
+)
+from pyscaffoldext.cookiecutter.client import socket_path as default_socket_path
+from pyscaffoldext.cookiecutter.daemon import (
+    PROTOCOL_VERSION,
+    Daemon,
+    TemplatePool,
+    control,
+)
+
+from .helpers import create_template, git_commit_all, rmpath
+
+pytestmark = [
+    pytest.mark.usefixtures("cookiecutter_config"),
+    pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="requires Unix sockets"),
+]
+
+
+@pytest.fixture
+def socket_path():
+    # Unix sockets have a short maximum path length (pytest's tmp_path can be long)
+    folder = mkdtemp(prefix="daemon-")
+    yield os.path.join(folder, "daemon.sock")
+    rmpath(folder)
+
+
+@pytest.fixture
+def daemon(socket_path):
+    daemon = Daemon(socket_path)
+    thread = Thread(target=daemon.serve, daemon=True)
+    thread.start()
+    assert daemon.wait_ready(10)
+    yield daemon
+    daemon.shutdown()
+    thread.join(10)
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    return create_template(tmp_path / "template")
+
+
+def client(socket_path, *args):
+    """The client runs in a separate process (as it would in practice)"""
+    cmd = [sys.executable, "-m", "pyscaffoldext.cookiecutter.client", *args]
+    env = {**os.environ, SOCKET_ENV: socket_path}
+    return subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=60)
+
+
+def putup_args(project, template):
+    return [project, "--no-config", "--cookiecutter", str(template)]
+
+
+def test_create(tmpfolder, daemon, template_dir):
+    proc = client(daemon.path, *putup_args("proj", template_dir), "--verbose")
+    assert proc.returncode == 0, proc.stderr
+    assert "done!" in proc.stdout
+    assert "create" in proc.stderr  # the logs are forwarded to the client
+    assert Path("proj/Makefile").read_text() == "all:\n\t@echo proj\n"
+    assert Path("proj/setup.cfg").exists()
+    assert daemon.requests == 1
+
+
+def test_template_pool(tmpfolder, daemon, template_dir):
+    for name in ("a", "b"):
+        assert client(daemon.path, *putup_args(name, template_dir)).returncode == 0
+    assert (daemon.pool.hits, daemon.pool.misses) == (1, 1)
+
+    # Local templates are loaded again when they change
+    makefile = template_dir / "{{cookiecutter.project_name}}/Makefile"
+    makefile.write_text("all:\n\t@echo changed\n")
+    assert client(daemon.path, *putup_args("c", template_dir)).returncode == 0
+    assert "changed" in Path("c/Makefile").read_text()
+    assert (daemon.pool.hits, daemon.pool.misses) == (1, 2)
+
+
+def test_template_pool_remote(tmpfolder, tmp_path):
+    # The `.git` suffix helps cookiecutter to identify the repository type
+    template_dir = create_template(tmp_path / "remote.git")
+    git_commit_all(template_dir)
+    opts = {
+        "cookiecutter": template_dir.resolve().as_uri(),
+        "cookiecutter_cache_dir": "c",
+    }
+    pool = TemplatePool()
+    first = pool.get(opts)
+    assert pool.get(opts) is first
+
+    # Remote templates are loaded again when the ref points to another commit
+    (template_dir / "cookiecutter.json").write_text('{"project_name": "other"}')
+    git_commit_all(template_dir, "change")
+    assert pool.get(opts) is not first
+    assert (pool.hits, pool.misses) == (1, 2)
+
+
+def test_errors(tmpfolder, daemon, template_dir):
+    proc = client(daemon.path, *putup_args("proj", template_dir), "--invalid")
+    assert proc.returncode == 2
+    assert "unrecognized arguments" in proc.stderr
+
+    args = [*putup_args("proj", template_dir), "--cookiecutter-params", "unknown=1"]
+    proc = client(daemon.path, *args)
+    assert proc.returncode == 1
+    assert "ERROR:" in proc.stdout and "unknown" in proc.stdout
+
+    # The daemon is still usable
+    assert client(daemon.path, *putup_args("proj", template_dir)).returncode == 0
+
+    responses = list(request({"command": "create", "version": 0}, daemon.path))
+    assert responses[-1]["exit"] == 2
+    assert list(request({"command": "other"}, daemon.path))[-1]["exit"] == 2
+
+    # Malformed requests are rejected (instead of breaking the connection)
+    create = {"command": "create", "version": PROTOCOL_VERSION}
+    for invalid in ({}, {"args": "proj", "cwd": "."}, {"args": [1], "cwd": "."}):
+        (response,) = request({**create, **invalid}, daemon.path)
+        assert response["exit"] == 2 and "Invalid create request" in response["stderr"]
+
+
+def test_without_daemon(tmpfolder, socket_path, template_dir):
+    # The client generates the project by itself
+    proc = client(socket_path, *putup_args("proj", template_dir))
+    assert proc.returncode == 0, proc.stderr
+    assert Path("proj/Makefile").exists()
+
+
+def test_control(tmpfolder, daemon):
+    assert control("ping", daemon.path)["pid"] == os.getpid()
+    stats = control("stats", daemon.path)["stats"]
+    assert stats["requests"] == 0 and stats["templates"] == 0
+
+    assert control("stop", daemon.path)["exit"] == 0
+    assert daemon._stopped.wait(10)
+    with pytest.raises(OSError):
+        control("ping", daemon.path)
+
+
+def test_socket(socket_path):
+    # A socket left behind by a daemon that was killed is replaced
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    daemon = Daemon(socket_path, idle_timeout=0.5)
+    thread = Thread(target=daemon.serve, daemon=True)
+    thread.start()
+    assert daemon.wait_ready(10)
+    assert os.stat(socket_path).st_mode & 0o077 == 0
+
+    # Only a daemon can listen to the socket
+    with pytest.raises(OSError, match="already listening"):
+        Daemon(socket_path).serve()
+
+    # The daemon stops after being idle
+    thread.join(10)
+    assert not thread.is_alive()
+    assert not os.path.exists(socket_path)
+
+
+def test_default_socket(monkeypatch):
+    folder = mkdtemp(prefix="tmp-")
+    monkeypatch.setattr(tempfile, "tempdir", folder)
+    monkeypatch.delenv(SOCKET_ENV, raising=False)
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    try:
+        # The temporary folder is shared, the socket is in a private folder
+        path = default_socket_path()
+        assert path == os.path.join(private_dir(), SOCKET_NAME)
+        assert os.path.dirname(private_dir()) == folder
+        daemon = Daemon(idle_timeout=0.5)
+        thread = Thread(target=daemon.serve, daemon=True)
+        thread.start()
+        assert daemon.wait_ready(10)
+        assert os.stat(private_dir()).st_mode & 0o777 == 0o700
+        thread.join(10)
+
+        # Folders accessible by other users are not used
+        os.chmod(private_dir(), 0o777)
+        with pytest.raises(PermissionError):
+            ensure_private_dir(private_dir())
+        with pytest.raises(PermissionError):
+            Daemon().serve()
+    finally:
+        rmpath(folder)
+
+    monkeypatch.setenv("XDG_RUNTIME_DIR", folder)
+    assert default_socket_path() == os.path.join(folder, SOCKET_NAME)
+
+
+def test_daemon_of_other_user(socket_path, monkeypatch):
+    # The client does not talk to daemons of other users (e.g. a fake one)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen(1)
+        connect(socket_path, timeout=10).close()
+        monkeypatch.setattr(os, "getuid", lambda: os.geteuid() + 1)
+        with pytest.raises(PermissionError):
+            connect(socket_path, timeout=10)
+
+
+def test_preload(tmpfolder, template_dir):
+    daemon = Daemon(pool=TemplatePool(max_templates=1))
+    daemon.preload([str(template_dir), str(tmpfolder / "missing")])
+    assert len(daemon.pool) == 1
+    other = create_template(tmpfolder / "other")
+    daemon.preload([str(other)])
+    assert len(daemon.pool) == 1  # the least recently used template is dropped
+
+
+def test_cli(tmpfolder, daemon, socket_path, capsys):
+    assert cli.main(["daemon", "--socket", socket_path, "--status"]) == 0
+    assert '"requests": 0' in capsys.readouterr().out
+    assert cli.main(["daemon", "--socket", socket_path, "--stop"]) == 0
+    assert daemon._stopped.wait(10)
+    assert cli.main(["daemon", "--socket", socket_path, "--stop"]) == 1
+
+
+def test_cli_cache_options(tmpfolder, socket_path, template_dir):
+    # Options of ``putup-cookiecutter`` are used by the requests
+    args = ["--cache-dir", "cache", "daemon", "--socket", socket_path]
+    thread = Thread(target=cli.main, args=([*args, "--idle-timeout", "1"],))
+    thread.start()
+    try:
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            thread.join(0.1)
+        proc = client(socket_path, *putup_args("proj", template_dir))
+        assert proc.returncode == 0, proc.stderr
+        assert Path("cache").is_dir() and os.listdir("cache")
+    finally:
+        thread.join(10)
+    assert not thread.is_alive()
@@ -0,0 +1,153 @@
+import errno
+import logging
+import os
+import shutil
+import stat
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import NO_CONFIG, create_project
+from pyscaffold.cli import parse_args
+
+from pyscaffoldext.cookiecutter import stream
+from pyscaffoldext.cookiecutter.batch import create_projects
+from pyscaffoldext.cookiecutter.dedup import BlobStore, DedupReport
+from pyscaffoldext.cookiecutter.extension import Cookiecutter
+from pyscaffoldext.cookiecutter.update import STATE_FILE
+
+from .helpers import create_template, git_commit_all
+
+FILES = {
+    "Makefile": "all:\n\t@echo {{ cookiecutter.project_name }}\n",
+    "data/shared.txt": "the same in every project\n" * 100,
+}
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    return create_template(tmp_path / "template", FILES)
+
+
+def same_file(a, b):
+    return os.stat(str(a)).st_ino == os.stat(str(b)).st_ino
+
+
+def writable(path):
+    return bool(os.stat(str(path)).st_mode & stat.S_IWUSR)
+
+
+def test_batch(tmpfolder, template_dir, isolated_log):
+    isolated_log.set_level(logging.INFO)
+    projects = [{"project_path": f"proj{i}"} for i in range(3)]
+    results = list(create_projects(str(template_dir), projects, cookiecutter_dedup="s"))
+    assert all(r.ok and r.dedup for r in results)
+
+    # Identical files are shared, the others are not
+    assert same_file("proj0/data/shared.txt", "proj2/data/shared.txt")
+    # Files generated by PyScaffold (rewritten by ``putup --update``) are not linked
+    assert os.stat("proj0/LICENSE.txt").st_nlink == 1
+    assert writable("proj1/setup.cfg")
+    assert not same_file("proj0/Makefile", "proj1/Makefile")
+    assert Path("proj1/Makefile").read_text() == "all:\n\t@echo proj1\n"
+    assert not writable("proj1/data/shared.txt")
+    assert not same_file(f"proj0/{STATE_FILE}", f"proj1/{STATE_FILE}")
+    assert os.stat(f"proj0/{STATE_FILE}").st_nlink == 1
+    git_files = [p for p in Path("proj0/.git").rglob("*") if p.is_file()]
+    assert git_files and all(p.stat().st_nlink == 1 for p in git_files)
+
+    first, *others = [r.dedup for r in results]
+    assert first.saved == 0 and first.stored > 0 and first.linked == first.files
+    assert all(r.saved > 0 and r.linked == r.files for r in others)
+    total = DedupReport.total(r.dedup for r in results)
+    assert total.files == sum(r.dedup.files for r in results)
+    assert total.ratio > 1
+    assert BlobStore("s").usage() == total.size - total.saved
+    assert "ratio" in isolated_log.text
+
+
+def test_update(tmpfolder, template_dir):
+    git_commit_all(template_dir)
+    opts = dict(
+        cookiecutter=str(template_dir),
+        cookiecutter_dedup="store",
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+    for project in ("a", "b"):
+        create_project(opts, project_path=project)
+    assert same_file("a/data/shared.txt", "b/data/shared.txt")
+
+    shared = template_dir / "{{cookiecutter.project_name}}/data/shared.txt"
+    shared.write_text("changed\n")
+    git_commit_all(template_dir, "change")
+    create_project(opts, project_path="a", update=True)
+    # Updated files are no longer linked, the other projects are not affected
+    assert Path("a/data/shared.txt").read_text() == "changed\n"
+    assert Path("b/data/shared.txt").read_text() == FILES["data/shared.txt"]
+
+
+def test_linked_files_are_not_modified(tmp_path):
+    # e.g. a project file hardlinked to the template cache (``--cookiecutter-link``)
+    cached = tmp_path / "cache/file.txt"
+    cached.parent.mkdir()
+    cached.write_text("cached")
+    cached.chmod(0o644)
+    project = tmp_path / "proj"
+    project.mkdir()
+    os.link(str(cached), str(project / "file.txt"))
+
+    report = BlobStore(tmp_path / "s").dedup(project)
+    assert report.stored > 0
+    assert not same_file(cached, project / "file.txt")
+    assert stat.S_IMODE(cached.stat().st_mode) == 0o644
+    assert not writable(project / "file.txt")
+
+
+def test_reflink(tmpfolder, template_dir, monkeypatch):
+    def clone(src, dst):
+        shutil.copy2(str(src), str(dst))
+        return True
+
+    monkeypatch.setattr(stream, "clone_file", clone)
+    opts = dict(
+        cookiecutter=str(template_dir),
+        cookiecutter_dedup="store",
+        cookiecutter_link="reflink",
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+    create_project(opts, project_path="a")
+    _, opts = create_project(opts, project_path="b")
+    report = opts["cookiecutter_dedup_report"]
+    assert report.saved > 0 and report.linked == report.files
+    assert not same_file("a/data/shared.txt", "b/data/shared.txt")
+    assert writable("b/data/shared.txt")
+
+
+def test_cannot_link(tmpfolder, template_dir, monkeypatch):
+    def cross_device(*_args):
+        raise OSError(errno.EXDEV, "cross-device")
+
+    monkeypatch.setattr(os, "link", cross_device)
+    Path("proj").mkdir()
+    Path("proj/file.txt").write_text("contents")
+    report = BlobStore("store").dedup("proj")
+    assert report == DedupReport(files=1, size=8)
+    assert writable("proj/file.txt")
+
+
+def test_cli(tmpfolder, template_dir):
+    args = ["proj", "--no-config", "--cookiecutter", str(template_dir)]
+    opts = parse_args([*args, "--cookiecutter-dedup", "store"])
+    assert opts["cookiecutter_dedup"] == "store"
+    create_project(opts)
+    blob = next(BlobStore("store").blobs())
+    assert os.stat(str(blob)).st_nlink == 2
+
+
+def test_report():
+    report = DedupReport(2, 100, 2, 50, 50) + DedupReport(1, 50, 1, 0, 50)
+    assert report == DedupReport(3, 150, 3, 50, 100)
+    assert report.ratio == 3
+    assert DedupReport.total([None, report]) == report
+    assert DedupReport().ratio == 1
@@ -0,0 +1,153 @@
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import NO_CONFIG, create_project
+from pyscaffold.cli import parse_args
+
+from pyscaffoldext.cookiecutter.cache import TemplateCache, clean_directory
+from pyscaffoldext.cookiecutter.extension import Cookiecutter
+from pyscaffoldext.cookiecutter.template import Template
+from pyscaffoldext.cookiecutter.update import State
+
+from .helpers import create_template, git_commit_all
+
+pytestmark = [pytest.mark.usefixtures("cookiecutter_config")]
+
+DIRECTORY = "templates/lib"
+
+
+@pytest.fixture
+def monorepo(tmp_path):
+    """Repository with a template in a subdirectory, other (big) directories and
+    some history
+    """
+    path = tmp_path / "monorepo.git"
+    create_template(path / DIRECTORY)
+    (path / "assets").mkdir()
+    (path / "assets/big.bin").write_bytes(os.urandom(2**20))
+    first = git_commit_all(path)
+    git(path, "tag", "v1")
+    makefile = path / DIRECTORY / "{{cookiecutter.project_name}}/Makefile"
+    makefile.write_text("all:\n\t@echo v2\n")
+    second = git_commit_all(path, "v2")
+    return path, first, second
+
+
+@pytest.fixture
+def served(monorepo, git_server):
+    """Same as ``monorepo``, but fetched from a server that supports partial clones"""
+    path, first, second = monorepo
+    return git_server.publish(path), first, second
+
+
+def git(path, *args):
+    cmd = ["git", *args]
+    return subprocess.check_output(cmd, cwd=str(path), text=True).strip()
+
+
+def url(path):
+    return Path(path).resolve().as_uri()
+
+
+def test_sparse_shallow_fetch(tmpfolder, served):
+    repo_url, _, head = served
+    cache = TemplateCache(tmpfolder / "cache")
+    local = Path(cache.fetch(repo_url, directory=DIRECTORY))
+    assert local.name == "monorepo"
+    assert (local / DIRECTORY / "cookiecutter.json").exists()
+    assert not (local / "assets").exists()
+    assert git(local, "rev-parse", "--is-shallow-repository") == "true"
+    assert git(local, "rev-list", "--count", "HEAD") == "1"
+
+    (entry,) = cache.entries()
+    assert entry.commit == head
+    assert entry.directory == DIRECTORY
+    assert entry.size < 2**20  # big.bin is not downloaded
+    # The whole repository is a different entry
+    cache.fetch(repo_url)
+    assert len(list(cache.entries())) == 2
+    assert max(e.size for e in cache.entries()) > 2**20
+
+
+@pytest.mark.parametrize("ref", ["v1", "first", "abbreviated"])
+def test_ref(tmpfolder, monorepo, ref):
+    repo, first, _ = monorepo
+    checkout = {"v1": "v1", "first": first, "abbreviated": first[:8]}[ref]
+    cache = TemplateCache(tmpfolder / "cache")
+    template = Template.fetch(url(repo), checkout, cache=cache, directory=DIRECTORY)
+    assert template.commit == first
+    assert template.root.name == "monorepo"
+    assert template.repo_dir == template.root / DIRECTORY
+    makefile = template.repo_dir / "{{cookiecutter.project_name}}/Makefile"
+    assert "v2" not in makefile.read_text()
+
+
+def test_full_clone(tmpfolder, monorepo):
+    repo, *_ = monorepo
+    cache = TemplateCache(tmpfolder / "cache", shallow=False)
+    local = Path(cache.fetch(url(repo)))
+    assert git(local, "rev-list", "--count", "HEAD") == "2"
+    assert (local / "assets/big.bin").exists()
+
+
+def test_missing_ref(tmpfolder, monorepo):
+    from cookiecutter.exceptions import RepositoryCloneFailed
+
+    repo, *_ = monorepo
+    cache = TemplateCache(tmpfolder / "cache")
+    with pytest.raises(RepositoryCloneFailed, match="missing"):
+        cache.fetch(url(repo), "missing")
+    assert not list(cache.entries())
+
+
+def test_cli(tmpfolder, monorepo):
+    repo, first, _ = monorepo
+    args = ["proj", "--no-config", "--cookiecutter", url(repo)]
+    args += ["--cookiecutter-ref", "v1", "--cookiecutter-directory", f"./{DIRECTORY}/"]
+    opts = parse_args(args)
+    assert opts["cookiecutter_ref"] == "v1"
+    create_project(opts)
+    assert Path("proj/Makefile").read_text() == "all:\n\t@echo proj\n"
+    state = State.load(Path("proj"))
+    assert state.commit == first
+    assert state.directory == DIRECTORY
+
+
+def test_local_template(tmpfolder, monorepo):
+    repo, _, head = monorepo
+    opts = dict(
+        cookiecutter=str(repo),
+        cookiecutter_directory=DIRECTORY,
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+    create_project(opts, project_path="proj")
+    assert "v2" in Path("proj/Makefile").read_text()
+    assert State.load(Path("proj")).commit == head
+
+
+def test_update(tmpfolder, monorepo):
+    repo, *_ = monorepo
+    opts = dict(
+        cookiecutter=str(repo), extensions=[Cookiecutter()], config_files=NO_CONFIG
+    )
+    create_project(opts, project_path="proj", cookiecutter_directory=DIRECTORY)
+    makefile = repo / DIRECTORY / "{{cookiecutter.project_name}}/Makefile"
+    makefile.write_text("all:\n\t@echo v3\n")
+    head = git_commit_all(repo, "v3")
+
+    # The directory recorded in the project is used by default
+    create_project(opts, project_path="proj", update=True)
+    assert "v3" in Path("proj/Makefile").read_text()
+    assert State.load(Path("proj")).commit == head
+
+
+def test_clean_directory():
+    assert clean_directory(None) is None
+    assert clean_directory(".") is None
+    assert clean_directory("./a/b/") == "a/b"
+    for invalid in ("/a", "a/../../b"):
+        with pytest.raises(ValueError):
+            clean_directory(invalid)
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import create_project
+from pyscaffold.cli import parse_args
+
+from pyscaffoldext.cookiecutter.hooks import HOOKS, HookPolicy
+
+from .helpers import create_template, generate
+
+pytestmark = [pytest.mark.usefixtures("cookiecutter_config")]
+
+PRE_HOOK = """\
+import json, os, sys
+env = dict(os.environ)
+stdin = sys.stdin.read() if sys.stdin else None
+with open("pre.json", "w") as file:
+    json.dump({"env": env, "stdin": stdin}, file)
+"""
+
+SLOW_HOOK = """\
+import subprocess, sys, time
+child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+with open("../child.pid", "w") as file:  # the project folder is removed
+    file.write(str(child.pid))
+time.sleep(60)
+"""
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    path = create_template(tmp_path / "template")
+    (path / "hooks").mkdir()
+    (path / "hooks/pre_gen_project.py").write_text(PRE_HOOK)
+    (path / "hooks/post_gen_project.py").write_text("open('post.txt', 'w').close()\n")
+    return path
+
+
+def pre_hook_run():
+    return json.loads(Path("proj/pre.json").read_text())
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    status = Path(f"/proc/{pid}/status")
+    return not (status.exists() and "zombie" in status.read_text())
+
+
+def test_default(tmpfolder, template_dir, isolated_log, monkeypatch):
+    monkeypatch.setenv("PYSCAFFOLDEXT_SECRET", "secret")
+    isolated_log.set_level(logging.INFO)
+    generate(template_dir)
+    assert pre_hook_run()["env"]["PYSCAFFOLDEXT_SECRET"] == "secret"
+    assert Path("proj/post.txt").exists()
+    # The time taken by each hook is reported
+    assert "pre_gen_project (pre_gen_project.py) in" in isolated_log.text
+    assert "post_gen_project (post_gen_project.py) in" in isolated_log.text
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_skip_hooks(tmpfolder, template_dir, in_memory):
+    generate(template_dir, cookiecutter_skip_hooks=True)
+    assert not Path("proj/pre.json").exists()
+    assert not Path("proj/post.txt").exists()
+
+    generate(
+        template_dir,
+        project_path="other",
+        cookiecutter_skip_hooks=["post_gen_project"],
+        cookiecutter_in_memory=in_memory,
+    )
+    assert not Path("other/post.txt").exists()
+
+
+def test_isolated(tmpfolder, template_dir, monkeypatch):
+    monkeypatch.setenv("PYSCAFFOLDEXT_SECRET", "secret")
+    generate(
+        template_dir,
+        cookiecutter_hook_isolated=True,
+        cookiecutter_hook_env={"EXTRA": "value"},
+    )
+    run = pre_hook_run()
+    assert "PYSCAFFOLDEXT_SECRET" not in run["env"]
+    assert run["env"]["EXTRA"] == "value"
+    assert run["env"]["PATH"] == os.environ["PATH"]
+    assert run["stdin"] == ""
+
+
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="POSIX process groups")
+def test_timeout(tmpfolder, template_dir):
+    from cookiecutter.exceptions import FailedHookException
+
+    (template_dir / "hooks/post_gen_project.py").write_text(SLOW_HOOK)
+    start = time.perf_counter()
+    with pytest.raises(FailedHookException, match="timed out"):
+        generate(template_dir, cookiecutter_hook_timeout={"post_gen_project": 0.5})
+    assert time.perf_counter() - start < 30
+
+    # The hook is killed together with the processes it started
+    pid = int(Path("child.pid").read_text())
+    deadline = time.time() + 10
+    while is_running(pid) and time.time() < deadline:
+        time.sleep(0.1)
+    assert not is_running(pid)
+    assert not Path("proj").exists()  # the partial project is removed
+
+
+def test_cli(tmpfolder, template_dir):
+    args = ["proj", "--no-config", "--cookiecutter", str(template_dir)]
+    opts = parse_args(
+        [
+            *args,
+            "--cookiecutter-hook-timeout",
+            "60",
+            "pre_gen_project=5",
+            "--cookiecutter-hook-env",
+            "EXTRA=value",
+            "--cookiecutter-skip-hooks",
+        ]
+    )
+    assert HookPolicy.from_opts(opts).skip == frozenset(HOOKS)
+    create_project(opts)
+    assert Path("proj/Makefile").exists()
+    assert not Path("proj/pre.json").exists()
+
+    for invalid in (
+        ["--cookiecutter-hook-timeout", "-1"],
+        ["--cookiecutter-skip-hooks", "other"],
+    ):
+        with pytest.raises(SystemExit):
+            parse_args([*args, *invalid])
+
+
+def test_policy():
+    assert HookPolicy.from_opts({}) == HookPolicy()
+    assert HookPolicy().environment() is None
+
+    policy = HookPolicy.from_opts(
+        {"cookiecutter_hook_timeout": ["60", "post_gen_project=600", 30]}
+    )
+    assert policy.timeout_for("pre_gen_project") == 30
+    assert policy.timeout_for("post_gen_project") == 600
+    assert HookPolicy.from_opts({"cookiecutter_hook_timeout": 5}).timeout == 5
+    assert HookPolicy.from_opts(
+        {"cookiecutter_skip_hooks": "pre_gen_project"}
+    ).skip == {"pre_gen_project"}
+
+    invalid = [
+        {"cookiecutter_hook_timeout": 0},
+        {"cookiecutter_hook_timeout": "other=5"},
+        {"cookiecutter_hook_timeout": "soon"},
+        {"cookiecutter_skip_hooks": ["other"]},
+    ]
+    for opts in invalid:
+        with pytest.raises(ValueError):
+            HookPolicy.from_opts(opts)
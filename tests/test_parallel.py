@@ -0,0 +1,96 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+from cookiecutter.exceptions import UndefinedVariableInTemplate
+from pyscaffold.api import NO_CONFIG, create_project
+from pyscaffold.cli import parse_args
+
+from pyscaffoldext.cookiecutter.extension import Cookiecutter
+from pyscaffoldext.cookiecutter.template import Template, process_pool
+
+from .helpers import create_synthetic_template
+
+N_FILES = 120
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    path = create_synthetic_template(tmp_path / "template", N_FILES, 25)
+    context = json.loads((path / "cookiecutter.json").read_text())
+    context["_copy_without_render"] = ["raw"]
+    (path / "cookiecutter.json").write_text(json.dumps(context))
+    root = path / "{{cookiecutter.project_name}}"
+    (root / "raw").mkdir()
+    (root / "raw/{{ not rendered }}.txt").write_text("{{ not rendered }}")
+    (root / "windows.txt").write_bytes(b"{{ cookiecutter.author }}\r\nline\r\n")
+    (root / "logo.bin").write_bytes(bytes(range(256)) * 4)
+    (root / "run.sh").write_text("#!/bin/sh\necho {{ cookiecutter.project_name }}\n")
+    (root / "run.sh").chmod(0o755)
+    return path
+
+
+def snapshot(path):
+    """Contents and permissions of all the files in ``path``"""
+    return {
+        p.relative_to(path).as_posix(): (p.read_bytes(), os.stat(p).st_mode)
+        for p in sorted(Path(path).rglob("*"))
+        if p.is_file() and ".git" not in p.parts
+    }
+
+
+@pytest.mark.parametrize("jobs", [2, 0])
+def test_byte_identical_to_serial(tmp_path, template_dir, jobs):
+    template = Template.fetch(str(template_dir))
+    serial = template.generate(tmp_path / "serial")
+    parallel = template.generate(tmp_path / "parallel", jobs=jobs)
+    expected = snapshot(serial)
+    assert len(expected) == N_FILES + 4
+    assert snapshot(parallel) == expected
+
+
+def test_undefined_variable(tmp_path, template_dir):
+    root = template_dir / "{{cookiecutter.project_name}}"
+    (root / "data2/bad.py").write_text("{{ cookiecutter.missing }}")
+    (root / "data3/bad.py").write_text("{{ cookiecutter.missing }}")
+    template = Template.fetch(str(template_dir))
+
+    errors = []
+    for jobs in (1, 3):
+        with pytest.raises(UndefinedVariableInTemplate) as exc:
+            template.generate(tmp_path / str(jobs), jobs=jobs)
+        errors.append(exc.value.message)
+    assert errors[0] == errors[1]
+    assert "data2" in errors[0]
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_create_project(tmp_path, template_dir, in_memory):
+    def generate(project_path, **kwargs):
+        opts = dict(
+            project_path=project_path,
+            cookiecutter=str(template_dir),
+            cookiecutter_in_memory=in_memory,
+            extensions=[Cookiecutter()],
+            config_files=NO_CONFIG,
+        )
+        create_project(opts, **kwargs)
+        return snapshot(project_path)
+
+    serial = generate(tmp_path / "serial/proj")
+    assert generate(tmp_path / "parallel/proj", cookiecutter_jobs=2) == serial
+
+
+def test_cli_jobs(tmpfolder, template_dir):
+    args = ["proj", "--no-config", "--cookiecutter", str(template_dir)]
+    opts = parse_args([*args, "--cookiecutter-jobs", "2"])
+    assert opts["cookiecutter_jobs"] == 2
+    create_project(opts)
+    assert Path("proj/data4/file119.py").read_text().startswith("# proj by")
+
+
+def test_workers_are_not_forked():
+    # Forking a process that runs other threads (e.g. the daemon) is not safe
+    with process_pool(1, print, ("worker",)) as pool:
+        assert pool._mp_context.get_start_method() in ("forkserver", "spawn")
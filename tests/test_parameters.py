@@ -1,11 +1,14 @@
+import pickle
 from pathlib import Path
 
 import pytest
 from pyscaffold import cli
+from pyscaffold.api import NO_CONFIG, create_project
 
-from pyscaffoldext.cookiecutter.extension import parameters
+from pyscaffoldext.cookiecutter.extension import Cookiecutter, parameters, project_dir
+from pyscaffoldext.cookiecutter.template import Template, UnknownParameters
 
-COOKIECUTTER_URL = "https://github.com/pyscaffold/cookiecutter-pypackage.git"
+from .helpers import create_template
 
 
 def test_parse():
@@ -24,6 +27,12 @@ def test_parse():
     assert params == {"a": "1", "b": "2", "c": "3", "some": "param"}
 
 
+@pytest.mark.parametrize("value", ["novalue", "=1"])
+def test_parse_invalid(value):
+    with pytest.raises(SystemExit):
+        cli.parse_args(["proj", "--cookiecutter-params", "a=1", value])
+
+
 def test_parameters(tmpfolder):
     opts = {
         "project_path": tmpfolder,
@@ -42,14 +51,42 @@ def test_parameters(tmpfolder):
         # then its contents should be in the result dict
         assert parameters({**opts, "cookiecutter_params": params})["extra"] == 42
 
+    # The project path is resolved only once
+    assert parameters(opts)["project_name"] == tmpfolder.name
+    assert opts["cookiecutter_project_dir"] == (tmpfolder, tmpfolder.resolve())
+    opts["project_path"] = Path("other")
+    assert project_dir(opts) == Path("other").resolve()
+
+
+def test_unknown_parameters(tmpfolder, monkeypatch):
+    template_dir = create_template(tmpfolder / "template")
+    opts = dict(
+        project_path="proj",
+        cookiecutter=str(template_dir),
+        cookiecutter_params={"author": "Alice", "emial": "x@y.z", "license": "MIT"},
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+    rendered = []
+    monkeypatch.setattr(Template, "generate", lambda *args, **_: rendered.append(1))
+    for pretend in (False, True):
+        with pytest.raises(UnknownParameters) as exc:
+            create_project(opts, pretend=pretend)
+        assert exc.value.names == ["emial", "license"]
+        assert "'emial' (did you mean 'email'?), 'license'." in str(exc.value)
+    assert not rendered and not Path("proj").exists()
+
+    # The error can be sent back by the processes of ``batch``
+    error = pickle.loads(pickle.dumps(exc.value))
+    assert str(error) == str(exc.value)
+
 
-@pytest.mark.system
-def test_generate_with_params(tmpfolder):
+def test_generate_with_params(tmpfolder, pypackage_url):
     args = [
         "my_proj",
         "--no-config",  # <- ignore PyScaffold's config files in the dev's machine
         "--cookiecutter",
-        COOKIECUTTER_URL,
+        pypackage_url,
         "--cookiecutter-params",
         "command_line_interface=Argparse",
         "use_pytest=y",
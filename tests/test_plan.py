@@ -0,0 +1,110 @@
+import logging
+import os
+from pathlib import Path
+
+import pytest
+
+from pyscaffoldext.cookiecutter.batch import create_projects
+from pyscaffoldext.cookiecutter.extension import PLAN_WARNING
+from pyscaffoldext.cookiecutter.plan import format_size
+from pyscaffoldext.cookiecutter.update import STATE_FILE
+
+from .helpers import create_feature_template, generate
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    path = create_feature_template(tmp_path / "template")
+    marker = tmp_path / "hook-marker"
+    (path / "hooks").mkdir()
+    hook = f"open({str(marker)!r}, 'w').close()\n"
+    (path / "hooks/pre_gen_project.py").write_text(hook)
+    (path / "hooks/post_gen_project.py").write_text(hook)
+    return path
+
+
+def test_pretend_plan(tmpfolder, template_dir, isolated_log):
+    isolated_log.set_level(logging.INFO)
+    plan = generate(template_dir, pretend=True)["cookiecutter_plan"]
+
+    # Nothing is written (and hooks do not run)
+    assert not Path("proj").exists()
+    assert not (template_dir.parent / "hook-marker").exists()
+
+    files = {f.path: f for f in plan.files}
+    assert set(files) == {
+        "Makefile",
+        "windows.txt",
+        "setup.cfg",
+        "src/proj/info.py",
+        "raw/{{cookiecutter.package_name}}.txt",
+        "data/logo.bin",
+    }
+    assert files["data/logo.bin"].verbatim and files["data/logo.bin"].size == 1024
+    assert plan.overridden == ["setup.cfg"]
+    assert "setup.cfg" in plan.pyscaffold_files
+    assert "README.rst" in plan.pyscaffold_files
+
+    # The sizes match the files that are actually produced
+    generate(template_dir)
+    for path, file in files.items():
+        if not file.overridden:
+            assert os.path.getsize(Path("proj", path)) == file.size, path
+    pyscaffold_written = sum(plan.pyscaffold_files.values())
+    assert plan.write_volume == plan.template_size + pyscaffold_written
+
+    logs = isolated_log.text
+    assert "windows.txt" in logs and "overridden by PyScaffold" in logs
+    assert format_size(plan.write_volume) in logs
+
+
+def test_pretend_in_memory_plan(tmpfolder, template_dir):
+    opts = generate(
+        template_dir,
+        pretend=True,
+        cookiecutter_in_memory=True,
+        cookiecutter_precedence="template",
+    )
+    plan = opts["cookiecutter_plan"]
+    assert not Path("proj").exists()
+    assert plan.overridden == []
+    assert "setup.cfg" not in plan.pyscaffold_files
+    assert STATE_FILE not in {f.path for f in plan.files}
+
+
+def test_plan_precedence_rules(tmpfolder, template_dir):
+    opts = generate(
+        template_dir, pretend=True, cookiecutter_precedence="*.cfg=template"
+    )
+    plan = opts["cookiecutter_plan"]
+    assert "setup.cfg" not in plan.overridden
+    assert "setup.cfg" not in plan.pyscaffold_files
+    assert "README.rst" in plan.pyscaffold_files
+
+
+def test_parallel_plan(tmpfolder, template_dir):
+    serial = generate(template_dir, pretend=True)["cookiecutter_plan"]
+    parallel = generate(template_dir, pretend=True, cookiecutter_jobs=2)
+    assert parallel["cookiecutter_plan"] == serial
+
+
+def test_batch_plan(tmpfolder, template_dir):
+    projects = [{"project_path": "a"}, {"project_path": "b"}]
+    results = list(create_projects(str(template_dir), projects, pretend=True))
+    assert all(r.ok and r.plan for r in results)
+    assert [r.plan.project_dir.name for r in results] == ["a", "b"]
+    assert not Path("a").exists() and not Path("b").exists()
+
+
+def test_pretend_without_template(tmpfolder, isolated_log):
+    isolated_log.set_level(logging.WARNING)
+    opts = generate(Path("missing-template"), pretend=True)
+    assert PLAN_WARNING in isolated_log.text
+    assert "cookiecutter_plan" not in opts
+
+
+@pytest.mark.parametrize(
+    "size, expected", [(10, "10 B"), (2048, "2.0 KiB"), (5 << 20, "5.0 MiB")]
+)
+def test_format_size(size, expected):
+    assert format_size(size) == expected
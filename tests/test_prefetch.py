@@ -0,0 +1,83 @@
+import logging
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import NO_CONFIG, create_project
+
+from pyscaffoldext.cookiecutter import cache as cache_mod
+from pyscaffoldext.cookiecutter import cli
+from pyscaffoldext.cookiecutter.bundle import is_bundle
+from pyscaffoldext.cookiecutter.cache import TemplateCache
+from pyscaffoldext.cookiecutter.extension import Cookiecutter
+from pyscaffoldext.cookiecutter.prefetch import prefetch
+
+from .helpers import create_template, git_commit_all
+
+pytestmark = [pytest.mark.usefixtures("cookiecutter_config")]
+
+
+@pytest.fixture
+def urls(tmp_path):
+    # The `.git` suffix helps cookiecutter to identify the repository type
+    paths = [create_template(tmp_path / f"tpl{i}.git") for i in range(3)]
+    for path in paths:
+        git_commit_all(path)
+    return [p.resolve().as_uri() for p in paths]
+
+
+@pytest.fixture
+def broken(tmp_path):
+    files = {"Makefile": "all:\n\t@echo {{ cookiecutter.project_name \n"}
+    path = create_template(tmp_path / "broken.git", files)
+    git_commit_all(path)
+    return path.resolve().as_uri()
+
+
+def test_prefetch(tmpfolder, urls, monkeypatch, isolated_log):
+    isolated_log.set_level(logging.INFO)
+    cache = TemplateCache(tmpfolder / "cache")
+    results = list(prefetch([*urls, urls[0]], cache=cache, workers=3))
+    assert [r.source for r in results] == urls
+    assert all(r.ok and r.files == 2 and r.size > 0 and r.commit for r in results)
+    assert {e.url for e in cache.entries()} == set(urls)
+    assert "prefetch" in isolated_log.text
+
+    # Later runs use the cached (and compiled) templates
+    def _fail(*_args, **_kwargs):
+        raise AssertionError("template should not be fetched again")
+
+    monkeypatch.setattr(cache_mod, "_clone", _fail)
+    opts = dict(
+        project_path="proj",
+        cookiecutter=urls[1],
+        cookiecutter_cache_dir=cache.root,
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+    isolated_log.clear()
+    create_project(opts)
+    assert Path("proj/Makefile").exists()
+    assert "compile" not in isolated_log.text
+
+
+def test_prefetch_errors(tmpfolder, urls, broken):
+    cache = TemplateCache(tmpfolder / "cache")
+    missing = (tmpfolder / "missing.git").as_uri()
+    results = list(prefetch([urls[0], broken, missing], cache=cache))
+    assert [r.ok for r in results] == [True, False, False]
+    assert "Makefile" in str(results[1].error)
+
+
+def test_cli(tmpfolder, urls, broken):
+    args = ["--cache-dir", "cache", "prefetch", *urls]
+    assert cli.main(args) == 0
+    assert len(list(TemplateCache("cache").entries())) == len(urls)
+    assert cli.main(["--cache-dir", "cache", "prefetch", broken]) == 1
+
+    with pytest.raises(SystemExit) as exc:
+        cli.run(["-q", "--cache-dir", "cache", "bundle", urls[0], "tpl.ccbundle"])
+    assert exc.value.code == 0
+    assert is_bundle("tpl.ccbundle")
+
+    with pytest.raises(SystemExit):
+        cli.run(["prefetch"])  # missing templates
@@ -0,0 +1,128 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import create_project
+from pyscaffold.cli import parse_args
+
+from pyscaffoldext.cookiecutter import cli
+from pyscaffoldext.cookiecutter.results import ResultCache
+from pyscaffoldext.cookiecutter.template import Template
+from pyscaffoldext.cookiecutter.update import STATE_FILE
+
+from .helpers import create_template, generate
+
+pytestmark = [pytest.mark.usefixtures("cookiecutter_config")]
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    path = create_template(tmp_path / "template")
+    root = path / "{{cookiecutter.project_name}}"
+    (root / "run.sh").write_text("#!/bin/sh\necho {{ cookiecutter.project_name }}\n")
+    (root / "run.sh").chmod(0o755)
+    return path
+
+
+def generate_cached(template_dir, project_path="proj", **kwargs):
+    """Generate a project using the cache of results"""
+    cache = dict(
+        cookiecutter_result_cache=True, cookiecutter_result_cache_dir="results"
+    )
+    generate(template_dir, project_path, **{**cache, **kwargs})
+    return Path(project_path)
+
+
+@pytest.fixture
+def no_render(monkeypatch):
+    def _fail(*_args, **_kwargs):
+        raise AssertionError("template should not be rendered again")
+
+    monkeypatch.setattr(Template, "render", _fail)
+
+
+def test_restore(tmpfolder, template_dir, request):
+    first = generate_cached(template_dir, "a/proj")
+    request.getfixturevalue("no_render")
+    second = generate_cached(template_dir, "b/proj")
+
+    for name in ("Makefile", "run.sh", "src/proj/info.py", STATE_FILE):
+        assert (second / name).read_bytes() == (first / name).read_bytes()
+    assert os.access(str(second / "run.sh"), os.X_OK)
+    # PyScaffold's files are still generated
+    assert (second / "setup.cfg").exists()
+    assert ResultCache("results").stats() == {
+        "hits": 1,
+        "misses": 1,
+        "evictions": 0,
+        "entries": 1,
+        "size": ResultCache("results").stats()["size"],
+    }
+
+
+def test_different_parameters(tmpfolder, template_dir):
+    generate_cached(template_dir, "a/proj")
+    generate_cached(template_dir, "b/proj", cookiecutter_params={"author": "Alice"})
+    generate_cached(template_dir, "c/other")
+    stats = ResultCache("results").stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (0, 3, 3)
+
+
+def test_template_changes(tmpfolder, template_dir):
+    generate_cached(template_dir, "a/proj")
+    makefile = template_dir / "{{cookiecutter.project_name}}/Makefile"
+    makefile.write_text("all:\n\t@echo changed\n")
+    project = generate_cached(template_dir, "b/proj")
+    assert "changed" in (project / "Makefile").read_text()
+
+
+def test_not_cached(tmpfolder, template_dir):
+    from cookiecutter.exceptions import OutputDirExistsException
+
+    # Projects that already exist are rejected (as by cookiecutter)
+    Path("proj").mkdir()
+    Path("proj/Makefile").write_text("precious")
+    with pytest.raises(OutputDirExistsException):
+        generate_cached(template_dir, "proj")
+    assert Path("proj/Makefile").read_text() == "precious"
+    assert ResultCache("results").stats()["entries"] == 0
+
+    # Templates with hooks
+    (template_dir / "hooks").mkdir()
+    (template_dir / "hooks/post_gen_project.py").write_text("print('hook')\n")
+    generate_cached(template_dir, "a/proj")
+    assert ResultCache("results").stats()["entries"] == 0
+
+
+def test_eviction(tmpfolder, template_dir):
+    for i in range(3):
+        generate_cached(
+            template_dir, f"p{i}/proj", cookiecutter_params={"author": str(i)}
+        )
+    results = ResultCache("results")
+    entries = sorted(results.entries(), key=lambda e: e.key)
+    for i, entry in enumerate(entries):  # set the last time each entry was used
+        os.utime(str(Path("results", f"{entry.key}.json")), (1000 + i, 1000 + i))
+    size = max(e.size for e in entries)
+    oldest = entries[0]
+
+    results = ResultCache("results", max_size=2 * size)
+    assert [e.key for e in results.evict()] == [oldest.key]
+    assert results.stats()["evictions"] == 1
+    assert ResultCache("results", max_age=-1).evict(keep="none")
+    assert ResultCache("results").stats()["entries"] == 0
+
+
+def test_cli(tmpfolder, template_dir, capsys):
+    args = ["proj", "--no-config", "--cookiecutter", str(template_dir)]
+    opts = parse_args([*args, "--cookiecutter-result-cache"])
+    assert opts["cookiecutter_result_cache"]
+    create_project(opts)
+    capsys.readouterr()
+
+    assert cli.main(["results"]) == 0
+    stats = json.loads(capsys.readouterr().out)
+    assert stats["misses"] == 1 and stats["entries"] == 1
+    assert cli.main(["results", "--clear"]) == 0
+    assert json.loads(capsys.readouterr().out)["entries"] == 0
@@ -0,0 +1,114 @@
+import os
+import stat
+from pathlib import Path
+
+import jinja2
+import pytest
+
+from pyscaffoldext.cookiecutter import template as template_mod
+from pyscaffoldext.cookiecutter.cache import TemplateCache
+from pyscaffoldext.cookiecutter.snapshot import BYTECODE_DIR, Snapshot
+from pyscaffoldext.cookiecutter.template import Template
+
+from .helpers import create_feature_template
+
+FILES = {
+    "README.md": "# {{ cookiecutter.project_name }}\n",
+    "windows.txt": "{{ cookiecutter.author }}\r\nsecond line\r\n",
+    "src/{{cookiecutter.package_name}}/__init__.py": "",
+    "raw/{{cookiecutter.package_name}}.txt": "{{ not rendered }}",
+    "raw/nested/file.txt": "{{ not rendered }}",
+    "data/logo.bin": "",
+}
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    return create_feature_template(tmp_path / "template", FILES)
+
+
+@pytest.fixture
+def cache(tmpfolder):
+    return TemplateCache(tmpfolder / "cache")
+
+
+def tree(path):
+    return {
+        str(p.relative_to(path)): (p.read_bytes(), stat.S_IMODE(p.stat().st_mode))
+        for p in sorted(Path(path).rglob("*"))
+        if p.is_file()
+    }
+
+
+def test_snapshot_is_created_and_reused(tmpfolder, template_dir, cache, monkeypatch):
+    expected = Template(template_dir).generate(tmpfolder / "cold")
+
+    # Given a template that was fetched once (and therefore compiled)
+    first = Template.fetch(str(template_dir), cache=cache)
+    snapshot_dir = cache.snapshot_dir(template_dir)
+    assert first.snapshot.path == snapshot_dir
+    assert list((snapshot_dir / BYTECODE_DIR).iterdir())
+
+    # when it is fetched again,
+    def _fail(*_args, **_kwargs):
+        raise AssertionError("should be loaded from the snapshot")
+
+    monkeypatch.setattr(template_mod, "load_context", _fail)
+    compiled = []
+    compile_jinja = jinja2.Environment.compile
+
+    def _compile(self, source, name=None, filename=None, *args, **kwargs):
+        compiled.append(filename)
+        return compile_jinja(self, source, name, filename, *args, **kwargs)
+
+    monkeypatch.setattr(jinja2.Environment, "compile", _compile)
+    template = Template.fetch(str(template_dir), cache=cache)
+
+    # then the snapshot is used,
+    assert template.snapshot.path == snapshot_dir
+    assert template.context == first.context
+    project = template.generate(tmpfolder / "warm")
+
+    # files are not compiled again (only their paths),
+    assert compiled and not any(compiled)
+
+    # and the result is the same
+    assert tree(project) == tree(expected)
+    assert (project / "windows.txt").read_bytes() == b"Nobody\r\nsecond line\r\n"
+    assert (project / "raw/nested/file.txt").read_text() == "{{ not rendered }}"
+
+
+def test_snapshot_is_invalidated(tmpfolder, template_dir, cache):
+    Template.fetch(str(template_dir), cache=cache)
+    readme = template_dir / "{{cookiecutter.project_name}}/README.md"
+    readme.write_text("Changed {{ cookiecutter.project_name }}\n")
+    os.utime(readme, ns=(0, 0))  # <- make sure mtime changes
+
+    template = Template.fetch(str(template_dir), cache=cache)
+    project = template.generate(tmpfolder)
+    assert (project / "README.md").read_text() == "Changed proj\n"
+    assert Snapshot.load(template.snapshot.path, template_dir.resolve())
+
+
+def test_valid_snapshot_is_kept(tmpfolder, template_dir, cache):
+    # e.g. when the same template is compiled concurrently by several threads
+    first = Template(template_dir).compile(cache.snapshot_dir(template_dir))
+    bytecode = first.bytecode_dir / "in-use.cache"
+    bytecode.write_bytes(b"bytecode")
+    second = Template(template_dir).compile(cache.snapshot_dir(template_dir))
+    assert second.path == first.path
+    assert bytecode.read_bytes() == b"bytecode"
+
+
+def test_snapshot_can_be_disabled(tmpfolder, template_dir, cache):
+    template = Template.fetch(str(template_dir), cache=cache, snapshot=False)
+    assert template.snapshot is None
+    assert not cache.snapshot_dir(template_dir).exists()
+    assert (template.generate(tmpfolder) / "README.md").exists()
+
+
+def test_snapshot_dir_for_cached_templates(tmpfolder, cache):
+    entry = cache.root / "0123abcd"
+    assert cache.snapshot_dir(entry / "template") == entry / "snapshot"
+    local = cache.snapshot_dir(tmpfolder / "local")
+    assert local.parent == cache.root / "snapshots"
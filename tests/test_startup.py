@@ -0,0 +1,50 @@
+"""The extension is loaded for every ``putup`` invocation (even ``putup --help``),
+so it should not make PyScaffold slower to start.
+"""
+import json
+import sys
+from subprocess import DEVNULL, check_call
+
+SCRIPT = """\
+import json, sys
+from pyscaffold import cli, extensions
+
+before = set(sys.modules)
+(entry_point,) = [
+    e for e in extensions.iterate_entry_points() if e.name == "cookiecutter"
+]
+entry_point.load()
+loaded = set(sys.modules) - before
+
+try:
+    cli.run(["--help"])
+except SystemExit:
+    pass
+
+with open(sys.argv[1], "w") as file:
+    result = {"loaded": sorted(loaded), "all": list(sys.modules)}
+    json.dump(result, file)
+"""
+
+HEAVY = ("cookiecutter", "jinja2", "requests", "binaryornot", "yaml")
+ALLOWED = {
+    "pyscaffoldext",
+    "pyscaffoldext.cookiecutter",
+    "pyscaffoldext.cookiecutter.extension",
+}
+PACKAGE_MODULES = ("template", "cache", "snapshot", "structure", "stream", "hooks")
+"""Modules of the extension that (directly or not) import the heavy dependencies"""
+
+
+def test_putup_help_does_not_import_dependencies(tmp_path):
+    report = tmp_path / "report.json"
+    check_call([sys.executable, "-c", SCRIPT, str(report)], stdout=DEVNULL)
+    result = json.loads(report.read_text())
+
+    # Only the (lightweight) extension module is loaded at startup
+    assert set(result["loaded"]) <= ALLOWED
+    heavy = [m for m in result["all"] if m.split(".")[0] in HEAVY]
+    assert not heavy
+    modules = set(result["all"])
+    for name in PACKAGE_MODULES:
+        assert f"pyscaffoldext.cookiecutter.{name}" not in modules
@@ -0,0 +1,246 @@
+import errno
+import json
+import os
+import stat
+import tracemalloc
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import NO_CONFIG, create_project
+from pyscaffold.cli import parse_args
+
+from pyscaffoldext.cookiecutter import stream
+from pyscaffoldext.cookiecutter.extension import Cookiecutter
+from pyscaffoldext.cookiecutter.structure import render_structure
+from pyscaffoldext.cookiecutter.template import Template
+
+from .helpers import create_template
+
+MiB = 1 << 20
+ASSET_SIZE = 16 * MiB
+LARGE_TEXT = "".join(f"{{{{ cookiecutter.project_name }}}} {i}\n" for i in range(5000))
+
+
+def unsupported(*_args):
+    raise OSError(errno.ENOSYS, "not supported")
+
+
+@pytest.fixture
+def no_zero_copy(monkeypatch):
+    monkeypatch.setattr(stream, "_copy_file_range", unsupported)
+    monkeypatch.setattr(stream, "_sendfile", unsupported)
+
+
+@pytest.fixture
+def asset(tmp_path):
+    path = tmp_path / "asset.bin"
+    block = os.urandom(MiB)
+    with open(str(path), "wb") as file:
+        for _ in range(ASSET_SIZE // MiB):
+            file.write(block)
+    path.chmod(0o750)
+    return path
+
+
+@pytest.fixture
+def template_dir(tmp_path, asset):
+    path = create_template(tmp_path / "template", {"large.txt": LARGE_TEXT})
+    root = path / "{{cookiecutter.project_name}}"
+    (root / "data").mkdir()
+    os.link(str(asset), str(root / "data/asset.bin"))
+    return path
+
+
+def peak_memory(fn, *args, **kwargs):
+    tracemalloc.start()
+    try:
+        fn(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def same_file(a, b):
+    return Path(a).read_bytes() == Path(b).read_bytes()
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("512", 512), ("64K", 64 << 10), ("256M", 256 * MiB), ("1GiB", 1 << 30), (7, 7)],
+)
+def test_parse_size(value, expected):
+    assert stream.parse_size(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "M", "0", "-1M", "12T"])
+def test_parse_invalid_size(value):
+    with pytest.raises(ValueError):
+        stream.parse_size(value)
+
+
+def test_copy_file(tmp_path, asset):
+    dest = tmp_path / "copy.bin"
+    peak = peak_memory(stream.copy_file, asset, dest)
+    assert same_file(asset, dest)
+    assert stat.S_IMODE(dest.stat().st_mode) == 0o750
+    assert peak < stream.CHUNK_SIZE
+
+
+def test_chunked_copy(tmp_path, asset, no_zero_copy):
+    dest = tmp_path / "copy.bin"
+    peak = peak_memory(stream.copy_file, asset, dest, max_memory=64 << 10)
+    assert same_file(asset, dest)
+    assert peak < 4 * (64 << 10)
+
+
+def test_partial_zero_copy(tmp_path, asset, monkeypatch):
+    # The remaining bytes are copied in chunks when zero-copy stops working midway
+    def copy_once(src, dst, offset, count):
+        if offset:
+            raise OSError(errno.EXDEV, "cross-device")
+        return os.pwrite(dst, os.pread(src, MiB, 0), 0)
+
+    monkeypatch.setattr(stream, "_copy_file_range", copy_once)
+    dest = tmp_path / "copy.bin"
+    stream.copy_file(asset, dest)
+    assert same_file(asset, dest)
+
+
+def test_generate_bounded_memory(tmp_path, template_dir, asset, no_zero_copy):
+    template = Template.fetch(str(template_dir))
+    template.generate(tmp_path / "warmup", {"project_name": "warmup"})
+
+    out = tmp_path / "out"
+    peak = peak_memory(template.generate, out, max_memory=MiB)
+    assert same_file(out / "proj/data/asset.bin", asset)
+    assert peak < 4 * MiB
+    assert (out / "proj/large.txt").read_text() == LARGE_TEXT.replace(
+        "{{ cookiecutter.project_name }}", "proj"
+    )
+
+
+def test_structure_max_memory(template_dir):
+    template = Template.fetch(str(template_dir))
+    context = template.context_for()
+    struct = render_structure(template, context)
+    assert struct["large.txt"][0].startswith("proj 0\n")
+
+    # Files that do not fit are only rendered when written
+    struct = render_structure(template, context, max_memory=1024)
+    assert struct["large.txt"][0] == ""
+
+
+def test_cli_max_memory(tmpfolder, template_dir, asset):
+    args = ["proj", "--no-config", "--cookiecutter", str(template_dir)]
+    opts = parse_args([*args, "--cookiecutter-max-memory", "1M"])
+    assert opts["cookiecutter_max_memory"] == MiB
+    create_project(opts)
+    assert same_file(asset, "proj/data/asset.bin")
+
+    with pytest.raises(SystemExit):
+        parse_args([*args, "--cookiecutter-max-memory", "lots"])
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_api_max_memory(tmpfolder, template_dir, asset, in_memory):
+    opts = dict(
+        project_path="proj",
+        cookiecutter=str(template_dir),
+        cookiecutter_max_memory="1K",
+        cookiecutter_in_memory=in_memory,
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+    _, opts = create_project(opts)
+    assert opts["cookiecutter_max_memory"] == 1024
+    assert same_file(asset, "proj/data/asset.bin")
+    assert Path("proj/large.txt").read_text().startswith("proj 0\nproj 1\n")
+
+
+@pytest.fixture
+def small_file(tmp_path):
+    path = tmp_path / "logo.png"
+    path.write_bytes(bytes(range(256)))
+    path.chmod(0o640)
+    return path
+
+
+def test_hardlink(tmp_path, small_file):
+    dest = tmp_path / "link.png"
+    dest.write_text("existing files are replaced")
+    stream.copy_file(small_file, dest, link="hardlink")
+    assert dest.stat().st_ino == small_file.stat().st_ino
+    assert same_file(small_file, dest)
+
+
+@pytest.mark.parametrize("link", ["hardlink", "reflink"])
+def test_link_fallback(tmp_path, small_file, monkeypatch, link):
+    def cross_device(*_args):
+        raise OSError(errno.EXDEV, "cross-device")
+
+    monkeypatch.setattr(os, "link", cross_device)
+    monkeypatch.setattr("fcntl.ioctl", cross_device)
+    dest = tmp_path / "copy.png"
+    stream.copy_file(small_file, dest, link=link)
+    assert dest.stat().st_ino != small_file.stat().st_ino
+    assert same_file(small_file, dest)
+    assert stat.S_IMODE(dest.stat().st_mode) == 0o640
+
+
+def test_reflink(tmp_path, small_file):
+    # Depending on the file system, the file is cloned or copied
+    dest = tmp_path / "clone.png"
+    stream.copy_file(small_file, dest, link="reflink")
+    assert dest.stat().st_ino != small_file.stat().st_ino
+    assert same_file(small_file, dest)
+
+
+def test_invalid_link():
+    with pytest.raises(ValueError, match="hardlink"):
+        stream.link_mode("symlink")
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_generate_with_hardlinks(tmpfolder, template_dir, asset, in_memory):
+    args = ["proj", "--no-config", "--cookiecutter", str(template_dir)]
+    args += ["--cookiecutter-link", "hardlink"]
+    opts = parse_args([*args, "--cookiecutter-in-memory"] if in_memory else args)
+    create_project(opts)
+    assert Path("proj/data/asset.bin").stat().st_ino == asset.stat().st_ino
+    # Rendered files are never linked
+    assert Path("proj/large.txt").read_text().startswith("proj 0\n")
+
+
+def test_break_link(tmp_path, small_file):
+    dest = tmp_path / "link.png"
+    stream.copy_file(small_file, dest, link="hardlink")
+    small_file.chmod(0o444)
+    assert stream.break_link(dest)
+    assert dest.stat().st_ino != small_file.stat().st_ino
+    assert same_file(small_file, dest)
+    assert stat.S_IMODE(dest.stat().st_mode) == 0o644
+    assert not stream.break_link(dest)  # not a link anymore
+    assert not stream.break_link(tmp_path / "missing")
+    # Linked files are replaced (not written in place) when copied over
+    stream.copy_file(small_file, dest, link="hardlink")
+    stream.write_text(dest, ["new contents"])
+    assert small_file.read_bytes() == bytes(range(256))
+
+
+def test_hardlinks_overlapping_pyscaffold(tmpfolder, template_dir):
+    # Verbatim files that PyScaffold writes again are not written through the link
+    root = template_dir / "{{cookiecutter.project_name}}"
+    (root / "README.rst").write_text("template readme\n")
+    context = json.loads((template_dir / "cookiecutter.json").read_text())
+    context["_copy_without_render"] = ["README.rst"]
+    (template_dir / "cookiecutter.json").write_text(json.dumps(context))
+    opts = dict(
+        project_path="proj",
+        cookiecutter=str(template_dir),
+        cookiecutter_link="hardlink",
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+    create_project(opts)
+    assert (root / "README.rst").read_text() == "template readme\n"
+    assert Path("proj/README.rst").read_text() != "template readme\n"
@@ -0,0 +1,265 @@
+import logging
+import os
+import stat
+import subprocess
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import create_project
+from pyscaffold.cli import parse_args
+
+from pyscaffoldext.cookiecutter import structure
+from pyscaffoldext.cookiecutter.update import STATE_FILE, State
+
+from .helpers import (
+    FEATURE_FILES,
+    create_feature_template,
+    create_template,
+    generate,
+    git_commit_all,
+)
+
+FILES = {
+    **FEATURE_FILES,
+    "run.sh": "#!/bin/sh\necho {{ cookiecutter.project_name }}\n",
+}
+POST_HOOK = """\
+from pathlib import Path
+Path("post.txt").write_text(str(Path("setup.cfg").exists()))
+"""
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    path = create_feature_template(tmp_path / "template", FILES)
+    root = path / "{{cookiecutter.project_name}}"
+    (root / "run.sh").chmod(0o755)
+    (path / "hooks").mkdir()
+    (path / "hooks/pre_gen_project.py").write_text("open('pre.txt', 'w').close()\n")
+    (path / "hooks/post_gen_project.py").write_text(POST_HOOK)
+    return path
+
+
+def tree(path):
+    return {
+        p.relative_to(path).as_posix(): p.read_bytes()
+        for p in Path(path).rglob("*")
+        if p.is_file() and ".git" not in p.parts and p.name != STATE_FILE
+    }
+
+
+def test_same_output_as_disk(tmpfolder, template_dir):
+    generate(template_dir, "disk/proj")
+    opts = generate(template_dir, "memory/proj", cookiecutter_in_memory=True)
+    assert not opts.get("force")
+
+    disk, memory = tree("disk/proj"), tree("memory/proj")
+    # Differently from the disk, the pre hook does not run in the project folder
+    assert disk.pop("pre.txt") == b""
+    assert disk == memory
+
+    proj = Path("memory/proj")
+    assert (proj / "windows.txt").read_bytes().count(b"\r\n") == 2
+    assert (proj / "data/logo.bin").read_bytes() == bytes(range(256)) * 4
+    raw = proj / "raw/{{cookiecutter.package_name}}.txt"
+    assert raw.read_text() == "{{ not rendered }}"
+    assert os.stat(proj / "run.sh").st_mode & stat.S_IXUSR
+    assert not list(proj.glob("skipped*"))
+    # The post hook runs after the files are written, the pre hook in a temp dir
+    assert (proj / "post.txt").read_text() == "True"
+    assert not (proj / "pre.txt").exists()
+
+
+def test_files_written_once(tmpfolder, template_dir, monkeypatch):
+    writes = []
+    real_open, real_write_text = open, Path.write_text
+
+    def fake_open(file, mode="r", *args, **kwargs):
+        if "w" in mode:
+            writes.append(Path(file).resolve())
+        return real_open(file, mode, *args, **kwargs)
+
+    def fake_write_text(self, *args, **kwargs):
+        writes.append(self.resolve())
+        return real_write_text(self, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", fake_open)
+    monkeypatch.setattr(Path, "write_text", fake_write_text)
+    generate(template_dir, "disk/proj")
+    assert writes.count(Path("disk/proj/setup.cfg").resolve()) == 2
+
+    writes.clear()
+    generate(template_dir, "memory/proj", cookiecutter_in_memory=True)
+    assert writes.count(Path("memory/proj/setup.cfg").resolve()) == 1
+    assert writes.count(Path("memory/proj/Makefile").resolve()) == 1
+
+
+@pytest.mark.parametrize("precedence", [None, "pyscaffold", "template"])
+def test_precedence(tmpfolder, template_dir, precedence):
+    generate(
+        template_dir, cookiecutter_in_memory=True, cookiecutter_precedence=precedence
+    )
+    setup_cfg = Path("proj/setup.cfg").read_text()
+    state = State.load(Path("proj"))
+    if precedence == "template":
+        assert setup_cfg == "[metadata]\nname = proj\n"
+        assert "setup.cfg" in state.files
+    else:
+        assert "[options]" in setup_cfg
+        assert "setup.cfg" not in state.files
+    assert "Makefile" in state.files
+    assert "README.rst" not in state.files
+
+
+def test_invalid_precedence():
+    with pytest.raises(ValueError, match="pyscaffold"):
+        structure.merge_structure({}, {}, "other")
+
+
+def test_merge_structure():
+    op = structure.copied_file(Path("source"))
+    pyscaffold = {"a": "pyscaffold", "b": None, "d": {"e": "e"}}
+    rendered = {"a": ("template", op), "b": "b", "c": "c", "d": {"f": "f"}}
+    merged = structure.merge_structure(pyscaffold, rendered)
+    # Leaves are not combined and ``None`` contents do not override the template
+    assert merged == {"a": "pyscaffold", "b": "b", "c": "c", "d": {"e": "e", "f": "f"}}
+    merged = structure.merge_structure(pyscaffold, rendered, "template")
+    assert merged["a"] == ("template", op)
+
+
+def test_cli_in_memory(tmpfolder, template_dir):
+    args = ["proj", "--no-config", "--cookiecutter", str(template_dir)]
+    opts = parse_args([*args, "--cookiecutter-in-memory"])
+    assert opts["cookiecutter_in_memory"]
+    create_project(opts)
+    assert Path("proj/Makefile").read_text() == "all:\n\t@echo proj\n"
+
+
+def test_pretend_in_memory(tmpfolder, template_dir):
+    generate(template_dir, cookiecutter_in_memory=True, pretend=True)
+    assert not Path("proj").exists()
+
+
+AUTHORS = """\
+============
+Contributors
+============
+
+* {{ cookiecutter.author }} <{{ cookiecutter.email }}>
+"""
+OLD_MTIME = 1_000_000_000
+OLD_MTIME_HOOK = f"""\
+import os
+for root, _, files in os.walk("."):
+    for name in files:
+        os.utime(os.path.join(root, name), ({OLD_MTIME}, {OLD_MTIME}))
+"""
+
+
+@pytest.fixture
+def overlapping(tmp_path):
+    """Template with files that PyScaffold also generates (AUTHORS.rst is identical)"""
+    files = {
+        "AUTHORS.rst": AUTHORS,
+        "README.rst": "template readme\n",
+        "setup.cfg": FILES["setup.cfg"],
+        "docs/index.rst": "template docs\n",
+    }
+    path = create_template(tmp_path / "template", files)
+    git_commit_all(path)
+    (path / "hooks").mkdir()
+    (path / "hooks/post_gen_project.py").write_text(OLD_MTIME_HOOK)
+    return path
+
+
+def mtime(path):
+    return os.stat(str(path)).st_mtime
+
+
+def test_skip_identical(tmpfolder, overlapping, isolated_log):
+    isolated_log.set_level(logging.INFO)
+    generate(overlapping)
+    proj = Path("proj")
+    # PyScaffold writes the same AUTHORS.rst, so it is left untouched
+    assert mtime(proj / "AUTHORS.rst") == OLD_MTIME
+    assert "identical" in isolated_log.text
+    assert mtime(proj / "setup.cfg") != OLD_MTIME
+    assert "[options]" in (proj / "setup.cfg").read_text()
+    committed = subprocess.check_output(["git", "ls-files"], cwd=str(proj), text=True)
+    assert "AUTHORS.rst" in committed.split()
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_precedence_rules(tmpfolder, overlapping, in_memory):
+    precedence = ["pyscaffold", "README.rst=template", "docs/*=template"]
+    generate(
+        overlapping,
+        cookiecutter_in_memory=in_memory,
+        cookiecutter_precedence=precedence,
+    )
+    proj = Path("proj")
+    assert (proj / "README.rst").read_text() == "template readme\n"
+    assert (proj / "docs/index.rst").read_text() == "template docs\n"
+    assert "[options]" in (proj / "setup.cfg").read_text()
+    files = State.load(proj).files
+    assert {"README.rst", "docs/index.rst"} <= set(files)
+    assert "setup.cfg" not in files and "docs/conf.py" not in files
+    if not in_memory:
+        assert mtime(proj / "README.rst") == OLD_MTIME
+
+
+def test_precedence_cli(tmpfolder, overlapping):
+    args = ["proj", "--no-config", "--cookiecutter", str(overlapping)]
+    with pytest.raises(SystemExit):
+        parse_args([*args, "--cookiecutter-precedence", "setup.cfg=other"])
+    opts = parse_args(
+        [*args, "--cookiecutter-precedence", "template", "*.cfg=pyscaffold"]
+    )
+    create_project(opts)
+    assert Path("proj/README.rst").read_text() == "template readme\n"
+    assert "[options]" in Path("proj/setup.cfg").read_text()
+
+
+def test_update_template_files(tmpfolder, overlapping):
+    generate(overlapping, cookiecutter_precedence={"README.rst": "template"})
+    readme = overlapping / "{{cookiecutter.project_name}}/README.rst"
+    readme.write_text("changed readme\n")
+    git_commit_all(overlapping, "change")
+    generate(overlapping, update=True, cookiecutter_precedence="README.rst=template")
+    # The file kept from the template is updated (instead of replaced by PyScaffold)
+    assert Path("proj/README.rst").read_text() == "changed readme\n"
+
+
+def test_parse_precedence():
+    parse = structure.Precedence.parse
+    assert parse(None) == parse("pyscaffold") == structure.Precedence()
+    rules = parse(["docs/*.rst=pyscaffold", "template", ("docs/*", "template")])
+    assert rules.default == "template"
+    assert rules.winner("docs/index.rst") == "pyscaffold"
+    assert rules.winner("docs/conf.py") == "template"
+    assert parse(rules) is rules
+    assert parse({"*.cfg": "template"}).winner("a/setup.cfg") == "template"
+    for invalid in ("other", "=template", "*.cfg=other"):
+        with pytest.raises(ValueError):
+            parse(invalid)
+
+
+def test_skip_identical_op(tmpfolder):
+    calls = []
+
+    def file_op(path, contents, opts):
+        calls.append(path)
+        if contents is None:
+            return None
+        path.write_text(contents)
+        return path
+
+    op = structure.skip_identical(file_op)
+    path = Path("file.txt")
+    assert op(path, "text\n", {}) == path
+    assert op(path, "text\n", {}) == path
+    assert op(path, "other\n", {}) == path
+    assert op(path, "other\n", {"pretend": True}) == path
+    assert calls == [path] * 3
+    assert op(path, None, {}) is None
+    assert len(calls) == 4
@@ -0,0 +1,115 @@
+import json
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from cookiecutter.exceptions import UndefinedVariableInTemplate
+from cookiecutter.main import cookiecutter
+
+from pyscaffoldext.cookiecutter.template import Template
+
+from .helpers import create_template
+
+FILES = {
+    "README.md": "# {{ cookiecutter.project_name }}\n",
+    "windows.txt": "{{ cookiecutter.author }}\r\nsecond line\r\n",
+    "run.sh": "#!/bin/sh\necho {{ cookiecutter.package_name }}\n",
+    "src/{{cookiecutter.package_name}}/__init__.py": "",
+    "raw/{{cookiecutter.package_name}}.txt": "{{ not rendered }}",
+    "{% if False %}skipped.txt{% endif %}": "empty file name",
+    "data/logo.bin": "",
+    "include.txt": "{% include 'partial.txt' %}",
+}
+
+HOOK = """\
+from pathlib import Path
+Path("{{ cookiecutter.package_name }}-{hook}.txt").write_text("{hook}")
+"""
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    path = create_template(tmp_path / "complex-template", FILES)
+    context = json.loads((path / "cookiecutter.json").read_text())
+    context["_copy_without_render"] = ["raw"]
+    (path / "cookiecutter.json").write_text(json.dumps(context))
+    (path / "templates").mkdir()
+    (path / "templates/partial.txt").write_text("shared {{ cookiecutter.email }}")
+    (path / "hooks").mkdir()
+    for hook in ("pre_gen_project", "post_gen_project"):
+        (path / f"hooks/{hook}.py").write_text(HOOK.replace("{hook}", hook))
+    root = path / "{{cookiecutter.project_name}}"
+    (root / "data/logo.bin").write_bytes(bytes(range(256)) * 4)
+    os.chmod(root / "run.sh", 0o755)
+    return path
+
+
+def tree(path):
+    return {
+        str(p.relative_to(path)): (p.read_bytes(), stat.S_IMODE(p.stat().st_mode))
+        for p in sorted(Path(path).rglob("*"))
+        if p.is_file()
+    }
+
+
+def test_same_output_as_cookiecutter(tmpfolder, template_dir):
+    extra = {"project_name": "my-proj", "package_name": "my_pkg"}
+    expected = cookiecutter(
+        str(template_dir),
+        no_input=True,
+        extra_context=extra,
+        output_dir=str(tmpfolder / "expected"),
+    )
+    project = Template(template_dir).generate(tmpfolder / "actual", extra)
+    assert project == tmpfolder / "actual/my-proj"
+    assert tree(project) == tree(expected)
+    assert (project / "my_pkg-post_gen_project.txt").exists()
+    assert (project / "raw/{{cookiecutter.package_name}}.txt").exists()
+    assert not (project / "skipped.txt").exists()
+    assert os.access(project / "run.sh", os.X_OK)
+
+
+def test_multiple_projects(tmpfolder, template_dir):
+    template = Template(template_dir)
+    compiled = []
+    for name in ("proj1", "proj2"):
+        project = template.generate(tmpfolder, {"project_name": name}, False)
+        assert (project / "README.md").read_text() == f"# {name}\n"
+        compiled.append(dict(template._path_templates))
+    # Jinja templates are compiled only once
+    assert compiled[0] == compiled[1]
+
+
+def test_context_for(template_dir):
+    context = Template(template_dir).context_for({"project_name": "x"}, "/output")
+    assert context["cookiecutter"]["package_name"] == "x"
+    assert context["cookiecutter"]["_output_dir"] == os.path.abspath("/output")
+    assert context["_cookiecutter"]["package_name"] == "{{ cookiecutter.project_name }}"
+
+
+def test_undefined_variable(tmpfolder, tmp_path):
+    path = create_template(tmp_path / "broken", {"a.txt": "{{ cookiecutter.nope }}"})
+    with pytest.raises(UndefinedVariableInTemplate):
+        Template(path).generate(tmpfolder)
+    # Incomplete projects are removed
+    assert not (tmpfolder / "proj").exists()
+
+
+def test_generate_from_threads(tmpfolder, template_dir, monkeypatch):
+    def _chdir(*_):
+        raise AssertionError("the working directory should not change")
+
+    monkeypatch.setattr(os, "chdir", _chdir)
+    template = Template(template_dir)
+    names = [f"proj{i}" for i in range(8)]
+    with ThreadPoolExecutor(4) as executor:
+        projects = list(
+            executor.map(
+                lambda n: template.generate(tmpfolder, {"project_name": n}), names
+            )
+        )
+    for name, project in zip(names, projects):
+        assert project == tmpfolder / name
+        assert (project / "README.md").read_text() == f"# {name}\n"
@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import NO_CONFIG, create_project
+from pyscaffold.cli import parse_args
+
+from pyscaffoldext.cookiecutter import timing
+from pyscaffoldext.cookiecutter.extension import Cookiecutter
+
+from .helpers import create_template
+
+PHASES = {"enforce_options", "parameters", "fetch", "context", "render", "merge"}
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    path = create_template(tmp_path / "template")
+    (path / "hooks").mkdir()
+    (path / "hooks/post_gen_project.py").write_text("print('hello')\n")
+    return path
+
+
+def test_spans_callback(tmpfolder, template_dir):
+    spans = []
+    opts = dict(
+        project_path="proj",
+        cookiecutter=str(template_dir),
+        cookiecutter_on_span=spans.append,
+        extensions=[Cookiecutter()],
+        config_files=NO_CONFIG,
+    )
+    create_project(opts)
+    assert Path("proj/Makefile").exists()
+
+    names = {s.name for s in spans}
+    assert PHASES <= names
+    hooks = [s for s in spans if s.name == "hook"]
+    assert [h.subject for h in hooks] == ["post_gen_project"]
+    assert all(s.duration >= 0 and s.start >= 0 for s in spans)
+    # Phases happen in order
+    order = [s.name for s in spans if s.name in PHASES]
+    assert order.index("fetch") < order.index("render") < order.index("merge")
+
+
+def test_cli_profile_report(tmpfolder, template_dir):
+    args = ["proj", "--no-config", "--cookiecutter", str(template_dir)]
+    opts = parse_args([*args, "--cookiecutter-profile", "report.json"])
+    create_project(opts)
+
+    # relative paths are resolved before PyScaffold changes the working dir
+    report = json.loads(Path("report.json").read_text())
+    assert PHASES <= set(report["phases"])
+    assert report["elapsed"] >= max(report["phases"].values())
+    assert {s["name"] for s in report["spans"]} == set(report["phases"])
+
+
+def test_no_profile(tmpfolder, template_dir):
+    opts = parse_args(["proj", "--no-config", "--cookiecutter", str(template_dir)])
+    assert not opts.get("cookiecutter_profile")
+    _, opts = create_project(opts)
+    assert "cookiecutter_timings" not in opts
+
+
+def test_span_without_profile():
+    with timing.span("something"):
+        pass  # nothing happens
+
+    profile = timing.Profile()
+    with timing.activate(profile):
+        with timing.span("outer"):
+            with timing.span("inner", "details"):
+                pass
+    assert [(s.name, s.subject) for s in profile.spans] == [
+        ("inner", "details"),
+        ("outer", ""),
+    ]
@@ -0,0 +1,202 @@
+import json
+import logging
+from pathlib import Path
+
+import pytest
+from pyscaffold.api import NO_CONFIG, create_project
+
+from pyscaffoldext.cookiecutter.cache import TemplateCache
+from pyscaffoldext.cookiecutter.extension import UPDATE_WARNING
+from pyscaffoldext.cookiecutter.template import Template, UnknownParameters
+from pyscaffoldext.cookiecutter.update import (
+    STATE_FILE,
+    State,
+    changed_sources,
+    struct_paths,
+)
+
+from .helpers import create_template, generate, git_commit_all
+
+LINES = "".join(f"LINE_{i} = {i}\n" for i in range(6))
+FILES = {
+    "Makefile": "all:\n\t@echo {{ cookiecutter.project_name }}\n",
+    "lines.py": LINES,
+    "conflict.py": LINES,
+    "removed.txt": "will be removed from the template",
+}
+
+
+@pytest.fixture
+def template_repo(tmp_path):
+    path = create_template(tmp_path / "template", FILES)
+    git_commit_all(path)
+    return path
+
+
+def template_file(template, name):
+    return Path(template, "{{cookiecutter.project_name}}", name)
+
+
+def test_state_is_recorded(tmpfolder, template_repo):
+    generate(template_repo)
+    state = State.load(Path("proj"))
+    data = json.loads(Path("proj", STATE_FILE).read_text())
+    assert state.template == data["template"] == str(template_repo)
+    assert state.commit and len(state.commit) == 40
+    assert state.context["project_name"] == "proj"
+    assert {"Makefile", "lines.py", "removed.txt"} <= set(state.files)
+    # Files generated by PyScaffold are not included
+    assert "setup.cfg" not in state.files
+
+
+def test_incremental_update(tmpfolder, template_repo):
+    # Given a project generated from a template,
+    generate(template_repo)
+    proj = Path("proj")
+    commit = State.load(proj).commit
+
+    # and local changes in the project
+    lines = (proj / "lines.py").read_text().replace("LINE_5 = 5", "LINE_5 = 'mine'")
+    (proj / "lines.py").write_text(lines)
+    conflict = (proj / "conflict.py").read_text().replace("= 2", "= 'mine'")
+    (proj / "conflict.py").write_text(conflict)
+
+    # when the template changes,
+    makefile = template_file(template_repo, "Makefile")
+    makefile.write_text(makefile.read_text() + "\ntest:\n\tpytest\n")
+    lines = LINES.replace("LINE_0 = 0", "LINE_0 = 'template'")
+    template_file(template_repo, "lines.py").write_text(lines)
+    conflict = LINES.replace("= 2", "= 'template'")
+    template_file(template_repo, "conflict.py").write_text(conflict)
+    template_file(template_repo, "new.txt").write_text("{{ cookiecutter.author }}")
+    template_file(template_repo, "removed.txt").unlink()
+    git_commit_all(template_repo, "change")
+
+    # and the project is updated,
+    generate(template_repo, update=True)
+
+    # then files that were not modified are replaced,
+    assert "pytest" in (proj / "Makefile").read_text()
+    assert (proj / "new.txt").read_text() == State.load(proj).context["author"]
+    assert not (proj / "removed.txt").exists()
+
+    # files modified in both sides are merged,
+    lines = (proj / "lines.py").read_text()
+    assert "LINE_0 = 'template'" in lines and "LINE_5 = 'mine'" in lines
+    conflict = (proj / "conflict.py").read_text()
+    assert "<<<<<<< project" in conflict and ">>>>>>> template" in conflict
+
+    # and the new state is recorded
+    state = State.load(proj)
+    assert state.commit != commit
+    assert "new.txt" in state.files and "removed.txt" not in state.files
+
+
+def test_update_without_changes(tmpfolder, template_repo):
+    generate(template_repo)
+    (Path("proj") / "lines.py").write_text("mine")
+    generate(template_repo, update=True)
+    assert (Path("proj") / "lines.py").read_text() == "mine"
+
+
+def test_only_changed_files_are_rendered(tmpfolder, template_repo, monkeypatch):
+    (template_repo / "hooks").mkdir()
+    hook = "open('hook.txt', 'a').write('run')\n"
+    (template_repo / "hooks/post_gen_project.py").write_text(hook)
+    git_commit_all(template_repo, "hook")
+    generate(template_repo)
+    assert Path("proj/hook.txt").read_text() == "run"
+
+    template_file(template_repo, "Makefile").write_text("changed")
+    template_file(template_repo, "removed.txt").unlink()
+    git_commit_all(template_repo, "change")
+
+    rendered = []
+    render_file = Template.render_file
+
+    def _render_file(self, relpath, *args, **kwargs):
+        rendered.append(relpath)
+        return render_file(self, relpath, *args, **kwargs)
+
+    monkeypatch.setattr(Template, "render_file", _render_file)
+    generate(template_repo, update=True)
+    assert Path("proj/Makefile").read_text() == "changed"
+    assert not Path("proj/removed.txt").exists()
+    # Only the changed files are rendered (also for the previous version)
+    assert set(rendered) == {"Makefile", "removed.txt"}
+    # and the hooks do not run again
+    assert Path("proj/hook.txt").read_text() == "run"
+    assert "lines.py" in State.load(Path("proj")).files
+
+
+def test_update_without_base(tmpfolder, tmp_path, isolated_log):
+    # Local templates that are not git repositories have no previous version
+    template = create_template(tmp_path / "local", FILES)
+    generate(template)
+    Path("proj/lines.py").write_text("mine")
+    template_file(template, "lines.py").write_text("changed")
+    generate(template, update=True)
+    assert Path("proj/lines.py").read_text() == "mine"
+    assert Path("proj/lines.py.new").read_text() == "changed"
+    assert "lines.py.new" in isolated_log.text
+
+
+def test_update_with_new_params(tmpfolder, template_repo):
+    template_file(template_repo, "author.txt").write_text("{{ cookiecutter.author }}")
+    git_commit_all(template_repo, "author")
+    generate(template_repo, cookiecutter_params={"author": "Old"})
+    assert Path("proj/author.txt").read_text() == "Old"
+
+    generate(template_repo, update=True, cookiecutter_params={"author": "New"})
+    assert Path("proj/author.txt").read_text() == "New"
+    assert State.load(Path("proj")).context["author"] == "New"
+
+
+def test_update_with_unknown_params(tmpfolder, template_repo):
+    generate(template_repo)
+    with pytest.raises(UnknownParameters):
+        generate(template_repo, update=True, cookiecutter_params={"autor": "x"})
+
+
+def test_changed_sources(tmp_path, template_repo, git_server):
+    template = Template(template_repo)
+    old = template.commit
+    assert changed_sources(template, old) == set()
+    assert changed_sources(template, None) is None
+
+    template_file(template_repo, "lines.py").write_text("changed")
+    git_commit_all(template_repo, "change")
+    assert changed_sources(template, old) == {"lines.py"}
+
+    # The old commit is fetched in shallow clones
+    url = git_server.publish(template_repo)
+    clone = Template.fetch(url, cache=TemplateCache(tmp_path / "cache"))
+    assert changed_sources(clone, old) == {"lines.py"}
+
+    # Changes outside the folder with the files cannot be handled
+    (template_repo / "cookiecutter.json").write_text('{"project_name": "x"}')
+    git_commit_all(template_repo, "context")
+    assert changed_sources(template, old) is None
+
+
+def test_pretend_update(tmpfolder, template_repo):
+    generate(template_repo)
+    template_file(template_repo, "Makefile").write_text("changed")
+    git_commit_all(template_repo, "change")
+    state = Path("proj", STATE_FILE).read_text()
+    generate(template_repo, update=True, pretend=True)
+    assert Path("proj", "Makefile").read_text() != "changed"
+    assert Path("proj", STATE_FILE).read_text() == state
+
+
+def test_update_without_state(tmpfolder, template_repo, isolated_log):
+    isolated_log.set_level(logging.WARNING)
+    create_project(project_path="proj", config_files=NO_CONFIG)
+    generate(template_repo, update=True)
+    assert UPDATE_WARNING in isolated_log.text
+    assert not Path("proj", "Makefile").exists()
+
+
+def test_struct_paths():
+    struct = {"a": "", "b": {"c": ("", None), "d": {"e": None}}}
+    assert struct_paths(struct) == {"a", "b/c", "b/d/e"}